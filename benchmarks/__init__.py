@@ -0,0 +1,3 @@
+# this package contains scripts to measure performance of the project
+# data processing and prediction code, to be run from the repository root
+# e.g. python -m benchmarks.panel_indicators
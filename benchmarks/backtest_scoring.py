@@ -0,0 +1,78 @@
+######################################################################
+# Measures backtest scoring throughput as the panel grows, comparing #
+# a per series loop, batched NumPy scoring and a process pool.       #
+######################################################################
+import argparse
+import os
+import time
+
+import numpy as np
+
+from utils.evaluation import coverage, evaluate, mape, rmse, weighted_quantile_loss
+
+QUANTILES = ("0.1", "0.5", "0.9")
+
+
+def synthetic_backtest(num_of_tickers, num_of_origins, horizon, seed=0):
+    """
+    Builds random realized values, quantile forecasts and benchmark predictions
+    :return: actual and benchmark arrays shaped (tickers, origins, horizon),
+    and a quantiles array shaped (tickers, origins, quantiles, horizon)
+    """
+    rng = np.random.default_rng(seed)
+    actual = 100 + np.cumsum(rng.normal(0, 1, (num_of_tickers, num_of_origins, horizon)), axis=-1)
+    spread = np.array([-5., 0., 5.])[:, None]
+    quantile_values = actual[:, :, None, :] + spread + rng.normal(0, 2, (num_of_tickers, num_of_origins, 3, horizon))
+    benchmark = actual + rng.normal(0, 3, actual.shape)
+    return actual, quantile_values, benchmark
+
+
+def per_series_loop(actual, quantile_values, benchmark):
+    for a, q, b in zip(actual, quantile_values, benchmark):
+        for origin in range(a.shape[0]):
+            mape(a[origin], q[origin, 1]), rmse(a[origin], q[origin, 1])
+            weighted_quantile_loss(a[origin], q[origin], QUANTILES)
+            coverage(a[origin], q[origin, 0], q[origin, 2])
+            mape(a[origin], b[origin]), rmse(a[origin], b[origin])
+
+
+def batched(actual, quantile_values, benchmark):
+    evaluate(actual, quantile_values, benchmark=benchmark, max_workers=1)
+
+
+def process_pool(actual, quantile_values, benchmark):
+    evaluate(actual, quantile_values, benchmark=benchmark, max_workers=max(2, os.cpu_count() or 1),
+             parallel_min_values=0)
+
+
+def best_time(fn, *args, repeat=3):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(*args)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--origins', type=int, default=100)
+    parser.add_argument('--horizon', type=int, default=20)
+    parser.add_argument('--tickers', type=int, nargs='+', default=[10, 100, 1000, 5000])
+    parser.add_argument('--loop-max-tickers', type=int, default=100,
+                        help='largest panel to be scored one series and one origin at a time')
+    args = parser.parse_args()
+
+    print("%8s %14s %14s %14s   (million predicted values per second)" % ('tickers', 'loop', 'batched', 'pool'))
+    for num_of_tickers in args.tickers:
+        data = synthetic_backtest(num_of_tickers, args.origins, args.horizon)
+        values = float(data[0].size) / 1e6
+        loop_rate = values / best_time(per_series_loop, *data) if num_of_tickers <= args.loop_max_tickers \
+            else float('nan')
+        batched_rate = values / best_time(batched, *data)
+        pool_rate = values / best_time(process_pool, *data)
+        print("%8d %14.2f %14.2f %14.2f" % (num_of_tickers, loop_rate, batched_rate, pool_rate))
+
+
+if __name__ == '__main__':
+    main()
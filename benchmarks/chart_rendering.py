@@ -0,0 +1,50 @@
+######################################################################
+# Measures display_quantiles_flask throughput (renders per second)   #
+# and response size for each chart format, with distinct charts      #
+# (cache misses) and with repeated charts (cache hits).              #
+######################################################################
+import argparse
+import json
+import time
+
+import numpy as np
+
+from source_deepar import display_quantiles as dq
+
+
+def sample_charts(count, length=20, seed=0):
+    rng = np.random.default_rng(seed)
+    charts = []
+    for _ in range(count):
+        median = 100 + np.cumsum(rng.normal(0, 1, length))
+        prediction = {'0.1': (median - 5).tolist(), '0.5': median.tolist(), '0.9': (median + 5).tolist()}
+        charts.append(dict(prediction=prediction, target_ts=(median + rng.normal(0, 2, length)).tolist(),
+                           bench_mark_prediction=[median[0]] * length, bench_mark_prediction_name='SMA',
+                           start='2021-03-01 00:00:00'))
+    return charts
+
+
+def renders_per_second(charts, output):
+    start = time.perf_counter()
+    for chart in charts:
+        result = dq.display_quantiles_flask(output=output, **chart)
+    size = len(json.dumps(result) if isinstance(result, dict) else result)
+    return len(charts) / (time.perf_counter() - start), size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--charts', type=int, default=50, help='number of distinct charts')
+    args = parser.parse_args()
+    charts = sample_charts(args.charts)
+
+    print("%-6s %16s %16s %12s" % ('format', 'miss renders/s', 'hit renders/s', 'bytes'))
+    for output in dq.CHART_FORMATS:
+        dq._render_cache.clear()
+        misses, size = renders_per_second(charts, output)
+        hits, _ = renders_per_second(charts, output)
+        print("%-6s %16.1f %16.1f %12d" % (output, misses, hits, size))
+
+
+if __name__ == '__main__':
+    main()
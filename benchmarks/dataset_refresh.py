@@ -0,0 +1,70 @@
+######################################################################
+# Measures the time needed to add new bars to stock_deepar datasets, #
+# regenerating them from scratch or refreshing them incrementally.   #
+######################################################################
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from utils.data_prepare import train_test_valid_split
+from utils.dataset_refresh import JSON_DATASETS, csv_path, json_path, refresh_ticker
+from utils.technical_indicators import rolling_indicators_frame
+
+RAW_COLUMNS = ['Adj Close', 'Close', 'High', 'Low', 'Open', 'Volume', 'Dividends', 'Stock Splits']
+
+
+def synthetic_bars(size, start='1990-01-02', seed=0):
+    rng = np.random.default_rng(seed)
+    prices = 50 + np.abs(np.cumsum(rng.normal(0, 1, size)))
+    bars = pd.DataFrame({c: prices for c in RAW_COLUMNS[:5]}, index=pd.date_range(start, periods=size, freq='B',
+                                                                                  name='Date'))
+    bars['Volume'] = rng.integers(1000000, 2000000, size)
+    bars['Dividends'], bars['Stock Splits'] = 0., 0.
+    return bars
+
+
+def full_regeneration(bars, csv_dir, json_dir, ticker, prediction_length):
+    df = bars.join(rolling_indicators_frame(bars['Adj Close']))
+    for dataset, ts in zip(JSON_DATASETS, train_test_valid_split(df, prediction_length)):
+        ts.to_csv(csv_path(csv_dir, ticker, dataset), header=True, index=True)
+        with open(json_path(json_dir, ticker, dataset), 'w') as fp:
+            json.dump({"start": str(ts.index[0]), "target": list(ts['Adj Close'])}, fp)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--history', type=int, nargs='+', default=[1000, 5000, 20000])
+    parser.add_argument('--new-bars', type=int, default=1)
+    parser.add_argument('--prediction-length', type=int, default=20)
+    args = parser.parse_args()
+
+    print("%8s %14s %14s   (ms per update of %d bars)" % ('history', 'regeneration', 'incremental', args.new_bars))
+    for history in args.history:
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            csv_dir, json_dir = os.path.join(tmp_dir, 'csv'), os.path.join(tmp_dir, 'json')
+            os.makedirs(csv_dir)
+            for dataset in JSON_DATASETS.values():
+                os.makedirs(os.path.join(json_dir, dataset))
+            bars = synthetic_bars(history + args.new_bars)
+            full_regeneration(bars.iloc[:history], csv_dir, json_dir, 'IBM', args.prediction_length)
+
+            start = time.perf_counter()
+            refresh_ticker(csv_dir, 'IBM', bars.iloc[history:], args.prediction_length, json_dir=json_dir)
+            incremental = time.perf_counter() - start
+            start = time.perf_counter()
+            full_regeneration(bars, csv_dir, json_dir, 'IBM', args.prediction_length)
+            regeneration = time.perf_counter() - start
+            print("%8d %14.1f %14.1f" % (history, regeneration * 1000, incremental * 1000))
+        finally:
+            shutil.rmtree(tmp_dir)
+
+
+if __name__ == '__main__':
+    main()
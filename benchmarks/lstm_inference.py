@@ -0,0 +1,72 @@
+######################################################################
+# Measures LSTM_Predictor CPU inference latency and throughput across #
+# batch sizes and thread counts, comparing eager one-window-at-a-time #
+# inference with exported float32 and int8 quantized models.         #
+######################################################################
+import argparse
+import time
+
+import numpy as np
+import torch
+
+from source_pytorch.inference import BatchPredictor, export_model
+from source_pytorch.model import LSTM_Predictor
+
+
+def synthetic_windows(num_of_windows, window_size, features, seed=0):
+    rng = np.random.default_rng(seed)
+    return 100 + np.cumsum(rng.normal(0, 1, (num_of_windows, window_size, features)), axis=1)
+
+
+def eager_one_by_one(model, windows):
+    with torch.no_grad():
+        for window in windows:
+            x = torch.from_numpy(window.astype(np.float32) / window[-1].astype(np.float32))
+            model(x[None])
+
+
+def best_time(fn, *args, repeat=3):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(*args)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--window-size', type=int, default=60)
+    parser.add_argument('--features', type=int, default=11)
+    parser.add_argument('--hidden-dim', type=int, default=64)
+    parser.add_argument('--layers', type=int, default=2)
+    parser.add_argument('--prediction-length', type=int, default=20)
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 16, 128, 1024])
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, torch.get_num_threads()])
+    parser.add_argument('--eager-windows', type=int, default=128,
+                        help='number of windows predicted one at a time by the eager model')
+    args = parser.parse_args()
+
+    torch.manual_seed(0)
+    model = LSTM_Predictor(args.features, args.hidden_dim, args.layers, 0.2, args.prediction_length).eval()
+    modules = {'float32': export_model(model, args.window_size, args.features),
+               'int8': export_model(model, args.window_size, args.features, quantize=True)}
+
+    print("%8s %8s %10s %14s %14s   (latency in ms per batch, throughput in windows per second)" %
+          ('threads', 'batch', 'model', 'latency', 'throughput'))
+    for threads in sorted(set(args.threads)):
+        torch.set_num_threads(threads)
+        windows = synthetic_windows(args.eager_windows, args.window_size, args.features)
+        elapsed = best_time(eager_one_by_one, model, windows)
+        print("%8d %8d %10s %14.3f %14.0f" % (threads, 1, 'eager', 1e3 * elapsed / len(windows),
+                                              len(windows) / elapsed))
+        for batch_size in args.batch_sizes:
+            windows = synthetic_windows(batch_size, args.window_size, args.features)
+            for name, module in modules.items():
+                predictor = BatchPredictor(module, args.window_size, args.prediction_length, batch_size=batch_size)
+                elapsed = best_time(predictor.predict_array, windows)
+                print("%8d %8d %10s %14.3f %14.0f" % (threads, batch_size, name, 1e3 * elapsed, batch_size / elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+######################################################################
+# Measures technical indicators computation throughput as the number #
+# of tickers grows, comparing single series and panel functions.     #
+######################################################################
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from utils.technical_indicators import bollinger_bands, rolling_indicators, panel_rolling_indicators
+
+WINDOWS = (10, 20, 50)
+
+
+def synthetic_panel(num_of_tickers, num_of_bars, seed=0):
+    """
+    Builds a random walk price panel with ragged start dates and a few missing values
+    :param num_of_tickers: number of panel columns
+    :param num_of_bars: number of panel rows
+    :param seed: random generator seed
+    :return: a date x ticker dataframe
+    """
+    rng = np.random.default_rng(seed)
+    prices = 100 + np.cumsum(rng.normal(0, 1, (num_of_bars, num_of_tickers)), axis=0)
+    starts = rng.integers(0, num_of_bars // 4, num_of_tickers)
+    prices[np.arange(num_of_bars)[:, np.newaxis] < starts] = np.nan
+    prices[rng.random(prices.shape) < 1e-3] = np.nan
+    return pd.DataFrame(prices, index=pd.date_range('2004-08-19', periods=num_of_bars, freq='B'),
+                        columns=["T%04d" % i for i in range(num_of_tickers)])
+
+
+def per_series_pandas(panel):
+    for ticker in panel:
+        ts = panel[ticker].loc[panel[ticker].first_valid_index():]
+        for w in WINDOWS:
+            bollinger_bands(ts, window_size=w)
+
+
+def per_series_fused(panel):
+    for ticker in panel:
+        ts = panel[ticker].loc[panel[ticker].first_valid_index():]
+        rolling_indicators(ts.values, WINDOWS)
+
+
+def panel_fused(panel):
+    panel_rolling_indicators(panel.values, WINDOWS)
+
+
+def best_time(fn, *args, repeat=3):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(*args)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--bars', type=int, default=4200)
+    parser.add_argument('--tickers', type=int, nargs='+', default=[1, 10, 100, 500, 1000])
+    parser.add_argument('--pandas-max-tickers', type=int, default=100,
+                        help='largest panel to be processed with the pandas single series functions')
+    args = parser.parse_args()
+
+    print("%8s %14s %14s %14s   (million bars per second, %d windows)" % ('tickers', 'pandas', 'fused', 'panel',
+                                                                         len(WINDOWS)))
+    for num_of_tickers in args.tickers:
+        panel = synthetic_panel(num_of_tickers, args.bars)
+        bars = float(panel.size) / 1e6
+        pandas_rate = bars / best_time(per_series_pandas, panel) if num_of_tickers <= args.pandas_max_tickers \
+            else float('nan')
+        fused_rate = bars / best_time(per_series_fused, panel)
+        panel_rate = bars / best_time(panel_fused, panel)
+        print("%8d %14.2f %14.2f %14.2f" % (num_of_tickers, pandas_rate, fused_rate, panel_rate))
+
+
+if __name__ == '__main__':
+    main()
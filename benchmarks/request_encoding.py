@@ -0,0 +1,55 @@
+######################################################################
+# Compares DeepAR endpoint request encodings: size in bytes, gzip    #
+# compressed size and serialization time per request, for the        #
+# legacy json.dumps encoding and the source_deepar.encoding modes.   #
+######################################################################
+import argparse
+import gzip
+import json
+import os
+import statistics
+import time
+
+from source_deepar import encoding
+from source_deepar.lambda_stock_prediction import CONFIGURATION, CONTEXT_POINTS, truncate_context
+
+from benchmarks.request_payload import load_instances
+
+MODES = {
+    'json.dumps': lambda instance: json.dumps({"instances": [instance], "configuration": CONFIGURATION}).encode(),
+    'compact': lambda instance: encoding.encode_request([encoding.encode_instance(instance)], CONFIGURATION),
+    'decimals=2': lambda instance: encoding.encode_request([encoding.encode_instance(instance, decimals=2)],
+                                                           CONFIGURATION),
+    'float32': lambda instance: encoding.encode_request([encoding.encode_instance(instance, float32=True)],
+                                                        CONFIGURATION),
+}
+
+
+def timed(fn, *args, repeat=20):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(*args)
+        times.append(time.perf_counter() - start)
+    return result, statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--json-dir', default=os.path.join('stock_deepar', 'json', 'train'))
+    parser.add_argument('--context-points', type=int, default=CONTEXT_POINTS,
+                        help='context window, 0 sends whole time series')
+    args = parser.parse_args()
+
+    print("json serializer: %s" % ('orjson' if encoding.orjson is not None else 'json'))
+    print("%-8s %-12s %10s %10s %12s" % ('ticker', 'encoding', 'bytes', 'gzip', 'encode ms'))
+    for ticker, instance in load_instances(args.json_dir).items():
+        instance = truncate_context(instance, args.context_points)
+        for mode, encode in MODES.items():
+            body, encode_time = timed(encode, instance)
+            print("%-8s %-12s %10d %10d %12.3f" % (ticker, mode, len(body), len(gzip.compress(body)),
+                                                   encode_time * 1e3))
+
+
+if __name__ == '__main__':
+    main()
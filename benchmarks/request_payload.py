@@ -0,0 +1,71 @@
+######################################################################
+# Measures DeepAR endpoint request payload size and encoding time,   #
+# and optionally end-to-end endpoint latency, for whole time series  #
+# and for truncated context windows.                                 #
+######################################################################
+import argparse
+import json
+import os
+import statistics
+import time
+
+from source_deepar.lambda_stock_prediction import CONTEXT_POINTS, pack_requests, truncate_context
+
+
+def load_instances(json_dir):
+    """
+    Loads DeepAR json files of a stock_deepar dataset folder
+    :param json_dir: folder containing one json file per ticker
+    :return: a dictionary of instances keyed by ticker name
+    """
+    instances = {}
+    for file_name in sorted(os.listdir(json_dir)):
+        if file_name.endswith('.json'):
+            with open(os.path.join(json_dir, file_name)) as fp:
+                instances[file_name[:-len('.json')]] = json.load(fp)
+    return instances
+
+
+def encode(instance, context_points):
+    return pack_requests([truncate_context(instance, context_points)])[0]
+
+
+def timed(fn, *args, repeat=20):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(*args)
+        times.append(time.perf_counter() - start)
+    return result, statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--json-dir', default=os.path.join('stock_deepar', 'json', 'train'))
+    parser.add_argument('--context-points', type=int, nargs='+', default=[0, CONTEXT_POINTS],
+                        help='context windows to be compared, 0 sends whole time series')
+    parser.add_argument('--endpoint', help='endpoint name, to measure end-to-end latency too')
+    parser.add_argument('--calls', type=int, default=10, help='endpoint invocations per measure')
+    args = parser.parse_args()
+
+    runtime = None
+    if args.endpoint:
+        import boto3
+        runtime = boto3.Session().client('sagemaker-runtime')
+
+    print("%-8s %8s %12s %12s %14s" % ('ticker', 'context', 'bytes', 'encode ms', 'endpoint ms'))
+    for ticker, instance in load_instances(args.json_dir).items():
+        for context_points in args.context_points:
+            body, encode_time = timed(encode, instance, context_points)
+            latency = float('nan')
+            if runtime is not None:
+                def invoke():
+                    runtime.invoke_endpoint(EndpointName=args.endpoint, ContentType='application/json',
+                                            Body=encode(instance, context_points))['Body'].read()
+                _, latency = timed(invoke, repeat=args.calls)
+            print("%-8s %8s %12d %12.3f %14.1f" % (ticker, context_points or 'all', len(body), encode_time * 1e3,
+                                                  latency * 1e3))
+
+
+if __name__ == '__main__':
+    main()
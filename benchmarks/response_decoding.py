@@ -0,0 +1,65 @@
+######################################################################
+# Compares decoding DeepAR endpoint responses into one dataframe per #
+# time series with decoding them into a single ForecastBatch array.  #
+######################################################################
+import argparse
+import json
+import statistics
+import time
+
+import numpy as np
+import pandas as pd
+
+from source_deepar.deepar_utils import ForecastBatch
+
+
+def fake_response(series, horizon, quantiles, seed=0):
+    rng = np.random.default_rng(seed)
+    predictions = [{"quantiles": {q: rng.normal(100, 5, horizon).tolist() for q in quantiles}}
+                   for _ in range(series)]
+    return json.dumps({"predictions": predictions}).encode('utf-8')
+
+
+def decode_frames(response, prediction_times, horizon):
+    # per series decoding, as DeepARPredictor used to do
+    predictions = json.loads(response.decode('utf-8'))["predictions"]
+    return [pd.DataFrame(data=predictions[k]["quantiles"],
+                         index=pd.date_range(start=prediction_times[k], freq='D', periods=horizon))
+            for k in range(len(prediction_times))]
+
+
+def decode_batch(response, prediction_times):
+    return ForecastBatch.from_predictions(json.loads(response.decode('utf-8'))["predictions"], prediction_times)
+
+
+def timed(fn, *args, repeat=5):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(*args)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--series', type=int, nargs='+', default=[10, 100, 1000])
+    parser.add_argument('--horizon', type=int, default=20)
+    args = parser.parse_args()
+    quantiles = ["0.1", "0.5", "0.9"]
+
+    print("%8s %12s %12s %14s %14s" % ('series', 'json ms', 'frames ms', 'batch ms', 'to_frame ms'))
+    for series in args.series:
+        response = fake_response(series, args.horizon, quantiles)
+        prediction_times = pd.date_range('2021-03-22', periods=series, freq='D')
+        batch = decode_batch(response, prediction_times)
+        print("%8d %12.2f %12.2f %14.2f %14.2f" % (
+            series,
+            timed(json.loads, response) * 1e3,
+            timed(decode_frames, response, prediction_times, args.horizon) * 1e3,
+            timed(decode_batch, response, prediction_times) * 1e3,
+            timed(batch.to_frame) * 1e3))
+
+
+if __name__ == '__main__':
+    main()
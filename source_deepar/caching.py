@@ -0,0 +1,348 @@
+r"""
+Caching utilities shared by the prediction Lambda function, the web application and the DeepAR predictor.
+This module only depends on the Python standard library, so that it can be packaged with the Lambda function.
+"""
+from array import array
+from collections import OrderedDict
+import base64
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+
+class LRUCache(object):
+    """
+    A thread safe, size bounded, Least Recently Used cache, whose entries optionally expire
+    """
+
+    def __init__(self, maxsize=128, ttl=None):
+        """
+        :param maxsize: maximum number of entries kept in the cache
+        :param ttl: number of seconds entries are valid for after being stored, forever if None
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """
+        Retrieves a cached value, marking it as the most recently used one
+        :param key: entry key
+        :param default: value returned if key is not cached
+        :return: the cached value or default
+        """
+        with self._lock:
+            try:
+                value, expires_at = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            if expires_at is not None and time.monotonic() >= expires_at:
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        """
+        Stores a value, evicting the least recently used entry if the cache is full
+        :param key: entry key
+        :param value: value to be cached
+        """
+        expires_at = None if self.ttl is None else time.monotonic() + self.ttl
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                return default
+            return self._data.pop(key)[0]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __contains__(self, key):
+        with self._lock:
+            if key not in self._data:
+                return False
+            expires_at = self._data[key][1]
+            return expires_at is None or time.monotonic() < expires_at
+
+    def __len__(self):
+        return len(self._data)
+
+
+def request_fingerprint(endpoint_name, configuration, instance):
+    """
+    Identifies the prediction of a single instance: two requests with the same fingerprint
+    are answered with the same prediction, unless the model behind the endpoint changes
+    :param endpoint_name: name of the SageMaker endpoint
+    :param configuration: endpoint configuration dictionary (number of samples, output types, quantiles)
+    :param instance: json encoded instance, as bytes
+    :return: a hexadecimal SHA-256 digest
+    """
+    digest = hashlib.sha256(endpoint_name.encode('utf-8'))
+    digest.update(b'\0' + json.dumps(configuration, sort_keys=True).encode('utf-8') + b'\0')
+    digest.update(instance)
+    return digest.hexdigest()
+
+
+def pack_samples(prediction):
+    """
+    Converts the sample paths of a prediction, if any, into float32 arrays, the precision DeepAR predicts with:
+    4 bytes per value instead of a Python float and a list slot
+    :param prediction: a prediction dictionary, as found in endpoint responses "predictions"
+    :return: a new prediction dictionary whose "samples" are a list of array('f') paths,
+    or the input one if it has no sample paths or they are packed already
+    """
+    samples = prediction.get("samples")
+    if not samples or isinstance(samples[0], array):
+        return prediction
+    return dict(prediction, samples=[array('f', path) for path in samples])
+
+
+class PredictionCache(object):
+    """
+    A size bounded cache of endpoint predictions, keyed by request fingerprint.
+    Predictions are kept in memory and, optionally, in a directory as json files, so that they survive
+    the process and can be shared by several processes. Both tiers expire entries after ttl seconds:
+    expired files are deleted when read, and the oldest files are deleted once the directory holds more
+    than disk_maxsize predictions.
+    Sample paths are stored as float32 values, in memory as arrays and on disk as base64 encoded bytes.
+    """
+
+    def __init__(self, maxsize=256, ttl=3600, cache_dir=None, disk_maxsize=4096):
+        """
+        :param maxsize: maximum number of predictions kept in memory
+        :param ttl: number of seconds a prediction is served for, forever if None
+        :param cache_dir: directory of the on-disk tier, memory only if None
+        :param disk_maxsize: maximum number of predictions kept in the on-disk tier
+        """
+        self.ttl = ttl
+        self.cache_dir = cache_dir
+        self.disk_maxsize = disk_maxsize
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._memory = LRUCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def get(self, key):
+        """
+        Retrieves a cached prediction, looking into memory first and into the on-disk tier then
+        :param key: request fingerprint
+        :return: the prediction dictionary, or None if not cached or expired.
+        Returned dictionaries are shared by all the callers and must not be modified.
+        """
+        prediction = self._memory.get(key)
+        if prediction is None and self.cache_dir is not None:
+            prediction = self._read(key)
+            if prediction is not None:
+                self._memory.put(key, prediction)
+                with self._lock:
+                    self.disk_hits += 1
+        with self._lock:
+            if prediction is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return prediction
+
+    def put(self, key, prediction):
+        """
+        Stores a prediction in memory and in the on-disk tier, if any
+        :param key: request fingerprint
+        :param prediction: json serializable prediction dictionary
+        :return: the stored prediction, whose sample paths are packed by `pack_samples`, to be used in place
+        of the input one so that cached and fresh predictions are the same
+        """
+        prediction = pack_samples(prediction)
+        self._memory.put(key, prediction)
+        if self.cache_dir is not None:
+            self._write(key, prediction)
+            self._prune()
+        return prediction
+
+    def clear(self):
+        """
+        Empties the in-memory tier and resets counters, files of the on-disk tier are kept
+        """
+        self._memory.clear()
+        with self._lock:
+            self.hits = self.disk_hits = self.misses = 0
+
+    def stats(self):
+        """
+        :return: a dictionary with hits (disk ones included), disk_hits, misses and hit_ratio
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {'hits': self.hits, 'disk_hits': self.disk_hits, 'misses': self.misses,
+                    'hit_ratio': self.hits / total if total else 0.0}
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + '.json')
+
+    def _read(self, key):
+        path = self._path(key)
+        try:
+            if self.ttl is not None and time.time() - os.path.getmtime(path) >= self.ttl:
+                os.remove(path)
+                return None
+            with open(path) as fp:
+                prediction = json.load(fp)
+        except (OSError, ValueError):
+            return None
+        if "samples_float32" in prediction:
+            values = array('f', base64.b64decode(prediction.pop("samples_float32")))
+            if sys.byteorder == 'big':
+                values.byteswap()
+            length = prediction.pop("sample_length")
+            prediction["samples"] = [values[k:k + length] for k in range(0, len(values), length)]
+        return prediction
+
+    def _write(self, key, prediction):
+        samples = prediction.get("samples")
+        if samples:
+            # sample paths are written as little endian float32 bytes
+            values = array('f')
+            for path in samples:
+                values.extend(path)
+            if sys.byteorder == 'big':
+                values.byteswap()
+            prediction = {k: v for k, v in prediction.items() if k != "samples"}
+            prediction.update(samples_float32=base64.b64encode(values.tobytes()).decode('ascii'),
+                              sample_length=len(samples[0]))
+        # files are replaced atomically, so that concurrent readers never see a partial prediction
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as fp:
+                json.dump(prediction, fp)
+            os.replace(tmp_path, self._path(key))
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _prune(self):
+        # the oldest files are removed beyond disk_maxsize, other processes may be removing them too
+        try:
+            names = [name for name in os.listdir(self.cache_dir) if name.endswith('.json')]
+        except OSError:
+            return
+        if len(names) <= self.disk_maxsize:
+            return
+        mtimes = {}
+        for name in names:
+            try:
+                mtimes[name] = os.path.getmtime(os.path.join(self.cache_dir, name))
+            except OSError:
+                pass
+        for name in sorted(mtimes, key=mtimes.get)[:len(mtimes) - self.disk_maxsize]:
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except OSError:
+                pass
+
+
+class _Flight(object):
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+    """
+    Coalesces concurrent calls asking for the same keys: the first caller computes the result of a key
+    and the callers arriving while it is in flight wait for it and share it, instead of computing it again.
+    Nothing is kept once a call completes, caching results is up to the caller.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.executions = 0
+        self.coalesced = 0
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn, *args, **kwargs):
+        """
+        Calls fn, unless a call for the same key is already in flight, whose result is returned instead
+        :param key: hashable key identifying the result
+        :param fn: function computing the result
+        :return: fn result, or the one of the call in flight; its exception is raised if it failed
+        """
+        return self.do_many([key], lambda keys: [fn(*args, **kwargs)])[0]
+
+    def do_many(self, keys, fn):
+        """
+        Computes the results of several keys at once, waiting for the ones already in flight
+        and computing the others (duplicates included only once) with a single call to fn
+        :param keys: list of hashable keys
+        :param fn: function taking the list of keys to be computed and returning their results, in the same order
+        :return: the list of results, in keys order
+        """
+        leading, flights = [], {}
+        with self._lock:
+            for key in keys:
+                self.calls += 1
+                if key in flights:
+                    self.coalesced += 1
+                    continue
+                flight = self._flights.get(key)
+                if flight is None:
+                    flight = self._flights[key] = _Flight()
+                    leading.append(key)
+                    self.executions += 1
+                else:
+                    self.coalesced += 1
+                flights[key] = flight
+
+        if leading:
+            try:
+                results = fn(leading)
+                for key, result in zip(leading, results):
+                    flights[key].result = result
+            except BaseException as error:
+                for key in leading:
+                    flights[key].error = error
+                raise
+            finally:
+                with self._lock:
+                    for key in leading:
+                        del self._flights[key]
+                for key in leading:
+                    flights[key].done.set()
+
+        for key in keys:
+            flight = flights[key]
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+        return [flights[key].result for key in keys]
+
+    def stats(self):
+        """
+        :return: a dictionary with the number of requested keys (calls), of computed ones (executions)
+        and of the ones whose result was shared by a call in flight (coalesced)
+        """
+        with self._lock:
+            return {'calls': self.calls, 'executions': self.executions, 'coalesced': self.coalesced}
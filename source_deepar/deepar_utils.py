@@ -6,16 +6,46 @@
 import io
 import os
 import json
+import random
+import time
+from collections.abc import Sequence
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 import pandas as pd
 import sagemaker
 
+from source_deepar import metrics
+from source_deepar.caching import request_fingerprint
+from source_deepar.encoding import chunk_bounds, encode_instance, request_parts, loads as loads_json
+from utils.feature_matrix import HOLD_LAST, feature_matrices, feature_matrix
+from utils.trading_calendar import get_trading_calendar
 
-def series_to_json_obj(ts, target_column=None, dyn_feat=None, start=None):
+# Number of most recent values of each time series sent to the endpoint by DeepARPredictor:
+# DeepAR conditions its predictions on the last context_length values plus lagged values
+# going back up to about one year, so older history only makes requests bigger.
+DEFAULT_CONTEXT_POINTS = 400
+
+# Limits used by DeepARPredictor.predict_bulk to split requests: SageMaker real-time endpoints
+# reject request bodies larger than 6 MB, and smaller requests can be served concurrently.
+MAX_PAYLOAD_BYTES = 5 * 1024 * 1024
+MAX_INSTANCES_PER_REQUEST = 100
+MAX_WORKERS = 4
+
+# Endpoint error codes meaning that the very same request can be retried after a while
+RETRYABLE_ERROR_CODES = ('ThrottlingException', 'TooManyRequestsException',
+                         'ServiceUnavailable', 'ModelNotReadyException')
+
+
+def series_to_json_obj(ts, target_column=None, dyn_feat=None, start=None, prediction_length=0,
+                       horizon_policy=HOLD_LAST):
     """Returns a dictionary of values in DeepAR, JSON format.
        :param dyn_feat: array of dynamic features
        :param ts: A time series dataframe containing stock prices data features.
        :param target_column: A single feature time series to be predicted.
        :param start: A datetime start value to be used as beginning of time series used as prediction context
+       :param prediction_length: number of predicted time steps dynamic features are extended with,
+       as DeepAR requires for prediction requests (0 for training data)
+       :param horizon_policy: dynamic features extension policy, one among utils.feature_matrix.HORIZON_POLICIES
        :return: A dictionary of values with "start", "target" and "dynamic_feat" keys if any
        """
     # get start time and target from the time series, ts
@@ -32,7 +62,7 @@ def series_to_json_obj(ts, target_column=None, dyn_feat=None, start=None):
                             "target": list(ts.values)}
         else:
             # populating dynamic features array
-            dyn_feat_list = generate_dyn_feat_list(dyn_feat, ts)
+            dyn_feat_list = generate_dyn_feat_list(dyn_feat, ts, prediction_length, horizon_policy, target_column)
 
             # creating json object    
             json_obj = {"start": str(pd.to_datetime(start_index)),
@@ -50,7 +80,7 @@ def series_to_json_obj(ts, target_column=None, dyn_feat=None, start=None):
 
         else:
             # populating dynamic features array
-            dyn_feat_list = generate_dyn_feat_list(dyn_feat, ts)
+            dyn_feat_list = generate_dyn_feat_list(dyn_feat, ts, prediction_length, horizon_policy, target_column)
 
             # creating json object
             json_obj = {"start": str(ts.index[0]), "target": list(ts.loc[:, target_column]),
@@ -59,20 +89,25 @@ def series_to_json_obj(ts, target_column=None, dyn_feat=None, start=None):
     return json_obj
 
 
-def generate_dyn_feat_list(dyn_feat, ts):
-    df_dyn_feat = ts.loc[:, dyn_feat]
-    dyn_feat_list = []
-    for feat in df_dyn_feat:
-        dyn_feat_list.append(list(df_dyn_feat[feat]))
-    return dyn_feat_list
+def generate_dyn_feat_list(dyn_feat, ts, prediction_length=0, horizon_policy=HOLD_LAST, target_column='Adj Close'):
+    """
+    :return: a list of dynamic features values lists, one per dyn_feat column, extended with prediction_length
+    values; values are kept in float64, so that json datasets hold the stored values as they are
+    """
+    return feature_matrix(ts, dyn_feat, prediction_length, horizon_policy, target_column=target_column,
+                          dtype=np.float64).tolist()
 
 
 # TODO check for start value usage
-def future_date_to_json_obj(start_date):
+def future_date_to_json_obj(start_date, calendar_name=None):
     """Returns a dictionary of values in DeepAR, JSON format.
        :param start_date: start date of the json to be produced
+       :param calendar_name: trading calendar name (e.g. "NYSE"), the start date being rolled forward
+       to the next trading day, None to keep it as it is
        :return: A json dictionary of values with "start" date and an empty "target" value list.
        """
+    if calendar_name is not None:
+        start_date = get_trading_calendar(calendar_name).offset(start_date, 0)
 
     json_obj = {
         "start": pd.to_datetime(start_date).strftime(format="%Y-%m-%d"),
@@ -97,14 +132,289 @@ def ts2dar_json(ts, saving_path, file_name, dyn_feat=[], start=None):
         json.dump(json_obj, fp)
 
 
+def context_tail(ts, context_points):
+    """
+    Keeps the most recent time points of a time series, so that the start of the
+    resulting time series moves forward accordingly
+    :param ts: a time series dataframe or pandas series
+    :param context_points: number of time points to be kept, all of them if 0 or None
+    :return: a view on the last context_points time points of ts
+    """
+    if not context_points or len(ts) <= context_points:
+        return ts
+    return ts.iloc[-context_points:]
+
+
+def write_dar_jsonl(series, file_path, target_column='Adj Close', dyn_feat=None, decimals=None, float32=False):
+    """
+    Streams time series into a single JSON Lines file ready to be processed by DeepAR, one series per line.
+    Lines are encoded by `encoding.encode_instance`, as endpoint requests are, and each one is written
+    as soon as it is ready, so memory usage is bounded by the longest series, whatever the number of series.
+    Missing values are written as "NaN", as DeepAR expects.
+    :param series: an iterable of dataframes, pandas series or dictionaries with "start", "target"
+    and, optionally, "dynamic_feat" keys whose values are arrays (dynamic features shaped features x time)
+    :param file_path: path of the JSON Lines file to be written
+    :param target_column: the column to be used as target for dataframes
+    :param dyn_feat: list of dataframes columns to be used as dynamic features
+    :param decimals: number of decimals values are rounded to, no rounding if None
+    :param float32: if True, values are converted to float32 and written with the shortest representation
+    that preserves float32 precision
+    :return: the number of series written
+    """
+    count = 0
+    with open(file_path, 'wb') as fp:
+        for ts in series:
+            start, target, dynamic_feat = _dar_arrays(ts, target_column, dyn_feat)
+            instance = {"start": start, "target": target}
+            if dynamic_feat is not None:
+                instance["dynamic_feat"] = dynamic_feat
+            fp.write(encode_instance(instance, decimals=decimals, float32=float32) + b'\n')
+            count += 1
+    return count
+
+
+def _dar_arrays(ts, target_column, dyn_feat):
+    """
+    Extracts start, target values and dynamic features values (or None) from a time series
+    """
+    if isinstance(ts, pd.DataFrame):
+        dynamic_feat = ts.loc[:, dyn_feat].to_numpy().T if dyn_feat else None
+        return str(ts.index[0]), ts.loc[:, target_column].to_numpy(), dynamic_feat
+    elif isinstance(ts, pd.Series):
+        return str(ts.index[0]), ts.to_numpy(), None
+    elif isinstance(ts, dict):
+        dynamic_feat = ts.get("dynamic_feat")
+        return str(ts["start"]), ts["target"], None if dynamic_feat is None else np.atleast_2d(dynamic_feat)
+    raise TypeError("unsupported time series type: %s" % type(ts).__name__)
+
+
+def _is_retryable(error):
+    """
+    Tells whether an endpoint invocation error (a botocore ClientError) is due to throttling
+    or temporary unavailability, so that the request can be retried
+    """
+    response = getattr(error, 'response', None) or {}
+    code = response.get('Error', {}).get('Code')
+    status = response.get('ResponseMetadata', {}).get('HTTPStatusCode')
+    return code in RETRYABLE_ERROR_CODES or status in (429, 503)
+
+
+class ForecastBatch(object):
+    """
+    Predictions of several time series, decoded at once into a single array shaped (series, quantiles, horizon).
+    Per series dataframes, the format returned by DeepARPredictor by default, are built on demand by `frames`.
+    """
+
+    def __init__(self, values, quantiles, prediction_times, freq='D', calendar=None):
+        """
+        :param values: array of predicted values shaped (series, quantiles, horizon)
+        :param quantiles: list of quantiles names, as strings
+        :param prediction_times: first predicted time of each time series
+        :param freq: time frequency of predictions
+        :param calendar: a utils.trading_calendar.TradingCalendar, predicted times being its sessions,
+        None for predicted times spaced by freq
+        """
+        self.values = values
+        self.quantiles = list(quantiles)
+        self.prediction_times = pd.DatetimeIndex(prediction_times)
+        self.freq = freq
+        self.calendar = calendar
+
+    @classmethod
+    def from_predictions(cls, predictions, prediction_times, freq='D', quantiles=None, calendar=None):
+        """
+        Decodes the predictions of a DeepAR endpoint response
+        :param predictions: list of dictionaries with a "quantiles" key, as found in responses "predictions"
+        :param prediction_times: first predicted time of each time series
+        :param freq: time frequency of predictions
+        :param quantiles: quantiles to be decoded, the ones of the first prediction if None
+        :param calendar: trading calendar of predicted times, None for predicted times spaced by freq
+        :return: a ForecastBatch
+        """
+        if quantiles is None:
+            quantiles = list(predictions[0]["quantiles"]) if predictions else []
+        if not predictions:
+            return cls(np.empty((0, len(quantiles), 0)), quantiles, prediction_times, freq, calendar)
+        values = np.array([[prediction["quantiles"][q] for q in quantiles] for prediction in predictions],
+                          dtype=np.float64)
+        return cls(values, quantiles, prediction_times, freq, calendar)
+
+    def __len__(self):
+        return self.values.shape[0]
+
+    @property
+    def horizon(self):
+        return self.values.shape[2]
+
+    def quantile(self, q):
+        """
+        :param q: quantile name, as requested to the endpoint (e.g. "0.5")
+        :return: a view on the values of a quantile, shaped (series, horizon)
+        """
+        return self.values[:, self.quantiles.index(str(q)), :]
+
+    def dates(self):
+        """
+        :return: an array of predicted times shaped (series, horizon)
+        """
+        if self.calendar is not None:
+            return self.calendar.next_sessions(self.prediction_times, self.horizon)
+        step = np.timedelta64(pd.Timedelta(1, unit=self.freq))
+        return self.prediction_times.values[:, None] + np.arange(self.horizon) * step
+
+    def index(self, k):
+        """
+        :param k: position of a time series
+        :return: the DatetimeIndex of the predictions of the k-th time series
+        """
+        if self.calendar is not None:
+            return self.calendar.next_sessions(self.prediction_times[k], self.horizon)
+        return pd.date_range(start=self.prediction_times[k], freq=self.freq, periods=self.horizon)
+
+    def to_frame(self, names=None):
+        """
+        Builds a single dataframe in long format, indexed by (series, date), with one column per quantile
+        :param names: time series names used as first index level, series positions if None
+        :return: a pandas.DataFrame
+        """
+        series, n_quantiles, horizon = self.values.shape
+        names = np.arange(series) if names is None else np.asarray(names)
+        index = pd.MultiIndex.from_arrays([np.repeat(names, horizon), self.dates().ravel()],
+                                          names=['series', 'date'])
+        data = self.values.transpose(0, 2, 1).reshape(series * horizon, n_quantiles)
+        return pd.DataFrame(data, index=index, columns=self.quantiles)
+
+    def frame(self, k):
+        """
+        :param k: position of a time series
+        :return: a pandas.DataFrame of the k-th time series predictions, with one column per quantile
+        """
+        return pd.DataFrame(self.values[k].T, index=self.index(k), columns=self.quantiles, copy=True)
+
+    @property
+    def frames(self):
+        """
+        A lazy sequence of per series dataframes, as returned by DeepARPredictor by default
+        """
+        return _ForecastFrames(self)
+
+
+class SampleForecast(object):
+    """
+    Sample paths of the predictions of several time series, stored as a float32 array shaped
+    (series, samples, horizon), from which any statistic is computed locally
+    """
+
+    def __init__(self, samples, prediction_times, freq='D', calendar=None):
+        """
+        :param samples: array of sample paths shaped (series, samples, horizon)
+        :param prediction_times: first predicted time of each time series
+        :param freq: time frequency of predictions
+        :param calendar: trading calendar of predicted times, None for predicted times spaced by freq
+        """
+        self.samples = np.asarray(samples, dtype=np.float32)
+        self.prediction_times = pd.DatetimeIndex(prediction_times)
+        self.freq = freq
+        self.calendar = calendar
+
+    @classmethod
+    def from_predictions(cls, predictions, prediction_times, freq='D', calendar=None):
+        """
+        Decodes the predictions of a DeepAR endpoint response requested with "samples" output type
+        :param predictions: list of dictionaries with a "samples" key, as found in responses "predictions"
+        :param prediction_times: first predicted time of each time series
+        :param freq: time frequency of predictions
+        :param calendar: trading calendar of predicted times, None for predicted times spaced by freq
+        :return: a SampleForecast
+        """
+        if not predictions:
+            return cls(np.empty((0, 0, 0)), prediction_times, freq, calendar)
+        return cls(np.array([prediction["samples"] for prediction in predictions], dtype=np.float32),
+                   prediction_times, freq, calendar)
+
+    def __len__(self):
+        return self.samples.shape[0]
+
+    @property
+    def horizon(self):
+        return self.samples.shape[2]
+
+    def quantiles(self, quantiles=("0.1", "0.5", "0.9")):
+        """
+        Computes quantiles of the samples at every predicted time
+        :param quantiles: quantiles, as strings or numbers
+        :return: a ForecastBatch, whose quantiles are named as strings
+        """
+        values = np.quantile(self.samples, [float(q) for q in quantiles], axis=1)
+        return ForecastBatch(values.transpose(1, 0, 2), [str(q) for q in quantiles], self.prediction_times,
+                             self.freq, self.calendar)
+
+    def mean(self):
+        """
+        :return: the mean of the samples at every predicted time, shaped (series, horizon)
+        """
+        return self.samples.mean(axis=1)
+
+    def exceedance(self, threshold):
+        """
+        Estimates the probability that predicted values are greater than a threshold
+        :param threshold: a single threshold, or one per time series
+        :return: an array of probabilities shaped (series, horizon)
+        """
+        threshold = np.asarray(threshold, dtype=np.float32)
+        if threshold.ndim == 1:
+            threshold = threshold[:, None, None]
+        return (self.samples > threshold).mean(axis=1)
+
+
+class _ForecastFrames(Sequence):
+    """
+    Read only sequence of a ForecastBatch per series dataframes, each one built when first accessed
+    and kept, so that changes made to a dataframe (e.g. to its index) persist as they would in a list
+    """
+
+    def __init__(self, batch):
+        self._batch = batch
+        self._frames = [None] * len(batch)
+
+    def __len__(self):
+        return len(self._frames)
+
+    def __getitem__(self, k):
+        if isinstance(k, slice):
+            return [self[i] for i in range(len(self._frames))[k]]
+        if k < 0:
+            k += len(self._frames)
+        if not 0 <= k < len(self._frames):
+            raise IndexError("forecast index out of range")
+        if self._frames[k] is None:
+            self._frames[k] = self._batch.frame(k)
+        return self._frames[k]
+
+
 # Class that allows making requests using pandas Series objects rather than raw JSON strings
 class DeepARPredictor(sagemaker.predictor.Predictor):
-    def __init__(self, endpoint_name, sagemaker_session):
+    def __init__(self, endpoint_name, sagemaker_session, prediction_cache=None):
+        """
+        :param endpoint_name: name of the SageMaker endpoint
+        :param sagemaker_session: SageMaker session used to invoke the endpoint
+        :param prediction_cache: a caching.PredictionCache serving repeated predictions
+        without invoking the endpoint, None to disable caching
+        """
         super().__init__(endpoint_name=endpoint_name, sagemaker_session=sagemaker_session)
         self.__freq = 'D'
         self.__prediction_length = 20
-
-    def set_prediction_parameters(self, freq, prediction_length):
+        self.__context_points = DEFAULT_CONTEXT_POINTS
+        self.__decimals = None
+        self.__float32 = True
+        self.__calendar = None
+        self.__dyn_feat = None
+        self.__horizon_policy = HOLD_LAST
+        self.prediction_cache = prediction_cache
+
+    def set_prediction_parameters(self, freq, prediction_length, context_points=DEFAULT_CONTEXT_POINTS,
+                                  decimals=None, float32=True, calendar_name=None, dyn_feat=None,
+                                  horizon_policy=HOLD_LAST):
         """
         Set the time frequency and prediction length parameters. This method **must** be called
         before being able to use `predict`, otherwise, default values of 'D' and `20` wil be used.
@@ -112,14 +422,33 @@ class DeepARPredictor(sagemaker.predictor.Predictor):
         Parameters:
         freq -- string indicating the time frequency
         prediction_length -- integer, number of predicted time points
+        context_points -- integer, number of most recent time points sent to the endpoint,
+        0 or None to send whole time series (default: DEFAULT_CONTEXT_POINTS)
+        decimals -- integer, number of decimals values sent to the endpoint are rounded to,
+        no rounding if None (default: None)
+        float32 -- boolean, whether values are sent with float32 precision, the one DeepAR works with,
+        using their shortest representation (default: True)
+        calendar_name -- string, trading calendar name (e.g. "NYSE"), predicted times being its trading days,
+        None for predicted times spaced by freq (default: None)
+        dyn_feat -- list of dynamic features columns the model has been trained with, extended across
+        the prediction horizon by `utils.feature_matrix.feature_matrices`, none if None (default: None)
+        horizon_policy -- string, dynamic features extension policy, one among
+        utils.feature_matrix.HORIZON_POLICIES (default: HOLD_LAST)
 
         Return value: none.
         """
         self.__freq = freq
         self.__prediction_length = prediction_length
-
+        self.__context_points = context_points
+        self.__decimals = decimals
+        self.__float32 = float32
+        self.__calendar = None if calendar_name is None else get_trading_calendar(calendar_name)
+        self.__dyn_feat = list(dyn_feat) if dyn_feat else None
+        self.__horizon_policy = horizon_policy
+
+    @metrics.timed('predictor.predict')
     def predict(self, ts, cat=None, encoding="utf-8", num_samples=100, quantiles=["0.1", "0.5", "0.9"],
-                content_type="application/json"):
+                content_type="application/json", as_batch=False):
         """Requests the prediction of for the time series listed in `ts`, each with the (optional)
         corresponding category listed in `cat`.
 
@@ -130,15 +459,16 @@ class DeepARPredictor(sagemaker.predictor.Predictor):
         encoding -- string, encoding to use for the request (default: "utf-8")
         num_samples -- integer, number of samples to compute at prediction time (default: 100)
         quantiles -- list of strings specifying the quantiles to compute (default: ["0.1", "0.5", "0.9"])
+        as_batch -- boolean, whether to return a single `ForecastBatch` (default: False)
 
-        Return value: list of `pandas.DataFrame` objects, each containing the predictions
+        Return value: sequence of `pandas.DataFrame` objects, each containing the predictions and built
+        when first accessed, or a `ForecastBatch` if as_batch is True
         """
-        if isinstance(ts, list):
-            prediction_times = [x.index[-1] + pd.Timedelta(1, unit=self.__freq) for x in ts]
-            req = self.__encode_request(ts, cat, encoding, num_samples, quantiles)
-        elif isinstance(ts, pd.DataFrame):
-            prediction_times = ts.index[-1] + pd.Timedelta(1, unit=self.__freq)
-            req = self.__encode_request(ts, cat, encoding, num_samples, quantiles)
+        if isinstance(ts, (list, pd.DataFrame)):
+            # a single request, with no retries
+            return self.predict_bulk(ts, cat, encoding, num_samples, quantiles, content_type,
+                                     max_payload_bytes=float('inf'), max_instances=None, max_workers=1, max_retries=0,
+                                     as_batch=as_batch)
         elif isinstance(ts, str):
             # TODO add code to process ts as an S3 path to a json file coded time series
             if ts.upper() == 'IBM':
@@ -161,68 +491,188 @@ class DeepARPredictor(sagemaker.predictor.Predictor):
             req = None
 
         res = super(DeepARPredictor, self).predict(req, initial_args={"ContentType": content_type})
-        return self.__decode_response(res, prediction_times, encoding)
+        return self.__decode_response(res, prediction_times, encoding, as_batch)
+
+    @metrics.timed('predictor.predict_bulk')
+    def predict_bulk(self, ts, cat=None, encoding="utf-8", num_samples=100, quantiles=["0.1", "0.5", "0.9"],
+                     content_type="application/json", max_payload_bytes=MAX_PAYLOAD_BYTES,
+                     max_instances=MAX_INSTANCES_PER_REQUEST, max_workers=MAX_WORKERS, max_retries=5, backoff=0.5,
+                     as_batch=False):
+        """Requests the prediction of any number of time series, as `predict` does, splitting them
+        into several requests that are sent concurrently to the endpoint.
+        Each request body is no larger than `max_payload_bytes` and holds no more than `max_instances`
+        time series; throttled requests are retried with exponential backoff.
+        Time series whose prediction is found in the predictor prediction cache are not sent at all.
 
-    @staticmethod
-    def __encode_request(ts, cat, encoding, num_samples, quantiles) -> object:
-        """
-        This function encodes a json request for the endpoint, that accepts
-        :param ts: time series to be predicted
-        :param cat: categorical features
-        :param encoding: encoding to be used
-        :param num_samples: number of samples to be used by DeepAR
-        :param quantiles: list of quantiles to be used by
-        :return:
-        """
-        instances = [series_to_json_obj(ts[k], target_column='Adj Close',
-                                        dyn_feat=[], start=None) for k in range(len(ts))]
+        Parameters:
+        ts -- Time series to predict from. Can be either a list of dataframes or a single dataframe.
+        cat -- list of integers (default: None)
+        encoding -- string, encoding to use for the request (default: "utf-8")
+        num_samples -- integer, number of samples to compute at prediction time (default: 100)
+        quantiles -- list of strings specifying the quantiles to compute (default: ["0.1", "0.5", "0.9"])
+        max_payload_bytes -- integer, maximum size of a request body (default: MAX_PAYLOAD_BYTES)
+        max_instances -- integer, maximum number of time series per request, no limit if None
+        (default: MAX_INSTANCES_PER_REQUEST)
+        max_workers -- integer, maximum number of requests in flight (default: MAX_WORKERS)
+        max_retries -- integer, number of times a throttled request is retried (default: 5)
+        backoff -- float, seconds to wait before the first retry, doubled at each retry (default: 0.5)
+        as_batch -- boolean, whether to return a single `ForecastBatch` (default: False)
+
+        Return value: sequence of `pandas.DataFrame` objects, each containing the predictions and built
+        when first accessed, in the same order as `ts`, or a `ForecastBatch` if as_batch is True
+        """
         configuration = {
             "num_samples": num_samples,
             "output_types": ["quantiles"],
             "quantiles": quantiles,
         }
-        http_request_data = {"instances": instances, "configuration": configuration}
-        return json.dumps(http_request_data).encode(encoding)
+        predictions, prediction_times = self.__request_predictions(ts, configuration, encoding, content_type,
+                                                                   max_payload_bytes, max_instances, max_workers,
+                                                                   max_retries, backoff)
+        return self.__decode_predictions(predictions, prediction_times, as_batch)
+
+    @metrics.timed('predictor.predict_samples')
+    def predict_samples(self, ts, cat=None, encoding="utf-8", num_samples=100, content_type="application/json",
+                        max_payload_bytes=MAX_PAYLOAD_BYTES, max_instances=MAX_INSTANCES_PER_REQUEST,
+                        max_workers=MAX_WORKERS, max_retries=5, backoff=0.5):
+        """Requests sample paths of the prediction of any number of time series, as `predict_bulk` does.
+        Any quantile, the mean and exceedance probabilities can then be computed locally from the
+        returned `SampleForecast`, without calling the endpoint again.
+
+        Parameters:
+        ts -- Time series to predict from. Can be either a list of dataframes or a single dataframe.
+        cat -- list of integers (default: None)
+        encoding -- string, encoding to use for the request (default: "utf-8")
+        num_samples -- integer, number of sample paths of each time series (default: 100)
+        max_payload_bytes, max_instances, max_workers, max_retries, backoff -- as in `predict_bulk`
+
+        Return value: a `SampleForecast` holding the samples of all the time series, in the same order as `ts`
+        """
+        configuration = {
+            "num_samples": num_samples,
+            "output_types": ["samples"],
+        }
+        predictions, prediction_times = self.__request_predictions(ts, configuration, encoding, content_type,
+                                                                   max_payload_bytes, max_instances, max_workers,
+                                                                   max_retries, backoff)
+        return SampleForecast.from_predictions(predictions, prediction_times, self.__freq, self.__calendar)
+
+    def __request_predictions(self, ts, configuration, encoding, content_type, max_payload_bytes, max_instances,
+                              max_workers, max_retries, backoff):
+        """
+        Gets the predictions of time series from the prediction cache or, concurrently, from the endpoint
+        :return: the list of predictions dictionaries and the list of first predicted times, in `ts` order
+        """
+        if isinstance(ts, pd.DataFrame):
+            ts = [ts]
+        with metrics.span('predictor.encode'):
+            prediction_times = self.__next_times([x.index[-1] for x in ts])
+            tails = [context_tail(x, self.__context_points) for x in ts]
+            json_objs = [series_to_json_obj(x, target_column='Adj Close', dyn_feat=[], start=None) for x in tails]
+            if self.__dyn_feat:
+                # dynamic features of all the time series are built at once, horizon included
+                dtype = np.float32 if self.__float32 else np.float64
+                for json_obj, matrix in zip(json_objs, feature_matrices(tails, self.__dyn_feat,
+                                                                        self.__prediction_length,
+                                                                        self.__horizon_policy, dtype=dtype)):
+                    json_obj["dynamic_feat"] = matrix
+            instances = [encode_instance(json_obj, decimals=self.__decimals, float32=self.__float32)
+                         for json_obj in json_objs]
+        head, separator, tail = request_parts(configuration)
+
+        predictions = [None] * len(instances)
+        if self.prediction_cache is not None:
+            keys = [request_fingerprint(self.endpoint_name, configuration, instance) for instance in instances]
+            predictions = [self.prediction_cache.get(key) for key in keys]
+        missing = [k for k, prediction in enumerate(predictions) if prediction is None]
+        bounds = chunk_bounds([len(instances[k]) for k in missing], len(head) + len(tail), len(separator),
+                               max_payload_bytes, max_instances)
+
+        def predict_chunk(chunk):
+            start, stop = chunk
+            req = head + separator.join(instances[k] for k in missing[start:stop]) + tail
+            with metrics.span('endpoint.invoke'):
+                res = self.__invoke_with_retry(req, content_type, max_retries, backoff)
+            with metrics.span('predictor.parse'):
+                return loads_json(res.decode(encoding))["predictions"]
+
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(bounds)))) as executor:
+            fetched = [prediction for chunk_predictions in executor.map(predict_chunk, bounds)
+                       for prediction in chunk_predictions]
+        for k, prediction in zip(missing, fetched):
+            if self.prediction_cache is not None:
+                # sample paths are cached as float32 arrays, fresh ones are replaced by the cached ones
+                prediction = self.prediction_cache.put(keys[k], prediction)
+            predictions[k] = prediction
+        return predictions, prediction_times
+
+    def __invoke_with_retry(self, req, content_type, max_retries, backoff):
+        """
+        Sends an encoded request to the endpoint, retrying it with exponential backoff and jitter
+        as long as the endpoint answers that it is throttling requests or temporarily unavailable
+        """
+        for attempt in range(max_retries + 1):
+            try:
+                return super(DeepARPredictor, self).predict(req, initial_args={"ContentType": content_type})
+            except Exception as error:
+                if attempt == max_retries or not _is_retryable(error):
+                    raise
+                time.sleep(backoff * 2 ** attempt * random.uniform(0.5, 1.0))
+
+    def __next_times(self, times):
+        """
+        :param times: list of last observed times
+        :return: the times following them, by one trading day if a calendar is set, by freq otherwise
+        """
+        if self.__calendar is not None:
+            return self.__calendar.offset(times, 1)
+        return [t + pd.Timedelta(1, unit=self.__freq) for t in times]
 
     @staticmethod
     def __encode_future_request(start_times, cat, encoding, num_samples, quantiles):
-        instances = [{"start": st.strftime(format="%Y-%m-%d"), "target": []} for k, st in enumerate(start_times)]
+        instances = [encode_instance(future_date_to_json_obj(st)) for st in start_times]
 
         configuration = {
             "num_samples": num_samples,
             "output_types": ["quantiles"],
             "quantiles": quantiles,
         }
-        http_request_data = {"instances": instances, "configuration": configuration}
-        return json.dumps(http_request_data).encode(encoding)
-
-    def __decode_response(self, response, prediction_times, encoding):
-        response_data = json.loads(response.decode(encoding))
-        list_of_df = []
-        for k in range(len(prediction_times)):
-            prediction_index = pd.date_range(
-                start=prediction_times[k], freq=self.__freq, periods=self.__prediction_length
-            )
-            list_of_df.append(
-                pd.DataFrame(data=response_data["predictions"][k]["quantiles"], index=prediction_index)
-            )
-        return list_of_df
-
-    def predict_future(self, start_times, cat=None, encoding="utf-8",
-                       num_samples=100, quantiles=["0.1", "0.5", "0.9"], content_type="application/json") -> list:
+        head, separator, tail = request_parts(configuration)
+        return head + separator.join(instances) + tail
+
+    @metrics.timed('predictor.decode')
+    def __decode_response(self, response, prediction_times, encoding, as_batch=False):
+        response_data = loads_json(response.decode(encoding))
+        return self.__decode_predictions(response_data["predictions"], prediction_times, as_batch)
+
+    @metrics.timed('predictor.decode_batch')
+    def __decode_predictions(self, predictions, prediction_times, as_batch):
+        batch = ForecastBatch.from_predictions(predictions, prediction_times, self.__freq,
+                                               calendar=self.__calendar)
+        return batch if as_batch else batch.frames
+
+    @metrics.timed('predictor.predict_future')
+    def predict_future(self, start_times, cat=None, encoding="utf-8", num_samples=100,
+                       quantiles=["0.1", "0.5", "0.9"], content_type="application/json", as_batch=False):
         """Requests the prediction of future time series values for the time series from `start_date`, each with the (optional)
         corresponding category listed in `cat`.
 
         Parameters:
-        start_times -- start date of the future prediction
+        start_times -- start dates of the future predictions, rolled forward to trading days if a calendar is set
         cat -- list of integers (default: None)
         encoding -- string, encoding to use for the request (default: "utf-8")
         num_samples -- integer, number of samples to compute at prediction time (default: 100)
         quantiles -- list of strings specifying the quantiles to compute (default: ["0.1", "0.5", "0.9"])
+        as_batch -- boolean, whether to return a single `ForecastBatch` (default: False)
 
-        Return value: list of `pandas.DataFrame` objects, each containing the predictions
+        Return value: sequence of `pandas.DataFrame` objects, each containing the predictions and built
+        when first accessed, or a `ForecastBatch` if as_batch is True
         """
-        prediction_times = [st + pd.Timedelta(1, unit=self.__freq) for st in start_times]
-        req = self.__encode_future_request(start_times, cat, encoding, num_samples, quantiles)
-        res = super(DeepARPredictor, self).predict(req, initial_args={"ContentType": content_type})
-        return self.__decode_response(res, prediction_times, encoding)
+        if self.__calendar is not None:
+            start_times = self.__calendar.offset(start_times, 0)
+        prediction_times = self.__next_times(start_times)
+        with metrics.span('predictor.encode'):
+            req = self.__encode_future_request(start_times, cat, encoding, num_samples, quantiles)
+        with metrics.span('endpoint.invoke'):
+            res = super(DeepARPredictor, self).predict(req, initial_args={"ContentType": content_type})
+        return self.__decode_response(res, prediction_times, encoding, as_batch)
@@ -1,9 +1,23 @@
+import matplotlib
 import matplotlib.pyplot as plt
 from matplotlib.figure import Figure
 import numpy as np
 import base64
+import hashlib
+import json
 from io import BytesIO
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
+
+from source_deepar import metrics
+from source_deepar.caching import LRUCache
+from utils.trading_calendar import DEFAULT_CALENDAR, get_trading_calendar
+
+# Output formats of display_quantiles_flask: raster and vector images embedded in HTML,
+# or plain chart data to be plotted by the browser
+CHART_FORMATS = ('png', 'svg', 'json')
+# Rendered charts are cached by content, as the same prediction is displayed many times
+RENDER_CACHE_SIZE = 128
+_render_cache = LRUCache(maxsize=RENDER_CACHE_SIZE)
 
 
 def display_quantiles(prediction, target_ts=None, benchmark_prediction=None, benchmark_prediction_name=None):
@@ -33,40 +47,100 @@ def display_quantiles(prediction, target_ts=None, benchmark_prediction=None, ben
 
 
 def display_quantiles_flask(prediction, target_ts=None, bench_mark_prediction=None,
-                            bench_mark_prediction_name=None, start=None):
+                            bench_mark_prediction_name=None, start=None, output='png', calendar_name=DEFAULT_CALENDAR):
     """
     Show predictions for input time series against comparison values in a Flask application
     (avoids a memory leak that may occur using pyplot as in th `display_quantiles` function)
-    This function is conceived to be used by a Flask application, and it will not make use of pandas
+    This function is conceived to be used by a Flask application, and it will not make use of pandas.
+    Rendered charts are cached, keyed by a hash of their content and output format.
     :param prediction: time series prediction prediction produced by a DeepAR model
     :param target_ts: prediction target time series
     :param bench_mark_prediction: benchmark model prediction
     :param bench_mark_prediction_name: benchmark model name to be shown in legend
     :param start: plot start date
-    :return: a <img> HTML5 element containing the plot
+    :param output: one among CHART_FORMATS
+    :param calendar_name: trading calendar of x-ticks dates, None for consecutive days
+    :return: a <img> HTML5 element containing the plot if output is 'png', an inline <svg> element if it is 'svg',
+    or the chart data dictionary, as returned by `quantiles_chart_data`, if it is 'json'
     """
+    if output not in CHART_FORMATS:
+        raise ValueError("unsupported chart format: %s" % output)
+    with metrics.span('chart.data'):
+        data = quantiles_chart_data(prediction, target_ts=target_ts, bench_mark_prediction=bench_mark_prediction,
+                                    bench_mark_prediction_name=bench_mark_prediction_name, start=start,
+                                    calendar_name=calendar_name)
+    if output == 'json':
+        return data
 
-    fig = Figure()
-    ax = fig.subplots()
-    if start is not None:
-        # retrieving x-ticks
-        if isinstance(start, str) and start !="":
+    key = hashlib.sha256((output + json.dumps(data, sort_keys=True)).encode('utf-8')).hexdigest()
+    chart = _render_cache.get(key)
+    if chart is None:
+        metrics.increment('chart.cache_misses')
+        with metrics.span('chart.render.' + output):
+            chart = _render_chart(data, output)
+        _render_cache.put(key, chart)
+    else:
+        metrics.increment('chart.cache_hits')
+    return chart
+
+
+def quantiles_chart_data(prediction, target_ts=None, bench_mark_prediction=None, bench_mark_prediction_name=None,
+                         start=None, calendar_name=DEFAULT_CALENDAR):
+    """
+    Collects the values plotted by `display_quantiles_flask`
+    :param prediction: time series prediction prediction produced by a DeepAR model
+    :param target_ts: prediction target time series
+    :param bench_mark_prediction: benchmark model prediction
+    :param bench_mark_prediction_name: benchmark model name to be shown in legend
+    :param start: plot start date, as "%Y-%m-%d %H:%M:%S" string, date or datetime
+    :param calendar_name: trading calendar of x-ticks dates, starting from the first trading day since start,
+    None for consecutive days
+    :return: a json serializable dictionary with "dates" (day/month labels, empty without start date),
+    "quantiles" ("0.1", "0.5" and "0.9" lists), "target" and "benchmark" (lists or None) and "benchmark_name" keys
+    """
+    length = len(prediction['0.5'])
+    labels = []
+    if start is not None and start != "":
+        if isinstance(start, str):
             start_date = datetime.strptime(start, "%Y-%m-%d %H:%M:%S").date()
         elif isinstance(start, datetime):
             start_date = start.date()
-        elif isinstance(start, datetime.date):
-            starte_date = start
+        elif isinstance(start, date):
+            start_date = start
         else:
-            print("Enter only string or date as start values")
-        x_ticks = [start_date + x * timedelta(days=1) for x in range(len(prediction['0.5']))]
-        ax.set_xticklabels(["{}/{}".format(x_tick.day, x_tick.month) for x_tick in x_ticks])
-    if target_ts is not None:
-        ax.plot(target_ts[-len(x_ticks):], label='real Adjusted Close')
+            raise ValueError("Enter only string or date as start values")
+        if calendar_name is not None:
+            x_ticks = get_trading_calendar(calendar_name).next_sessions(start_date, length)
+        else:
+            x_ticks = [start_date + x * timedelta(days=1) for x in range(length)]
+        labels = ["{}/{}".format(x_tick.day, x_tick.month) for x_tick in x_ticks]
+    return {
+        "dates": labels,
+        "quantiles": {q: [float(v) for v in prediction[q]] for q in ('0.1', '0.5', '0.9')},
+        "target": None if target_ts is None else [float(v) for v in target_ts[-length:]],
+        "benchmark": None if bench_mark_prediction is None else [float(v) for v in bench_mark_prediction],
+        "benchmark_name": bench_mark_prediction_name,
+    }
+
+
+def _render_chart(data, output):
+    """
+    Renders chart data as an HTML element, in PNG or SVG format
+    """
+    fig = Figure()
+    ax = fig.subplots()
+    if data["dates"]:
+        # no more than about ten labels, so that they do not overlap
+        step = max(1, len(data["dates"]) // 10)
+        ax.set_xticks(range(0, len(data["dates"]), step))
+        ax.set_xticklabels(data["dates"][::step])
+    if data["target"] is not None:
+        ax.plot(data["target"], label='real Adjusted Close')
 
     # get the quantile values at 10 and 90%
-    p10 = np.array(prediction['0.1'], dtype=float)
-    p50 = np.array(prediction['0.5'], dtype=float)
-    p90 = np.array(prediction['0.9'], dtype=float)
+    p10 = np.array(data["quantiles"]['0.1'], dtype=float)
+    p50 = np.array(data["quantiles"]['0.5'], dtype=float)
+    p90 = np.array(data["quantiles"]['0.9'], dtype=float)
 
     # fill the 80% confidence interval
     ax.fill_between(range(0, len(p10)), p10, p90, color='y', alpha=0.5, label='80% confidence interval')
@@ -75,14 +149,20 @@ def display_quantiles_flask(prediction, target_ts=None, bench_mark_prediction=No
     ax.plot(p50, label='prediction median')
 
     # plot benchmark data
-    if bench_mark_prediction is not None:
-        ax.plot(bench_mark_prediction, label=bench_mark_prediction_name, color='r')
+    if data["benchmark"] is not None:
+        ax.plot(data["benchmark"], label=data["benchmark_name"], color='r')
 
     # adding legend
     ax.legend()
 
     # Save it to a temporary buffer.
     buf = BytesIO()
+    if output == 'svg':
+        # text is kept as text, which makes images smaller, and the XML prologue is dropped to inline the image
+        with matplotlib.rc_context({'svg.fonttype': 'none'}):
+            fig.savefig(buf, format="svg")
+        svg = buf.getvalue().decode("utf-8")
+        return svg[svg.index("<svg"):]
     fig.savefig(buf, format="png")
 
     # Embed the result in the html output.
@@ -0,0 +1,158 @@
+r"""
+Compact encoding of DeepAR endpoint requests and of Lambda function responses, shared by the prediction
+Lambda function and by DeepARPredictor.
+Numbers can be rounded to a given number of decimals, or written with the shortest representation that
+preserves float32 precision, the precision DeepAR works with, so that the model sees the very same values.
+This module only depends on the Python standard library; orjson is used, if installed, to serialize
+and parse generic json documents faster.
+"""
+import json
+import math
+from array import array
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+_NAN = float('nan')
+
+
+def dumps(obj) -> bytes:
+    """
+    Serializes a json document compactly, by means of orjson if available
+    :param obj: a json serializable object
+    :return: the utf-8 encoded document
+    """
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(',', ':')).encode('utf-8')
+
+
+def loads(data):
+    """
+    Parses a json document, by means of orjson if available
+    :param data: a json document, as bytes or string
+    :return: the parsed object
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def format_number(value, decimals=None, float32=False) -> str:
+    """
+    Formats a number as a json number, with missing and non finite values as "NaN" strings, as DeepAR expects
+    :param value: a number, or a "NaN" string
+    :param decimals: number of decimals the value is rounded to, no rounding if None
+    :param float32: if True, the value is written with the shortest representation that,
+    parsed as a float32, gives back the nearest float32 to the value
+    :return: the formatted number
+    """
+    return _format_values([value], decimals, float32)[0]
+
+
+def format_array(values, decimals=None, float32=False) -> str:
+    """
+    Formats a sequence of numbers as a compact json array
+    :param values: a sequence of numbers, missing values being None or "NaN" strings
+    :param decimals: number of decimals values are rounded to, no rounding if None
+    :param float32: if True, values are written with float32 precision
+    :return: the formatted array
+    """
+    return '[' + ','.join(_format_values(values, decimals, float32)) + ']'
+
+
+def _format_values(values, decimals, float32):
+    if hasattr(values, 'tolist'):
+        # numpy arrays are converted to Python floats in bulk
+        values = values.tolist()
+    values = [_NAN if v is None else float(v) for v in values]
+    if decimals is not None:
+        values = [round(v, decimals) for v in values]
+    texts = _float32_texts(values) if float32 else list(map(repr, values))
+    for k, value in enumerate(values):
+        if not math.isfinite(value):
+            texts[k] = '"NaN"'
+    return texts
+
+
+def _float32_texts(values):
+    # values are converted to float32 in bulk by array, then each one is written with as few
+    # significant digits as needed for its text to be parsed back into the same float32
+    singles = array('f', values).tolist()
+    texts = ['%.6g' % v for v in singles]
+    pending = [k for k, v in enumerate(singles) if math.isfinite(v)]
+    for digits in (7, 8, 9):
+        parsed = array('f', [float(texts[k]) for k in pending]).tolist()
+        pending = [k for k, v in zip(pending, parsed) if v != singles[k]]
+        if not pending:
+            break
+        for k in pending:
+            texts[k] = '%.*g' % (digits, singles[k])
+    return texts
+
+
+def encode_instance(instance, decimals=None, float32=False) -> bytes:
+    """
+    Encodes a DeepAR instance with compact numbers
+    :param instance: a dictionary with "start", "target" and, optionally, "cat" and "dynamic_feat" keys
+    :param decimals: number of decimals values are rounded to, no rounding if None
+    :param float32: if True, values are written with float32 precision
+    :return: the utf-8 encoded instance
+    """
+    parts = ['"start":' + json.dumps(str(instance["start"])),
+             '"target":' + format_array(instance["target"], decimals, float32)]
+    if "cat" in instance:
+        parts.append('"cat":' + json.dumps(list(instance["cat"])))
+    if "dynamic_feat" in instance:
+        parts.append('"dynamic_feat":[' + ','.join(format_array(feat, decimals, float32)
+                                                   for feat in instance["dynamic_feat"]) + ']')
+    return ('{' + ','.join(parts) + '}').encode('utf-8')
+
+
+def request_parts(configuration):
+    """
+    Returns the pieces a request body is assembled from:
+    head + separator.join(encoded instances) + tail
+    :param configuration: endpoint configuration dictionary
+    :return: head, separator and tail, as bytes
+    """
+    return b'{"instances":[', b',', b'],"configuration":' + dumps(configuration) + b'}'
+
+
+def encode_request(encoded_instances, configuration) -> bytes:
+    """
+    Assembles a request body
+    :param encoded_instances: list of instances encoded by encode_instance
+    :param configuration: endpoint configuration dictionary
+    :return: the request body
+    """
+    head, separator, tail = request_parts(configuration)
+    return head + separator.join(encoded_instances) + tail
+
+
+def chunk_bounds(sizes, overhead, separator_size, max_payload_bytes, max_instances=None):
+    """
+    Splits consecutive encoded instances into chunks whose request body fits max_payload_bytes
+    and that hold no more than max_instances instances
+    :param sizes: sizes in bytes of the encoded instances
+    :param overhead: size in bytes of the request body without instances
+    :param separator_size: size in bytes of the separator between two instances
+    :param max_payload_bytes: maximum size in bytes of a request body
+    :param max_instances: maximum number of instances per request, no limit if None
+    :return: a list of (start, stop) indices of the chunks
+    """
+    bounds = []
+    start, chunk_size = 0, overhead
+    for k, size in enumerate(sizes):
+        if overhead + size > max_payload_bytes:
+            raise ValueError("instance %d exceeds the %d bytes payload limit" % (k, max_payload_bytes))
+        extra = size + (separator_size if k > start else 0)
+        if k > start and (chunk_size + extra > max_payload_bytes or (max_instances and k - start >= max_instances)):
+            bounds.append((start, k))
+            start, chunk_size, extra = k, overhead, size
+        chunk_size += extra
+    if start < len(sizes):
+        bounds.append((start, len(sizes)))
+    return bounds
@@ -1,12 +1,115 @@
 r"""
 Stock prediction by means of DeepAR model, from a future date
+The function has to be packaged together with the source_deepar package, with
+source_deepar.lambda_stock_prediction.lambda_handler as handler.
 """
 # We need to use the low-level library to interact with SageMaker since the SageMaker API
 # is not available natively through Lambda.
 import boto3
-# we need to use json in order to interact with endpoint I/O
-import json
+import base64
+import gzip
+import math
 import os
+import threading
+import time
+from bisect import bisect_right
+from datetime import datetime, timedelta
+
+# we need to use json in order to interact with endpoint I/O
+from source_deepar import encoding, metrics
+from source_deepar.caching import LRUCache, PredictionCache, SingleFlight, request_fingerprint
+
+# S3 bucket containing stock json data
+DATA_BUCKET_NAME = "put_here_data_bucket_name"
+# The name of the endpoint we created
+ENDPOINT_NAME = 'DeepAR-ml-spp'
+
+# Endpoint configuration used for every request
+CONFIGURATION = {
+    "num_samples": 100,
+    "output_types": ["quantiles"],
+    "quantiles": ["0.1", "0.5", "0.9"],
+}
+# Endpoint configuration used when clients ask for statistics that are computed from sample paths
+SAMPLES_CONFIGURATION = {
+    "num_samples": 100,
+    "output_types": ["samples"],
+}
+# Instances values are sent with float32 precision, the one DeepAR works with, using the shortest
+# representation that preserves it; REQUEST_DECIMALS rounds them further, if not None.
+REQUEST_FLOAT32 = True
+REQUEST_DECIMALS = None
+# Response bodies at least this large are gzip compressed for clients accepting it
+COMPRESSION_MIN_BYTES = 1024
+# SageMaker real-time endpoints accept request bodies up to 6 MB, some room is left for safety
+MAX_PAYLOAD_BYTES = 5 * 1024 * 1024
+
+# Only the last CONTEXT_POINTS values of each time series are sent to the endpoint:
+# DeepAR conditions its predictions on the last context_length (20) values plus lagged values
+# going back up to about one year, so older history only makes requests bigger.
+# A value of 0 sends the whole time series.
+CONTEXT_POINTS = 400
+
+# Supported tickers, along with the name of the json file containing their data
+TICKER_REGISTRY = {
+    'IBM': 'IBM.json',
+    'AAPL': 'AAPL.json',
+    'AMZN': 'AMZN.json',
+    'GOOGL': 'GOOGL.json',
+}
+
+# Parsed stock data are kept in memory between invocations of a warm Lambda container.
+# A cached entry is served without contacting S3 for DATA_CACHE_TTL seconds, after that
+# its ETag is checked and the object is downloaded again only if it has changed.
+DATA_CACHE_SIZE = 64
+DATA_CACHE_TTL = 300
+_stock_data_cache = LRUCache(maxsize=DATA_CACHE_SIZE)
+
+# Predictions are cached by request fingerprint (endpoint name, configuration and instance), so that
+# repeated requests for the same ticker, last bar and configuration do not invoke the endpoint again.
+# Setting the PREDICTION_CACHE_DIR environment variable (e.g. to a folder in /tmp) adds an on-disk tier.
+PREDICTION_CACHE_SIZE = 256
+PREDICTION_CACHE_TTL = 3600
+PREDICTION_CACHE_DISK_SIZE = 4096
+_prediction_cache = PredictionCache(maxsize=PREDICTION_CACHE_SIZE, ttl=PREDICTION_CACHE_TTL,
+                                    cache_dir=os.environ.get('PREDICTION_CACHE_DIR'),
+                                    disk_maxsize=PREDICTION_CACHE_DISK_SIZE)
+
+# Concurrent callers (threads sharing this module, or repeated tickers within a batch) asking for the
+# same S3 object or the same prediction share a single download or endpoint invocation
+_s3_flights = SingleFlight()
+_prediction_flights = SingleFlight()
+
+# hit, miss and coalescing counts are part of the metrics emitted by every invocation
+metrics.registry.register_stats('prediction_cache', _prediction_cache.stats)
+metrics.registry.register_stats('prediction_flights', _prediction_flights.stats)
+metrics.registry.register_stats('s3_flights', _s3_flights.stats)
+
+# AWS clients are created once per container and reused by following invocations
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_s3_resource():
+    """
+    Returns the S3 resource shared by all the invocations of the container
+    """
+    return _get_client('s3', lambda: boto3.resource('s3'))
+
+
+def get_runtime_client():
+    """
+    Returns the SageMaker runtime client shared by all the invocations of the container.
+    The SageMaker runtime is what allows us to invoke the endpoint that we've created.
+    """
+    return _get_client('sagemaker-runtime', lambda: boto3.Session().client('sagemaker-runtime'))
+
+
+def _get_client(name, factory):
+    with _clients_lock:
+        if name not in _clients:
+            _clients[name] = factory()
+        return _clients[name]
 
 
 def lambda_handler(event, context):
@@ -18,70 +121,255 @@ def lambda_handler(event, context):
     :param context: the context where the event has been triggered
     :return: a json formatted response from SageMaker ML model endpoint.
     """
+    with metrics.span('lambda.handler'):
+        response = handle_request(event)
+        with metrics.span('lambda.compress'):
+            response = compress_response(response, event.get('headers'))
+    # latency percentiles of every stage, as a structured log line
+    metrics.registry.emit()
+    return response
 
-    # S3 resource invocation
-    s3_resource = boto3.resource('s3')
-    # S3 bucket selection
-    data_bucket_name = "put_here_data_bucket_name"
-    # The SageMaker runtime is what allows us to invoke the endpoint that we've created.
-    runtime = boto3.Session().client('sagemaker-runtime')
 
-    request_body_dict = json.loads(event['body'])
+def handle_request(event) -> dict:
+    """
+    Computes the uncompressed response to an API Gateway event
+    :param event: API Gateway event, whose body is a json prediction request
+    :return: a dictionary in AWS API Gateway Lambda proxy integration format
+    """
+    # S3 resource and SageMaker runtime, reused by warm containers
+    s3_resource = get_s3_resource()
+    runtime = get_runtime_client()
+
+    request_body_dict = encoding.loads(event['body'])
+
+    # several tickers and/or start dates are predicted together, with as few endpoint invocations as possible
+    if 'tickers' in request_body_dict:
+        try:
+            result = predict_batch(request_body_dict, s3_resource=s3_resource, runtime=runtime,
+                                   s3_bucket=DATA_BUCKET_NAME)
+        except ValueError as e:
+            return http_response(encoding.dumps({"error": str(e)}).decode('utf-8'), status_code=400)
+        return http_response(encoding.dumps(result).decode('utf-8'))
+
+    # number of most recent values to be sent to the endpoint, CONTEXT_POINTS if not given
+    context_points = request_body_dict.get('context_points')
 
     # Now we use the SageMaker runtime to invoke our endpoint, sending both ticker and start date if given
     if request_body_dict['start_date'] != "":
-        response = runtime.invoke_endpoint(EndpointName='DeepAR-ml-spp',  # The name of the endpoint we created
-                                           ContentType='application/json',  # The data format that is expected
-                                           Body=encode_future_request(request_body=request_body_dict,
-                                                                      s3_resource=s3_resource,
-                                                                      s3_bucket=data_bucket_name, prefix='valid'))
+        instance = future_instance(request_body_dict['ticker_name'], request_body_dict['start_date'],
+                                   s3_resource=s3_resource, s3_bucket=DATA_BUCKET_NAME, prefix='valid')
     # or only ticker name if no start date has been provided
     elif request_body_dict['ticker_name'] != "":
-        response = runtime.invoke_endpoint(EndpointName='DeepAR-ml-spp',  # The name of the endpoint we created
-                                           ContentType='application/json',  # The data format that is expected
-                                           Body=encode_request(ticker_name=request_body_dict['ticker_name'],
-                                                               s3_resource=s3_resource, s3_bucket=data_bucket_name,
-                                                               prefix='train'))
-
-    # The response is an HTTP response whose body contains the result of our inference
-    result = response['Body'].read().decode('utf-8')
+        instance = get_stock_data(request_body_dict['ticker_name'], s3_resource=s3_resource,
+                                  s3_bucket=DATA_BUCKET_NAME, prefix='train')
+    predictions = predict_instances([truncate_context(instance, context_points)], runtime=runtime)
+    result = encoding.dumps({"predictions": predictions}).decode('utf-8')
 
     # print data for debug purposes
     print(result)
 
+    return http_response(result)
+
+
+def http_response(body, status_code=200) -> dict:
+    """
+    Wraps a json body into a response for AWS API Gateway
+    :param body: json formatted response body
+    :param status_code: HTTP status code
+    :return: a dictionary in AWS API Gateway Lambda proxy integration format
+    """
     return {
-        'statusCode': 200,
+        'statusCode': status_code,
         'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-        'body': str(result)
+        'body': body
     }
 
 
-def encode_future_request(request_body, s3_resource, s3_bucket, prefix) -> bytes:
+def compress_response(response, headers=None) -> dict:
+    """
+    Compresses a response body with gzip, if the client accepts it and the body is large enough.
+    Compressed bodies are base64 encoded, so API Gateway has to treat responses as binary media types.
+    :param response: a dictionary in AWS API Gateway Lambda proxy integration format
+    :param headers: request headers
+    :return: the compressed response, or the input one
+    """
+    accept_encoding = next((value for name, value in (headers or {}).items()
+                            if name.lower() == 'accept-encoding'), '') or ''
+    body = response['body'].encode('utf-8')
+    if 'gzip' not in accept_encoding.lower() or len(body) < COMPRESSION_MIN_BYTES:
+        return response
+    return dict(response,
+                headers=dict(response['headers'], **{'Content-Encoding': 'gzip'}),
+                body=base64.b64encode(gzip.compress(body, compresslevel=6)).decode('ascii'),
+                isBase64Encoded=True)
+
+
+def predict_batch(request_body, s3_resource, runtime, s3_bucket) -> dict:
+    """
+    Predicts several tickers, packing their instances into as few endpoint invocations
+    as MAX_PAYLOAD_BYTES allows.
+    :param request_body: a dictionary with a "tickers" list and, optionally, either a "start_dates" list
+                         (one start date per ticker) or a single "start_date" used for all of them;
+                         an empty start date means the prediction follows the ticker training data;
+                         an optional "context_points" value overrides CONTEXT_POINTS;
+                         optional "quantiles" (any list of quantiles) and "exceedance" (a list of thresholds)
+                         make the endpoint return sample paths, from which quantiles, mean and exceedance
+                         probabilities are computed here, "num_samples" setting the number of sample paths
+    :param s3_resource: AWS S3 resource identifier
+    :param runtime: SageMaker runtime client
+    :param s3_bucket: AWS S3 bucket name
+    :return: a dictionary with a "predictions" list, in tickers order, each prediction
+             carrying its "ticker_name" and "start_date"
+    """
+    tickers = [t.upper() for t in request_body['tickers']]
+    start_dates = request_body.get('start_dates', [request_body.get('start_date', "")] * len(tickers))
+    if len(start_dates) != len(tickers):
+        raise ValueError("expected one start date per ticker, got %d for %d tickers" % (len(start_dates),
+                                                                                        len(tickers)))
+    unknown = [t for t in tickers if t not in TICKER_REGISTRY]
+    if unknown:
+        raise ValueError("unknown tickers: %s" % ', '.join(unknown))
+    quantiles = request_body.get('quantiles')
+    thresholds = request_body.get('exceedance', [])
+    if quantiles is not None and not _is_number_list(quantiles, strings=True):
+        raise ValueError("quantiles must be a list of numbers")
+    if not _is_number_list(thresholds):
+        raise ValueError("exceedance must be a list of numbers")
+    from_samples = quantiles is not None or len(thresholds) > 0
+    if from_samples:
+        quantiles = CONFIGURATION["quantiles"] if quantiles is None else [str(q) for q in quantiles]
+        if not all(0 <= float(q) <= 1 for q in quantiles):
+            raise ValueError("quantiles must be between 0 and 1: %s" % ', '.join(quantiles))
+        configuration = dict(SAMPLES_CONFIGURATION,
+                             num_samples=int(request_body.get('num_samples', SAMPLES_CONFIGURATION["num_samples"])))
+
+    instances = []
+    for ticker_name, start_date in zip(tickers, start_dates):
+        if start_date != "":
+            instance = future_instance(ticker_name, start_date, s3_resource=s3_resource, s3_bucket=s3_bucket,
+                                       prefix='valid')
+        else:
+            instance = get_stock_data(ticker_name, s3_resource=s3_resource, s3_bucket=s3_bucket, prefix='train')
+        instances.append(truncate_context(instance, request_body.get('context_points')))
+
+    if from_samples:
+        sample_predictions = predict_instances(instances, runtime=runtime, configuration=configuration)
+        with metrics.span('lambda.sample_statistics'):
+            predictions = [sample_statistics(prediction["samples"], quantiles, thresholds)
+                           for prediction in sample_predictions]
+    else:
+        predictions = predict_instances(instances, runtime=runtime)
+
+    return {"predictions": [dict(prediction, ticker_name=ticker_name, start_date=start_date)
+                            for prediction, ticker_name, start_date in zip(predictions, tickers, start_dates)]}
+
+
+def _is_number_list(values, strings=False) -> bool:
+    """
+    :param values: a decoded request value
+    :param strings: whether strings representing numbers (e.g. quantiles "0.1") are accepted
+    :return: True if values is a list of numbers
+    """
+    if not isinstance(values, list):
+        return False
+    for value in values:
+        if isinstance(value, str) and strings:
+            try:
+                float(value)
+            except ValueError:
+                return False
+        elif isinstance(value, bool) or not isinstance(value, (int, float)):
+            return False
+    return True
+
+
+def predict_instances(instances, runtime, configuration=None) -> list:
+    """
+    Predicts instances, serving cached predictions from the prediction cache and packing
+    the other instances into as few endpoint invocations as MAX_PAYLOAD_BYTES allows.
+    :param instances: list of instances dictionaries
+    :param runtime: SageMaker runtime client
+    :param configuration: endpoint configuration, CONFIGURATION if None
+    :return: a list of predictions dictionaries, in instances order; they may be shared with the cache
+             and must not be modified
+    """
+    configuration = configuration or CONFIGURATION
+    encoded, keys = {}, []
+    with metrics.span('lambda.encode'):
+        for instance in instances:
+            body = encode_instance(instance)
+            key = request_fingerprint(ENDPOINT_NAME, configuration, body)
+            encoded[key] = body
+            keys.append(key)
+    predictions = [_prediction_cache.get(key) for key in keys]
+    missing = [key for key, prediction in zip(keys, predictions) if prediction is None]
+    metrics.increment('prediction_cache.hits', len(keys) - len(missing))
+    metrics.increment('prediction_cache.misses', len(missing))
+
+    def invoke(missing_keys):
+        fetched = []
+        for body in _pack_encoded([encoded[key] for key in missing_keys], configuration):
+            with metrics.span('endpoint.invoke'):
+                response = runtime.invoke_endpoint(EndpointName=ENDPOINT_NAME, ContentType='application/json',
+                                                   Body=body)
+                response_body = response['Body'].read()
+            metrics.observe('endpoint.request_bytes', len(body))
+            with metrics.span('lambda.decode'):
+                fetched.extend(encoding.loads(response_body)['predictions'])
+        # the stored predictions are returned, so that fresh and cached sample paths are both float32
+        return [_prediction_cache.put(key, prediction) for key, prediction in zip(missing_keys, fetched)]
+
+    # instances predicted by concurrent callers are waited for, the others are sent once each
+    fetched = dict(zip(missing, _prediction_flights.do_many(missing, invoke)))
+    return [fetched[key] if prediction is None else prediction for key, prediction in zip(keys, predictions)]
+
+
+def sample_statistics(samples, quantiles, thresholds=()) -> dict:
+    """
+    Computes statistics of predicted sample paths at every predicted time.
+    Quantiles are linearly interpolated between samples, as numpy.quantile does by default.
+    :param samples: list of sample paths, each one a list of predicted values
+    :param quantiles: list of quantiles, as strings
+    :param thresholds: values whose exceedance probability is estimated
+    :return: a dictionary with "quantiles" and "mean" keys and, if thresholds are given, an "exceedance" one,
+             quantiles and exceedance probabilities being keyed by quantile and threshold
+    """
+    steps = [sorted(step) for step in zip(*samples)]
+    n = len(samples)
+    statistics = {
+        "quantiles": {q: [_sorted_quantile(step, float(q)) for step in steps] for q in quantiles},
+        "mean": [math.fsum(step) / n for step in steps],
+    }
+    if thresholds:
+        statistics["exceedance"] = {str(t): [(n - bisect_right(step, t)) / n for step in steps] for t in thresholds}
+    return statistics
+
+
+def _sorted_quantile(values, q) -> float:
+    position = q * (len(values) - 1)
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+@metrics.timed('lambda.encode_future_request')
+def encode_future_request(request_body, s3_resource, s3_bucket, prefix, context_points=None) -> bytes:
     """
     Encodes a request to be fed to the SageMaker endpoint from a start date on.
     :param request_body: a dictionary that describe what kind of prediction is desired
     :param s3_resource: AWS S3 resource identifier
     :param s3_bucket: AWS S3 bucket name
     :param prefix: AWS S3 bucket inner path
+    :param context_points: number of most recent values to be sent, CONTEXT_POINTS if None, all of them if 0
     :return: a json object containing a request ready to be sent to the endpoint
     """
-
-    start_date = request_body['start_date']
-    ticker_name = request_body['ticker_name']
-    target_data = get_stock_data(ticker_name=ticker_name, s3_resource=s3_resource, s3_bucket=s3_bucket, prefix=prefix)[
-        'target']
-    instance = [{"start": start_date, "target": target_data}]
-
-    configuration = {
-        "num_samples": 100,
-        "output_types": ["quantiles"],
-        "quantiles": ["0.1", "0.5", "0.9"],
-    }
-    http_request_data = {"instances": instance, "configuration": configuration}
-    return json.dumps(http_request_data).encode("utf-8")
+    instance = future_instance(request_body['ticker_name'], request_body['start_date'], s3_resource=s3_resource,
+                               s3_bucket=s3_bucket, prefix=prefix)
+    return pack_requests([truncate_context(instance, context_points)])[0]
 
 
-def encode_request(ticker_name, s3_resource, s3_bucket, prefix) -> bytes:
+@metrics.timed('lambda.encode_request')
+def encode_request(ticker_name, s3_resource, s3_bucket, prefix, context_points=None) -> bytes:
     """
     Encodes a request to be fed to the SageMaker endpoint
     :param s3_bucket: S3 bucket where to find json data
@@ -89,80 +377,125 @@ def encode_request(ticker_name, s3_resource, s3_bucket, prefix) -> bytes:
     :param ticker_name: a string indicating which stock has to be predicted.
                         Possible values: 'IBM', 'AAPL', 'AMZN', 'GOOGL'.
     :param prefix: data source to be used for prediction (test, validation, etc.)
+    :param context_points: number of most recent values to be sent, CONTEXT_POINTS if None, all of them if 0
     :return: a json string containing a request ready to be sent to the endpoint
     """
-    instances = [get_stock_data(ticker_name, s3_resource=s3_resource,
-                                s3_bucket=s3_bucket, prefix=prefix)]
-    configuration = {
-        "num_samples": 100,
-        "output_types": ["quantiles"],
-        "quantiles": ["0.1", "0.5", "0.9"],
-    }
-    http_request_data = {"instances": instances, "configuration": configuration}
-    return json.dumps(http_request_data).encode("utf-8")
+    instance = get_stock_data(ticker_name, s3_resource=s3_resource, s3_bucket=s3_bucket, prefix=prefix)
+    return pack_requests([truncate_context(instance, context_points)])[0]
 
 
-def get_ibm_adj_cls_from_s3(s3_resource, bucket_name, prefix='') -> dict:
+def future_instance(ticker_name, start_date, s3_resource, s3_bucket, prefix) -> dict:
     """
-    Load IBM stock json serialized data from S3 resource
-    :param prefix: prefix of the path where the file is located
-    :param s3_resource: s3 resource to get data from
-    :param bucket_name: s3 bucket to get data from
-    :return: dict object containing IBM stock price adjusted close from S3 archived JSON
+    Builds an endpoint instance to predict a ticker from a start date on.
+    :param ticker_name: ticker name, one among the TICKER_REGISTRY ones
+    :param start_date: prediction start date
+    :param s3_resource: AWS S3 resource identifier
+    :param s3_bucket: AWS S3 bucket name
+    :param prefix: AWS S3 bucket inner path
+    :return: a dictionary with "start" and "target" keys
     """
-    ibm_filename = "IBM.json"
-    complete_path = os.path.join(prefix, ibm_filename)
-    json_object = s3_resource.Object(bucket_name, complete_path)
-    file_content = json_object.get()['Body'].read().decode('utf-8')
-    json_content = json.loads(file_content)
-    return json_content
+    target_data = get_stock_data(ticker_name=ticker_name, s3_resource=s3_resource, s3_bucket=s3_bucket,
+                                 prefix=prefix)['target']
+    return {"start": start_date, "target": target_data}
 
 
-def get_amazon_adj_cls_from_s3(s3_resource, bucket_name, prefix='') -> dict:
+def truncate_context(instance, context_points=None) -> dict:
     """
-    Load IBM stock json serialized data from S3 resource
-    :param prefix: prefix of the path where the find will be placed
-    :param s3_resource: s3 resource to get data from
-    :param bucket_name: s3 bucket to get data from
-    :return: dict object containing AMZN stock price adjusted close from S3 archived JSON
+    Keeps only the most recent values of an instance target (and the matching dynamic features values),
+    moving its start date forward accordingly. Time series are assumed to have daily frequency.
+    :param instance: a dictionary with "start", "target" and, optionally, "dynamic_feat" keys
+    :param context_points: number of most recent values to be kept, CONTEXT_POINTS if None, all of them if 0
+    :return: a new, truncated, instance or the input one if there is nothing to truncate
     """
-    amzn_filename = "AMZN.json"
-    complete_path = os.path.join(prefix, amzn_filename)
-    json_object = s3_resource.Object(bucket_name, complete_path)
-    file_content = json_object.get()['Body'].read().decode('utf-8')
-    json_content = json.loads(file_content)
-    return json_content
+    context_points = CONTEXT_POINTS if context_points is None else int(context_points)
+    dropped = len(instance["target"]) - context_points
+    if context_points <= 0 or dropped <= 0:
+        return instance
+    truncated = dict(instance, start=shift_start(instance["start"], dropped), target=instance["target"][dropped:])
+    if "dynamic_feat" in instance:
+        truncated["dynamic_feat"] = [feat[dropped:] for feat in instance["dynamic_feat"]]
+    return truncated
 
 
-def get_apple_adj_cls_from_s3(s3_resource, bucket_name, prefix='') -> dict:
+def shift_start(start, periods) -> str:
     """
-    Load Apple Inc. stock json serialized data from S3 resource
-    :param prefix: prefix of the path where the file is located
-    :param s3_resource: s3 resource to get data from
-    :param bucket_name: s3 bucket to get data from
-    :return: json object containing Apple Inc. stock price adjusted close
+    Moves a daily time series start date forward
+    :param start: start date, formatted as "%Y-%m-%d %H:%M:%S" or "%Y-%m-%d"
+    :param periods: number of days
+    :return: the new start date, with the same format of the input one
     """
-    aapl_filename = "AAPL.json"
-    complete_path = os.path.join(prefix, aapl_filename)
-    json_object = s3_resource.Object(bucket_name, complete_path)
-    file_content = json_object.get()['Body'].read().decode('utf-8')
-    json_content = json.loads(file_content)
-    return json_content
+    for date_format in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d"):
+        try:
+            start_date = datetime.strptime(start, date_format)
+        except ValueError:
+            continue
+        return (start_date + timedelta(days=periods)).strftime(date_format)
+    raise ValueError("unsupported start date format: %s" % start)
 
 
-def get_google_adj_cls_from_s3(s3_resource, bucket_name, prefix='') -> dict:
+def encode_instance(instance) -> bytes:
     """
-    Load Alphabet Inc. stock json serialized data from S3 resource
-    :param prefix: prefix of the path where the file is located
+    Encodes an instance as REQUEST_FLOAT32 and REQUEST_DECIMALS prescribe
+    :param instance: a dictionary with "start", "target" and, optionally, "dynamic_feat" keys
+    :return: the json encoded instance
+    """
+    return encoding.encode_instance(instance, decimals=REQUEST_DECIMALS, float32=REQUEST_FLOAT32)
+
+
+def pack_requests(instances, configuration=None, max_payload_bytes=None) -> list:
+    """
+    Encodes instances into as few endpoint request bodies as possible, each one no larger than max_payload_bytes.
+    Instances keep their order, so predictions of consecutive requests can simply be concatenated.
+    :param instances: list of instances dictionaries
+    :param configuration: endpoint configuration, CONFIGURATION if None
+    :param max_payload_bytes: maximum size of a request body, MAX_PAYLOAD_BYTES if None
+    :return: a list of json encoded request bodies
+    """
+    return _pack_encoded([encode_instance(instance) for instance in instances], configuration, max_payload_bytes)
+
+
+def _pack_encoded(encoded_instances, configuration=None, max_payload_bytes=None) -> list:
+    head, separator, tail = encoding.request_parts(configuration or CONFIGURATION)
+    bounds = encoding.chunk_bounds([len(encoded) for encoded in encoded_instances], len(head) + len(tail),
+                                   len(separator), max_payload_bytes or MAX_PAYLOAD_BYTES)
+    return [head + separator.join(encoded_instances[start:stop]) + tail for start, stop in bounds]
+
+
+def get_adj_cls_from_s3(s3_resource, bucket_name, file_name, prefix='') -> dict:
+    """
+    Load stock json serialized data from S3 resource.
+    Parsed data are cached in memory and revalidated by means of the S3 object ETag once
+    DATA_CACHE_TTL seconds have passed since they have been downloaded or last checked.
+    Returned dictionaries are shared by all the callers and must not be modified.
     :param s3_resource: s3 resource to get data from
     :param bucket_name: s3 bucket to get data from
-    :return: json object containing Alphabet Inc. stock price adjusted close
+    :param file_name: name of the json file containing stock data
+    :param prefix: prefix of the path where the file is located
+    :return: dict object containing stock price adjusted close from S3 archived JSON
     """
-    googl_filename = "GOOGL.json"
-    complete_path = os.path.join(prefix, googl_filename)
-    json_object = s3_resource.Object(bucket_name, complete_path)
-    file_content = json_object.get()['Body'].read().decode('utf-8')
-    json_content = json.loads(file_content)
+    complete_path = os.path.join(prefix, file_name)
+    cache_key = (bucket_name, complete_path)
+    now = time.monotonic()
+    cached = _stock_data_cache.get(cache_key)
+    if cached is not None:
+        etag, checked_at, json_content = cached
+        if now - checked_at < DATA_CACHE_TTL:
+            metrics.increment('s3.cache_hits')
+            return json_content
+        with metrics.span('s3.revalidate'):
+            unchanged = s3_resource.Object(bucket_name, complete_path).e_tag == etag
+        if unchanged:
+            _stock_data_cache.put(cache_key, (etag, now, json_content))
+            return json_content
+
+    return _s3_flights.do(cache_key, _download_json, s3_resource, bucket_name, complete_path, cache_key, now)
+
+
+@metrics.timed('s3.download')
+def _download_json(s3_resource, bucket_name, complete_path, cache_key, now):
+    response = s3_resource.Object(bucket_name, complete_path).get()
+    json_content = encoding.loads(response['Body'].read())
+    _stock_data_cache.put(cache_key, (response.get('ETag'), now, json_content))
     return json_content
 
 
@@ -171,18 +504,12 @@ def get_stock_data(ticker_name, s3_resource, s3_bucket, prefix='') -> dict:
     Retrieves adjusted close data from S3
     :param s3_bucket: the S3 bucket containing the files to be
     :param s3_resource: the S3 resource to be used to access the file
-    :param ticker_name: ticker name, one among IBM, AAPL, AMZN, GOOGL
+    :param ticker_name: ticker name, one among the TICKER_REGISTRY ones
     :param prefix: the folder where the file is located inside the S3 bucket
     :return: dictionary data about the ticker_name stock, retrieved from an S3 resident JSON file.
     """
-    if ticker_name.upper() == "IBM":
-        return get_ibm_adj_cls_from_s3(s3_resource, s3_bucket, prefix)
-    elif ticker_name.upper() == "AMZN":
-        return get_amazon_adj_cls_from_s3(s3_resource, s3_bucket, prefix)
-    elif ticker_name.upper() == "AAPL":
-        return get_apple_adj_cls_from_s3(s3_resource, s3_bucket, prefix)
-    elif ticker_name.upper() == "GOOGL":
-        return get_google_adj_cls_from_s3(s3_resource, s3_bucket, prefix)
-    else:
+    file_name = TICKER_REGISTRY.get(ticker_name.upper())
+    if file_name is None:
         # TODO: add input error handling
         return None
+    return get_adj_cls_from_s3(s3_resource, s3_bucket, file_name, prefix)
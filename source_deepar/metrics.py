@@ -0,0 +1,232 @@
+r"""
+Lightweight latency instrumentation shared by the prediction Lambda function, the DeepAR predictor and the
+web application: spans time pipeline stages, counters count events and histograms keep the distribution
+of observed values, summarized by their 50th, 95th and 99th percentiles; components keeping their own
+counters (e.g. caches) register a stats function, whose result is part of every snapshot.
+Metrics are kept in an in-process registry and can be emitted as structured (json) log lines.
+When the registry is disabled, e.g. by setting the METRICS_ENABLED environment variable to 0, spans are
+a shared no-op context manager and no value is recorded.
+This module only depends on the Python standard library, so that it can be packaged with the Lambda function.
+"""
+from collections import deque
+import functools
+import json
+import math
+import os
+import threading
+import time
+
+# Number of most recent values each histogram computes its percentiles from
+HISTOGRAM_SIZE = 1024
+PERCENTILES = (50, 95, 99)
+
+
+class Histogram(object):
+    """
+    Distribution of observed values: count, sum and maximum of all of them,
+    and percentiles of the most recent ones
+    """
+
+    def __init__(self, size=HISTOGRAM_SIZE):
+        """
+        :param size: number of most recent values percentiles are computed from
+        """
+        self.count = 0
+        self.total = 0.
+        self.max = float('-inf')
+        self._values = deque(maxlen=size)
+
+    def observe(self, value):
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+        self._values.append(value)
+
+    def percentile(self, p):
+        """
+        :param p: percentile, between 0 and 100
+        :return: the nearest-rank percentile of the most recent values, None if there is none
+        """
+        return _nearest_rank(sorted(self._values), p)
+
+    def summary(self):
+        """
+        :return: a dictionary with "count", "mean", "max" and percentiles ("p50", "p95", "p99") keys
+        """
+        values = sorted(self._values)
+        summary = {"count": self.count, "mean": self.total / self.count if self.count else None,
+                   "max": self.max if self.count else None}
+        for p in PERCENTILES:
+            summary["p%d" % p] = _nearest_rank(values, p)
+        return summary
+
+
+def _nearest_rank(values, p):
+    if not values:
+        return None
+    return values[min(len(values), max(1, math.ceil(p / 100. * len(values)))) - 1]
+
+
+class _Span(object):
+    """
+    Context manager observing its own duration, in milliseconds, into a registry histogram
+    """
+    __slots__ = ('_registry', '_name', '_start')
+
+    def __init__(self, registry, name):
+        self._registry = registry
+        self._name = name
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        elapsed = (time.perf_counter() - self._start) * 1000.
+        self._registry.observe(self._name, elapsed)
+        if exc_type is not None:
+            self._registry.increment(self._name + '.errors')
+        if self._registry.log_spans:
+            self._registry.log({"span": self._name, "ms": round(elapsed, 3), "error": exc_type is not None})
+        return False
+
+
+class _NullSpan(object):
+    """
+    Context manager doing nothing, returned by disabled registries
+    """
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class MetricsRegistry(object):
+    """
+    A thread safe registry of counters and histograms, spans being recorded as histograms of durations in ms
+    """
+
+    def __init__(self, enabled=True, histogram_size=HISTOGRAM_SIZE, log_spans=False, log=print):
+        """
+        :param enabled: if False, nothing is recorded
+        :param histogram_size: number of most recent values each histogram computes its percentiles from
+        :param log_spans: if True, a structured log line is written for every span
+        :param log: function writing a log line
+        """
+        self.enabled = enabled
+        self.histogram_size = histogram_size
+        self.log_spans = log_spans
+        self._log = log
+        self._counters = {}
+        self._histograms = {}
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def span(self, name):
+        """
+        Times a block of code: `with registry.span("endpoint.invoke"): ...`
+        :param name: histogram name
+        :return: a context manager
+        """
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name)
+
+    def timed(self, name):
+        """
+        Decorator timing every call of a function
+        :param name: histogram name
+        """
+        def decorator(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return fn(*args, **kwargs)
+                with _Span(self, name):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def increment(self, name, value=1):
+        """
+        Increments a counter
+        :param name: counter name
+        :param value: increment
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def observe(self, name, value):
+        """
+        Records a value into a histogram
+        :param name: histogram name
+        :param value: observed value
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = Histogram(self.histogram_size)
+            histogram.observe(value)
+
+    def register_stats(self, name, stats):
+        """
+        Registers the stats of a component, e.g. `registry.register_stats("prediction_cache", cache.stats)`
+        :param name: stats name
+        :param stats: function returning a json serializable dictionary
+        """
+        with self._lock:
+            self._stats[name] = stats
+
+    def snapshot(self):
+        """
+        :return: a json serializable dictionary with "counters" (values keyed by name), "histograms"
+        (summaries keyed by name, as returned by Histogram.summary) and "stats" (registered stats keyed by name) keys
+        """
+        with self._lock:
+            snapshot = {"counters": dict(self._counters),
+                        "histograms": {name: histogram.summary() for name, histogram in self._histograms.items()}}
+            stats = dict(self._stats)
+        # stats functions take their own locks
+        snapshot["stats"] = {name: fn() for name, fn in stats.items()}
+        return snapshot
+
+    def log(self, record):
+        """
+        Writes a structured log line
+        :param record: a json serializable dictionary
+        """
+        self._log(json.dumps(record, sort_keys=True))
+
+    def emit(self):
+        """
+        Writes the registry snapshot as a structured log line, if the registry is enabled
+        """
+        if self.enabled:
+            self.log({"metrics": self.snapshot()})
+
+    def reset(self):
+        """
+        Clears counters and histograms, registered stats are kept
+        """
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+
+# Registry shared by all the modules of the process
+registry = MetricsRegistry(enabled=os.environ.get('METRICS_ENABLED', '1').lower() not in ('0', 'false', 'no'))
+span = registry.span
+timed = registry.timed
+increment = registry.increment
+observe = registry.observe
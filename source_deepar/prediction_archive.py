@@ -0,0 +1,282 @@
+r"""
+Archive of DeepAR forecasts, stored in a single SQLite database file instead of one json file per forecast.
+Each forecast is a row keyed by ticker, origin (first predicted date), horizon, last predicted date, dataset
+and model, whose predicted values and dates are stored as binary arrays: appending many forecasts is a single
+transaction, and a query on a ticker and origin date range is an index range scan returning arrays, with no
+file name to parse and no json to decode.
+Forecasts of the json files previously written under stock_deepar/json/prediction can be imported with
+`python -m source_deepar.prediction_archive stock_deepar/json/prediction stock_deepar/predictions.sqlite`.
+"""
+from collections import namedtuple
+from collections.abc import Sequence
+import argparse
+import glob
+import json
+import os
+import re
+import sqlite3
+import warnings
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_MODEL = 'deepar'
+# predicted periods: test set, validation set, and the market days following the validation set
+DATASETS = ('test', 'valid', 'future')
+# dataset of the tags found in the names of prediction files, e.g. "IBM_valid2021-01-21 - 2021-02-18.json"
+# or "IBM_2021-01-14 - 2021-02-11_fromTrain.json"
+FILE_TAGS = {'': 'test', 'valid': 'valid', 'fromtrain': 'test', 'fromtest': 'valid', 'fromvalid': 'future'}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS forecasts (
+    ticker TEXT NOT NULL,
+    origin TEXT NOT NULL,
+    horizon INTEGER NOT NULL,
+    last_date TEXT NOT NULL,
+    dataset TEXT NOT NULL,
+    model TEXT NOT NULL,
+    quantiles TEXT NOT NULL,
+    dates BLOB NOT NULL,
+    "values" BLOB NOT NULL,
+    PRIMARY KEY (ticker, origin, horizon, last_date, dataset, model)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS forecasts_origin ON forecasts (origin, ticker);
+"""
+_DATES_DTYPE = np.dtype('<i4')
+_VALUES_DTYPE = np.dtype('<f4')
+
+# Forecasts returned by PredictionArchive.query, one per matching archive row:
+# tickers, datasets and models are arrays of strings, origins a datetime64[D] array,
+# dates a datetime64[D] array shaped (forecasts, horizon) and values a float32 array shaped
+# (forecasts, quantiles, horizon), as ForecastBatch values are, quantiles being listed in `quantiles`
+ArchivedForecasts = namedtuple('ArchivedForecasts',
+                               ['tickers', 'origins', 'datasets', 'models', 'quantiles', 'dates', 'values'])
+
+
+class PredictionArchive(object):
+    """
+    SQLite archive of forecasts, indexed by ticker, origin, horizon, last predicted date, dataset and model.
+    Forecasts of the same origin and horizon whose predicted dates differ (e.g. calendar days and market days)
+    are kept apart.
+    Values are stored as float32, the precision DeepAR endpoints predict with.
+    """
+
+    def __init__(self, path):
+        """
+        :param path: database file, created if it does not exist, or ':memory:'
+        """
+        self.path = path
+        self._connection = sqlite3.connect(path)
+        self._connection.executescript(_SCHEMA)
+
+    def close(self):
+        self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def __len__(self):
+        return self._connection.execute("SELECT COUNT(*) FROM forecasts").fetchone()[0]
+
+    def append(self, tickers, forecasts, dataset='test', model=DEFAULT_MODEL):
+        """
+        Stores forecasts, replacing the archived ones with the same key; forecasts sharing a key within
+        the same call are ambiguous and raise a ValueError, nothing being stored
+        :param tickers: a ticker name or a list of ticker names, one per forecast
+        :param forecasts: a ForecastBatch or a list of dataframes (or a single dataframe) with one column per
+        quantile and predicted dates as index, as returned by DeepARPredictor predict and predict_bulk
+        :param dataset: predicted dataset, one among DATASETS
+        :param model: name of the model that made the forecasts
+        :return: number of rows stored, replaced ones included
+        """
+        if dataset not in DATASETS:
+            raise ValueError("dataset must be one among %s" % ', '.join(DATASETS))
+        if isinstance(forecasts, pd.DataFrame):
+            forecasts = [forecasts]
+        if isinstance(tickers, str):
+            tickers = [tickers]
+        if len(tickers) != len(forecasts):
+            raise ValueError("%d tickers given for %d forecasts" % (len(tickers), len(forecasts)))
+        if isinstance(forecasts, Sequence):
+            rows = [_encode_row(ticker.upper(), df.index, [str(q) for q in df.columns], df.to_numpy().T, dataset,
+                                model) for ticker, df in zip(tickers, forecasts)]
+        else:
+            dates = forecasts.dates()
+            rows = [_encode_row(ticker.upper(), dates[k], forecasts.quantiles, forecasts.values[k], dataset, model)
+                    for k, ticker in enumerate(tickers)]
+        keys = set()
+        for row in rows:
+            if row[:6] in keys:
+                raise ValueError("%s forecasts from %s to %s are given twice" % (row[0], row[1], row[3]))
+            keys.add(row[:6])
+        with self._connection:
+            cursor = self._connection.executemany(
+                'INSERT OR REPLACE INTO forecasts VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+        return cursor.rowcount
+
+    def query(self, tickers=None, start=None, end=None, horizon=None, dataset=None, model=None, quantiles=None):
+        """
+        Retrieves the forecasts whose origin lies in a date range, oldest origin first
+        :param tickers: a ticker name or a list of ticker names, all the archived ones if None
+        :param start: first origin date (included), no lower bound if None
+        :param end: last origin date (included), no upper bound if None
+        :param horizon: number of predicted dates; it must be given if the matching forecasts have several ones
+        :param dataset: predicted dataset, any if None
+        :param model: model name, any if None
+        :param quantiles: list of quantiles names, the ones of the first forecast if None
+        :return: an ArchivedForecasts tuple
+        """
+        conditions, parameters = [], []
+        if tickers is not None:
+            tickers = [tickers] if isinstance(tickers, str) else list(tickers)
+            conditions.append("ticker IN (%s)" % ', '.join('?' * len(tickers)))
+            parameters.extend(t.upper() for t in tickers)
+        if start is not None:
+            conditions.append("origin >= ?")
+            parameters.append(_day(start))
+        if end is not None:
+            conditions.append("origin <= ?")
+            parameters.append(_day(end))
+        for column, value in (('horizon', horizon), ('dataset', dataset), ('model', model)):
+            if value is not None:
+                conditions.append("%s = ?" % column)
+                parameters.append(value)
+        sql = 'SELECT ticker, origin, horizon, dataset, model, quantiles, dates, "values" FROM forecasts'
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY origin, ticker, last_date, dataset, model"
+        rows = self._connection.execute(sql, parameters).fetchall()
+
+        horizons = set(row[2] for row in rows)
+        if len(horizons) > 1:
+            raise ValueError("forecasts with horizons %s match, a horizon must be given" % sorted(horizons))
+        size = horizons.pop() if horizons else (horizon or 0)
+        if quantiles is None:
+            quantiles = rows[0][5].split(',') if rows else []
+        quantiles = [str(q) for q in quantiles]
+        dates = np.empty((len(rows), size), dtype=_DATES_DTYPE)
+        values = np.empty((len(rows), len(quantiles), size), dtype=_VALUES_DTYPE)
+        for k, row in enumerate(rows):
+            stored_quantiles = row[5].split(',')
+            missing = [q for q in quantiles if q not in stored_quantiles]
+            if missing:
+                raise ValueError("%s forecast from %s lacks quantiles %s" % (row[0], row[1], ', '.join(missing)))
+            dates[k] = np.frombuffer(row[6], dtype=_DATES_DTYPE)
+            stored = np.frombuffer(row[7], dtype=_VALUES_DTYPE).reshape(len(stored_quantiles), size)
+            values[k] = stored if quantiles == stored_quantiles else stored[[stored_quantiles.index(q) for q in quantiles]]
+        return ArchivedForecasts(np.array([row[0] for row in rows], dtype=str),
+                                 np.array([row[1] for row in rows], dtype='datetime64[D]'),
+                                 np.array([row[3] for row in rows], dtype=str),
+                                 np.array([row[4] for row in rows], dtype=str),
+                                 quantiles, dates.astype('datetime64[D]'), values)
+
+    def frame(self, ticker, origin, horizon=None, dataset=None, model=None):
+        """
+        Retrieves a single forecast in the format returned by DeepARPredictor and consumed by display_quantiles
+        :param ticker: ticker name
+        :param origin: first predicted date
+        :param horizon: number of predicted dates, any if None
+        :param dataset: predicted dataset, any if None
+        :param model: model name, any if None
+        :return: a dataframe with one column per quantile, indexed by predicted date
+        """
+        forecasts = self.query(ticker, start=origin, end=origin, horizon=horizon, dataset=dataset, model=model)
+        if len(forecasts.values) != 1:
+            raise KeyError("%d %s forecasts from %s are archived, one expected" % (len(forecasts.values), ticker,
+                                                                                    _day(origin)))
+        return pd.DataFrame(forecasts.values[0].T, index=pd.DatetimeIndex(forecasts.dates[0]),
+                            columns=forecasts.quantiles)
+
+
+def _day(date):
+    return pd.Timestamp(date).strftime('%Y-%m-%d')
+
+
+def _encode_row(ticker, dates, quantiles, values, dataset, model):
+    days = np.asarray(dates, dtype='datetime64[D]')
+    values = np.ascontiguousarray(values, dtype=_VALUES_DTYPE)
+    return (ticker, str(days[0]), len(days), str(days[-1]), dataset, model, ','.join(quantiles),
+            days.astype(_DATES_DTYPE).tobytes(), values.tobytes())
+
+
+def parse_prediction_file_name(file_name):
+    """
+    Extracts ticker and dataset from the name of a stock_deepar/json/prediction file, whatever its layout, e.g.
+    "IBM_2021-01-14 - 2021-02-11.json", "IBM_valid2021-02-22 - 2021-03-19.json" or
+    "AAPL_2021-02-22 - 2021-03-19_valid.json"
+    :param file_name: file name, or path
+    :return: ticker and dataset
+    """
+    ticker, _, rest = os.path.splitext(os.path.basename(file_name))[0].partition('_')
+    # dates are dropped, the predicted ones being read from the file itself
+    tag = re.sub(r'[\d\s:.\-_]+', '', rest).lower()
+    if not ticker or tag not in FILE_TAGS:
+        raise ValueError("unknown prediction file name layout: %s" % file_name)
+    return ticker.upper(), FILE_TAGS[tag]
+
+
+def read_prediction_file(path):
+    """
+    Reads a forecast written by DataFrame.to_json, either keyed by quantile then date (orient='columns')
+    or by date then quantile (orient='index'), dates being iso strings or epoch milliseconds
+    :param path: json file
+    :return: a dataframe with one column per quantile, indexed by predicted date
+    """
+    with open(path) as fp:
+        data = json.load(fp)
+    df = pd.DataFrame(data)
+    if not all(_is_quantile(q) for q in df.columns):
+        df = df.T
+    if all(str(d).isdigit() for d in df.index):
+        index = pd.to_datetime([int(d) for d in df.index], unit='ms')
+    else:
+        index = pd.to_datetime(list(df.index)).tz_localize(None)
+    df.index = index
+    df = df.sort_index()
+    return df[sorted(df.columns, key=float)].astype(np.float64)
+
+
+def _is_quantile(name):
+    try:
+        return 0. <= float(name) <= 1. and not str(name).isdigit()
+    except ValueError:
+        return False
+
+
+def import_prediction_files(archive, directory, model=DEFAULT_MODEL):
+    """
+    Imports the forecasts of all the json files of a directory, with a single transaction per dataset
+    :param archive: a PredictionArchive
+    :param directory: directory of prediction files, e.g. stock_deepar/json/prediction
+    :param model: name of the model that made the forecasts
+    :return: number of stored rows; files whose forecast has the same key as another file one
+    (same ticker, dataset and predicted dates) are reported by a warning, the last file name being stored
+    """
+    by_dataset = {}
+    for path in sorted(glob.glob(os.path.join(directory, '*.json'))):
+        ticker, dataset = parse_prediction_file_name(path)
+        df = read_prediction_file(path)
+        key = (ticker, _day(df.index[0]), len(df), _day(df.index[-1]))
+        forecasts = by_dataset.setdefault(dataset, {})
+        if key in forecasts:
+            warnings.warn("%s and %s hold %s forecasts from %s to %s, the former is not imported" %
+                          (forecasts[key][0], path, ticker, key[1], key[3]))
+        forecasts[key] = (path, df)
+    return sum(archive.append([key[0] for key in forecasts], [df for _, df in forecasts.values()],
+                              dataset=dataset, model=model)
+               for dataset, forecasts in by_dataset.items())
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Imports stock_deepar prediction json files into an archive')
+    parser.add_argument('prediction_dir', nargs='?', default=os.path.join('stock_deepar', 'json', 'prediction'))
+    parser.add_argument('archive', nargs='?', default=os.path.join('stock_deepar', 'predictions.sqlite'))
+    parser.add_argument('--model', default=DEFAULT_MODEL)
+    args = parser.parse_args()
+    with PredictionArchive(args.archive) as prediction_archive:
+        imported = import_prediction_files(prediction_archive, args.prediction_dir, model=args.model)
+        print("stored %d forecasts into %s, %d archived" % (imported, args.archive, len(prediction_archive)))
@@ -0,0 +1,145 @@
+from array import array
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from source_deepar.caching import LRUCache, PredictionCache, SingleFlight, pack_samples, request_fingerprint
+
+CONFIGURATION = {"num_samples": 100, "output_types": ["quantiles"], "quantiles": ["0.1", "0.5", "0.9"]}
+
+
+class LRUCacheTestCase(unittest.TestCase):
+    def test_eviction(self):
+        cache = LRUCache(maxsize=2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        cache.get('a')
+        cache.put('c', 3)
+        self.assertNotIn('b', cache)
+        self.assertListEqual([cache.get(k) for k in 'ac'], [1, 3])
+
+    def test_expiration(self):
+        cache = LRUCache(ttl=10)
+        with mock.patch('source_deepar.caching.time.monotonic', return_value=100.0):
+            cache.put('a', 1)
+        with mock.patch('source_deepar.caching.time.monotonic', return_value=109.0):
+            self.assertEqual(cache.get('a'), 1)
+        with mock.patch('source_deepar.caching.time.monotonic', return_value=110.0):
+            self.assertNotIn('a', cache)
+            self.assertIsNone(cache.get('a'))
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+
+class PredictionCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.prediction = {"quantiles": {"0.5": [1.0, 2.0]}}
+
+    def test_fingerprint(self):
+        instance = b'{"start": "2021-01-04", "target": [1.0, 2.0]}'
+        key = request_fingerprint('endpoint', CONFIGURATION, instance)
+        self.assertEqual(key, request_fingerprint('endpoint', dict(reversed(list(CONFIGURATION.items()))), instance))
+        self.assertNotEqual(key, request_fingerprint('other-endpoint', CONFIGURATION, instance))
+        self.assertNotEqual(key, request_fingerprint('endpoint', dict(CONFIGURATION, num_samples=200), instance))
+        self.assertNotEqual(key, request_fingerprint('endpoint', CONFIGURATION, instance.replace(b'2.0', b'2.5')))
+
+    def test_memory_tier(self):
+        cache = PredictionCache(maxsize=4)
+        self.assertIsNone(cache.get('key'))
+        cache.put('key', self.prediction)
+        self.assertEqual(cache.get('key'), self.prediction)
+        self.assertDictEqual(cache.stats(), {'hits': 1, 'disk_hits': 0, 'misses': 1, 'hit_ratio': 0.5})
+
+    def test_disk_tier_is_shared(self):
+        PredictionCache(cache_dir=self.tmp_dir.name).put('key', self.prediction)
+        cache = PredictionCache(cache_dir=self.tmp_dir.name)
+        self.assertEqual(cache.get('key'), self.prediction)
+        self.assertEqual(cache.get('key'), self.prediction)
+        self.assertDictEqual(cache.stats(), {'hits': 2, 'disk_hits': 1, 'misses': 0, 'hit_ratio': 1.0})
+        self.assertListEqual(os.listdir(self.tmp_dir.name), ['key.json'])
+
+    def test_samples_are_float32(self):
+        prediction = {"samples": [[1.0, 2.5], [0.1, 3.0]]}
+        stored = PredictionCache(cache_dir=self.tmp_dir.name).put('key', prediction)
+        self.assertListEqual([path.typecode for path in stored["samples"]], ['f', 'f'])
+        self.assertEqual(stored["samples"][1][0], array('f', [0.1])[0])
+        self.assertIs(pack_samples(stored), stored)
+        self.assertListEqual(PredictionCache(cache_dir=self.tmp_dir.name).get('key')["samples"], stored["samples"])
+        with open(os.path.join(self.tmp_dir.name, 'key.json')) as fp:
+            self.assertNotIn("samples", json.load(fp))
+
+    def test_disk_tier_expiration(self):
+        PredictionCache(ttl=60, cache_dir=self.tmp_dir.name).put('key', self.prediction)
+        path = os.path.join(self.tmp_dir.name, 'key.json')
+        os.utime(path, (os.path.getatime(path), os.path.getmtime(path) - 61))
+        self.assertIsNone(PredictionCache(ttl=60, cache_dir=self.tmp_dir.name).get('key'))
+        self.assertListEqual(os.listdir(self.tmp_dir.name), [])
+
+    def test_disk_tier_size(self):
+        cache = PredictionCache(cache_dir=self.tmp_dir.name, disk_maxsize=2)
+        for k, key in enumerate(['a', 'b', 'c']):
+            cache.put(key, self.prediction)
+            path = os.path.join(self.tmp_dir.name, key + '.json')
+            os.utime(path, (os.path.getatime(path), os.path.getmtime(path) - 10 + k))
+        self.assertListEqual(sorted(os.listdir(self.tmp_dir.name)), ['b.json', 'c.json'])
+        self.assertIsNone(PredictionCache(cache_dir=self.tmp_dir.name).get('a'))
+
+
+class SingleFlightTestCase(unittest.TestCase):
+    def setUp(self):
+        self.flights = SingleFlight()
+        self.executions = []
+        self.release = threading.Event()
+
+    def slow(self, value):
+        self.executions.append(value)
+        self.release.wait(5)
+        return value * 2
+
+    def test_concurrent_calls_are_coalesced(self):
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            futures = [executor.submit(self.flights.do, 'key', self.slow, 21) for _ in range(8)]
+            deadline = time.monotonic() + 5
+            while self.flights.stats()['calls'] < 8 and time.monotonic() < deadline:
+                time.sleep(0.001)
+            self.release.set()
+            self.assertListEqual([f.result() for f in futures], [42] * 8)
+        self.assertListEqual(self.executions, [21])
+        self.assertDictEqual(self.flights.stats(), {'calls': 8, 'executions': 1, 'coalesced': 7})
+        # completed calls are not cached
+        self.assertEqual(self.flights.do('key', self.slow, 1), 2)
+
+    def test_do_many(self):
+        self.release.set()
+        computed = []
+
+        def compute(keys):
+            computed.append(keys)
+            return [key.upper() for key in keys]
+        self.assertListEqual(self.flights.do_many(['a', 'b', 'a'], compute), ['A', 'B', 'A'])
+        self.assertListEqual(computed, [['a', 'b']])
+        self.assertDictEqual(self.flights.stats(), {'calls': 3, 'executions': 2, 'coalesced': 1})
+
+    def test_errors_are_shared(self):
+        def fail():
+            self.release.wait(5)
+            raise KeyError('missing')
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            futures = [executor.submit(self.flights.do, 'key', fail) for _ in range(2)]
+            deadline = time.monotonic() + 5
+            while self.flights.stats()['calls'] < 2 and time.monotonic() < deadline:
+                time.sleep(0.001)
+            self.release.set()
+            for future in futures:
+                self.assertRaises(KeyError, future.result)
+        self.assertEqual(self.flights.stats()['executions'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
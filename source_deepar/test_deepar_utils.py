@@ -0,0 +1,362 @@
+import io
+import json
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+from source_deepar import metrics
+from source_deepar.caching import PredictionCache
+from source_deepar.deepar_utils import series_to_json_obj, write_dar_jsonl, DeepARPredictor, ForecastBatch, \
+    SampleForecast
+from utils.testing import random_walk_bars
+
+
+def sample_frame(size=60, seed=0):
+    # prices are float32 values, as the ones sent to the endpoint by default
+    prices = random_walk_bars(size, seed)['Adj Close'].astype(np.float32).astype(np.float64)
+    return pd.DataFrame({'Adj Close': prices, '10_ac_ma': prices.rolling(10).mean().bfill()})
+
+
+class FakeRuntimeClient(object):
+    """
+    Local stand-in for a SageMaker runtime client, answering with one prediction per instance
+    whose quantiles are made of the instance last target value, and whose i-th sample path
+    is made of the instance last target value plus i. Like DeepAR, it reads values as float32.
+    """
+
+    def __init__(self, prediction_length=20):
+        self.prediction_length = prediction_length
+        self.requests = []
+        self.bodies = []
+
+    def invoke_endpoint(self, **kwargs):
+        request = json.loads(kwargs['Body'].decode('utf-8'))
+        self.requests.append(request)
+        self.bodies.append(kwargs['Body'])
+        configuration = request["configuration"]
+        for instance in request["instances"]:
+            instance["target"] = np.asarray(instance["target"], dtype=np.float32).tolist()
+        if configuration["output_types"] == ["samples"]:
+            predictions = [{"samples": [[instance["target"][-1] + i] * self.prediction_length
+                                        for i in range(configuration["num_samples"])]}
+                           for instance in request["instances"]]
+        else:
+            predictions = [{"quantiles": {q: [instance["target"][-1]] * self.prediction_length
+                                          for q in configuration["quantiles"]}}
+                           for instance in request["instances"]]
+        return {'Body': io.BytesIO(json.dumps({"predictions": predictions}).encode('utf-8'))}
+
+
+class FakeEndpointError(Exception):
+    """
+    Mimics a botocore ClientError raised by the runtime client
+    """
+
+    def __init__(self, code, status):
+        super().__init__(code)
+        self.response = {'Error': {'Code': code}, 'ResponseMetadata': {'HTTPStatusCode': status}}
+
+
+class ThrottlingRuntimeClient(FakeRuntimeClient):
+    """
+    Fake runtime client failing the first `failures` invocations with the given error code
+    """
+
+    def __init__(self, prediction_length=20, failures=1, code='ThrottlingException', status=400):
+        super().__init__(prediction_length)
+        self.failures = failures
+        self.error = (code, status)
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def invoke_endpoint(self, **kwargs):
+        with self.lock:
+            self.calls += 1
+            fail = self.calls <= self.failures
+        if fail:
+            raise FakeEndpointError(*self.error)
+        return super().invoke_endpoint(**kwargs)
+
+
+class FakeSession(object):
+    def __init__(self, runtime_client):
+        self.sagemaker_runtime_client = runtime_client
+
+
+def fake_predictor(prediction_length=20, prediction_cache=None, **kwargs):
+    runtime = FakeRuntimeClient(prediction_length)
+    predictor = DeepARPredictor('fake-endpoint', FakeSession(runtime), prediction_cache=prediction_cache)
+    predictor.set_prediction_parameters('D', prediction_length, **kwargs)
+    return predictor, runtime
+
+
+class DeepARPredictorTestCase(unittest.TestCase):
+    def test_context_truncation(self):
+        frames = [sample_frame(size=500, seed=i) for i in range(2)]
+        predictor, runtime = fake_predictor(context_points=100)
+        predictions = predictor.predict(frames)
+        instances = runtime.requests[0]["instances"]
+        self.assertListEqual([len(instance["target"]) for instance in instances], [100, 100])
+        self.assertEqual(instances[0]["start"], str(frames[0].index[-100]))
+        self.assertEqual(predictions[1]['0.5'].iloc[0], frames[1]['Adj Close'].iloc[-1])
+
+    def test_whole_time_series(self):
+        frame = sample_frame(size=500)
+        predictor, runtime = fake_predictor(context_points=None)
+        predictor.predict([frame])
+        self.assertEqual(len(runtime.requests[0]["instances"][0]["target"]), 500)
+
+    def test_stage_metrics(self):
+        predictor, _ = fake_predictor()
+        metrics.registry.reset()
+        with mock.patch.object(metrics.registry, 'enabled', True):
+            predictor.predict([sample_frame(size=60)])
+        histograms = metrics.registry.snapshot()["histograms"]
+        self.assertEqual(histograms["endpoint.invoke"]["count"], 1)
+        # the response json parse and the dataframes decoding are told apart
+        self.assertEqual(histograms["predictor.parse"]["count"], 1)
+        self.assertEqual(histograms["predictor.decode_batch"]["count"], 1)
+        self.assertNotIn("predictor.decode", histograms)
+
+    def test_trading_calendar(self):
+        # the frame ends on Thursday 2021-04-01, followed by Good Friday and a week end
+        frame = sample_frame(size=64)
+        predictor, _ = fake_predictor(prediction_length=3, calendar_name='NYSE')
+        prediction = predictor.predict([frame])[0]
+        self.assertListEqual(list(prediction.index), list(pd.to_datetime(['2021-04-05', '2021-04-06', '2021-04-07'])))
+        batch = predictor.predict_bulk([frame, sample_frame(size=60)], as_batch=True)
+        self.assertEqual(batch.dates()[0, 0], np.datetime64('2021-04-05'))
+        self.assertEqual(batch.dates()[1, 0], np.datetime64('2021-03-29'))
+        self.assertListEqual(list(batch.to_frame().loc[0].index), list(prediction.index))
+        samples = predictor.predict_samples([frame], num_samples=2).quantiles()
+        self.assertListEqual(list(samples.index(0)), list(prediction.index))
+
+    def test_dynamic_features(self):
+        frames = [sample_frame(size=80, seed=i) for i in range(2)]
+        predictor, runtime = fake_predictor(prediction_length=5, context_points=50, dyn_feat=['10_ac_ma'],
+                                            horizon_policy='recompute')
+        predictor.predict(frames)
+        instance = runtime.requests[0]["instances"][1]
+        self.assertEqual(len(instance["dynamic_feat"][0]), 55)
+        np.testing.assert_allclose(instance["dynamic_feat"][0][:50], frames[1]['10_ac_ma'].iloc[-50:], rtol=1e-6)
+        # the moving average of a projection holding the last price moves toward it
+        last = frames[1]['Adj Close'].iloc[-1]
+        expected = (frames[1]['Adj Close'].iloc[-9:].sum() + last) / 10
+        self.assertAlmostEqual(instance["dynamic_feat"][0][50], expected, places=4)
+
+
+class PredictBulkTestCase(unittest.TestCase):
+    def setUp(self):
+        self.frames = [sample_frame(size=50 + i, seed=i) for i in range(23)]
+
+    def assert_in_order(self, predictions):
+        self.assertEqual(len(predictions), len(self.frames))
+        for frame, prediction in zip(self.frames, predictions):
+            self.assertEqual(prediction['0.5'].iloc[0], frame['Adj Close'].iloc[-1])
+            self.assertEqual(prediction.index[0], frame.index[-1] + pd.Timedelta(1, unit='D'))
+
+    def test_matches_predict(self):
+        predictor, runtime = fake_predictor()
+        expected = predictor.predict(self.frames)
+        predictions = predictor.predict_bulk(self.frames)
+        self.assertEqual(len(runtime.requests), 2)
+        self.assertEqual(runtime.requests[0], runtime.requests[1])
+        for left, right in zip(expected, predictions):
+            pd.testing.assert_frame_equal(left, right)
+
+    def test_split_by_instance_count(self):
+        predictor, runtime = fake_predictor()
+        predictions = predictor.predict_bulk(self.frames, max_instances=5, max_workers=3)
+        self.assertListEqual(sorted(len(request["instances"]) for request in runtime.requests), [3, 5, 5, 5, 5])
+        self.assert_in_order(predictions)
+
+    def test_split_by_payload_size(self):
+        predictor, runtime = fake_predictor()
+        max_payload_bytes = 4096
+        predictions = predictor.predict_bulk(self.frames, max_payload_bytes=max_payload_bytes, max_instances=None)
+        self.assertGreater(len(runtime.requests), 1)
+        for body in runtime.bodies:
+            self.assertLessEqual(len(body), max_payload_bytes)
+        self.assert_in_order(predictions)
+
+    def test_oversized_instance(self):
+        predictor, _ = fake_predictor()
+        with self.assertRaises(ValueError):
+            predictor.predict_bulk(self.frames, max_payload_bytes=512)
+
+    def test_throttled_requests_are_retried(self):
+        runtime = ThrottlingRuntimeClient(failures=3)
+        predictor = DeepARPredictor('fake-endpoint', FakeSession(runtime))
+        predictions = predictor.predict_bulk(self.frames, max_instances=4, backoff=0)
+        self.assertEqual(runtime.calls, 6 + 3)
+        self.assert_in_order(predictions)
+
+    def test_other_errors_are_raised(self):
+        runtime = ThrottlingRuntimeClient(code='ValidationError')
+        predictor = DeepARPredictor('fake-endpoint', FakeSession(runtime))
+        with self.assertRaises(FakeEndpointError):
+            predictor.predict_bulk(self.frames, max_workers=1, backoff=0)
+        self.assertEqual(runtime.calls, 1)
+
+    def test_retries_are_bounded(self):
+        runtime = ThrottlingRuntimeClient(failures=10, code='ServiceUnavailable', status=503)
+        predictor = DeepARPredictor('fake-endpoint', FakeSession(runtime))
+        with self.assertRaises(FakeEndpointError):
+            predictor.predict_bulk(self.frames[:1], max_retries=2, backoff=0)
+        self.assertEqual(runtime.calls, 3)
+
+
+class PredictionCacheTestCase(unittest.TestCase):
+    def test_repeated_series_are_not_sent(self):
+        frames = [sample_frame(size=60, seed=i) for i in range(4)]
+        predictor, runtime = fake_predictor(prediction_cache=PredictionCache())
+        expected = predictor.predict(frames[:2])
+        predictions = predictor.predict_bulk(frames)
+        self.assertListEqual([len(request["instances"]) for request in runtime.requests], [2, 2])
+        self.assertEqual(runtime.requests[1]["instances"][0]["target"][-1], frames[2]['Adj Close'].iloc[-1])
+        for left, right in zip(expected, predictions):
+            pd.testing.assert_frame_equal(left, right)
+        self.assertEqual(predictor.prediction_cache.stats()['hits'], 2)
+
+    def test_configuration_is_part_of_the_key(self):
+        frames = [sample_frame()]
+        predictor, runtime = fake_predictor(prediction_cache=PredictionCache())
+        predictor.predict(frames)
+        predictor.predict(frames, quantiles=["0.5"])
+        predictor.predict(frames)
+        self.assertEqual(len(runtime.requests), 2)
+
+
+class ForecastBatchTestCase(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.quantiles = ["0.1", "0.5", "0.9"]
+        self.predictions = [{"quantiles": {q: rng.normal(size=5).tolist() for q in self.quantiles}}
+                            for _ in range(4)]
+        self.prediction_times = pd.date_range('2021-03-01', periods=4, freq='7D')
+        self.batch = ForecastBatch.from_predictions(self.predictions, self.prediction_times)
+
+    def test_frames_match_legacy_decoding(self):
+        self.assertEqual(self.batch.values.shape, (4, 3, 5))
+        self.assertEqual(len(self.batch.frames), 4)
+        for k, frame in enumerate(self.batch.frames):
+            expected = pd.DataFrame(data=self.predictions[k]["quantiles"],
+                                    index=pd.date_range(start=self.prediction_times[k], freq='D', periods=5))
+            pd.testing.assert_frame_equal(frame, expected)
+        pd.testing.assert_frame_equal(self.batch.frames[-1], self.batch.frames[3])
+        self.assertEqual(len(self.batch.frames[1:3]), 2)
+        with self.assertRaises(IndexError):
+            self.batch.frames[4]
+
+    def test_frames_do_not_share_memory(self):
+        self.batch.frames[0].iloc[0, 0] = np.nan
+        self.assertFalse(np.isnan(self.batch.values).any())
+
+    def test_to_frame(self):
+        frame = self.batch.to_frame(names=['IBM', 'AAPL', 'AMZN', 'GOOGL'])
+        self.assertListEqual(list(frame.columns), self.quantiles)
+        self.assertEqual(len(frame), 20)
+        pd.testing.assert_frame_equal(frame.loc['AMZN'], self.batch.frames[2].rename_axis('date'),
+                                      check_freq=False)
+        np.testing.assert_array_equal(self.batch.quantile("0.9")[1], self.predictions[1]["quantiles"]["0.9"])
+
+    def test_empty(self):
+        batch = ForecastBatch.from_predictions([], [], quantiles=self.quantiles)
+        self.assertEqual(batch.values.shape, (0, 3, 0))
+        self.assertListEqual(list(batch.frames), [])
+        self.assertEqual(len(batch.to_frame()), 0)
+
+    def test_predictor_as_batch(self):
+        frames = [sample_frame(size=60, seed=i) for i in range(3)]
+        predictor, _ = fake_predictor(prediction_length=10)
+        batch = predictor.predict_bulk(frames, max_instances=2, as_batch=True)
+        self.assertIsInstance(batch, ForecastBatch)
+        np.testing.assert_array_equal(batch.quantile("0.5")[:, 0], [f['Adj Close'].iloc[-1] for f in frames])
+        for left, right in zip(batch.frames, predictor.predict(frames)):
+            pd.testing.assert_frame_equal(left, right)
+
+    def test_predictor_frames_are_kept(self):
+        predictor, _ = fake_predictor(prediction_length=10)
+        predictions = predictor.predict([sample_frame(size=60)])
+        self.assertNotIsInstance(predictions, list)
+        index = pd.date_range('2022-01-03', periods=10, freq='B')
+        predictions[0].index = index
+        self.assertIs(predictions[-1], predictions[0])
+        self.assertListEqual(list(predictions[0].index), list(index))
+
+
+class SampleForecastTestCase(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.samples = rng.normal(100, 5, size=(3, 200, 10))
+        self.forecast = SampleForecast(self.samples, pd.date_range('2021-03-01', periods=3, freq='D'))
+
+    def test_statistics(self):
+        self.assertEqual(self.forecast.samples.dtype, np.float32)
+        batch = self.forecast.quantiles([0.1, "0.5", 0.9])
+        self.assertListEqual(batch.quantiles, ["0.1", "0.5", "0.9"])
+        np.testing.assert_allclose(batch.quantile("0.9"), np.quantile(self.samples, 0.9, axis=1), rtol=1e-6)
+        np.testing.assert_allclose(self.forecast.mean(), self.samples.mean(axis=1), rtol=1e-6)
+        np.testing.assert_allclose(self.forecast.exceedance(105), (self.samples > 105).mean(axis=1))
+        np.testing.assert_allclose(self.forecast.exceedance([90, 100, 110])[2], (self.samples[2] > 110).mean(axis=0))
+
+    def test_predict_samples(self):
+        frames = [sample_frame(size=60, seed=i) for i in range(3)]
+        predictor, runtime = fake_predictor(prediction_length=10, prediction_cache=PredictionCache())
+        forecast = predictor.predict_samples(frames, num_samples=11)
+        self.assertEqual(forecast.samples.shape, (3, 11, 10))
+        last = np.array([f['Adj Close'].iloc[-1] for f in frames], dtype=np.float32)
+        np.testing.assert_allclose(forecast.quantiles(["0.5"]).quantile("0.5")[:, 0], last + 5, rtol=1e-6)
+        predictor.predict_samples(frames, num_samples=11)
+        self.assertEqual(len(runtime.requests), 1)
+        self.assertDictEqual(runtime.requests[0]["configuration"], {"num_samples": 11, "output_types": ["samples"]})
+
+
+class WriteDarJsonlTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.file_path = os.path.join(self.tmp_dir.name, 'train.json')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def read_lines(self):
+        with open(self.file_path) as fp:
+            return [json.loads(line) for line in fp]
+
+    def test_matches_series_to_json_obj(self):
+        frames = [sample_frame(seed=i) for i in range(3)]
+        count = write_dar_jsonl(iter(frames), self.file_path, dyn_feat=['10_ac_ma'])
+        self.assertEqual(count, 3)
+        for obj, df in zip(self.read_lines(), frames):
+            self.assertDictEqual(obj, series_to_json_obj(df, target_column='Adj Close', dyn_feat=['10_ac_ma']))
+
+    def test_dynamic_features_horizon(self):
+        df = sample_frame(size=30)
+        json_obj = series_to_json_obj(df, target_column='Adj Close', dyn_feat=['10_ac_ma'], prediction_length=3)
+        self.assertEqual(len(json_obj["target"]), 30)
+        self.assertListEqual(json_obj["dynamic_feat"][0], list(df['10_ac_ma']) + [df['10_ac_ma'].iloc[-1]] * 3)
+
+    def test_arrays_and_missing_values(self):
+        write_dar_jsonl([{"start": "2021-01-04 00:00:00", "target": np.array([1.5, np.nan, 2.25]),
+                          "dynamic_feat": np.ones(3)}], self.file_path)
+        obj = self.read_lines()[0]
+        self.assertListEqual(obj["target"], [1.5, "NaN", 2.25])
+        self.assertListEqual(obj["dynamic_feat"], [[1.0, 1.0, 1.0]])
+
+    def test_rounding_and_float32(self):
+        df = sample_frame()
+        write_dar_jsonl([df, df], self.file_path, decimals=2)
+        np.testing.assert_allclose(self.read_lines()[0]["target"], df['Adj Close'].round(2))
+        write_dar_jsonl([df['Adj Close']], self.file_path, float32=True)
+        target = np.array(self.read_lines()[0]["target"], dtype=np.float32)
+        np.testing.assert_array_equal(target, df['Adj Close'].values.astype(np.float32))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import unittest
+from datetime import date
+
+from source_deepar import display_quantiles as dq
+
+
+def sample_prediction(length=20):
+    return {q: [100.0 + i * k for i in range(length)] for k, q in enumerate(['0.1', '0.5', '0.9'])}
+
+
+class DisplayQuantilesFlaskTestCase(unittest.TestCase):
+    def setUp(self):
+        dq._render_cache.clear()
+        self.kwargs = dict(target_ts=list(range(60)), bench_mark_prediction=[100.0] * 20,
+                           bench_mark_prediction_name='SMA', start='2021-03-01 00:00:00')
+
+    def test_json(self):
+        data = dq.display_quantiles_flask(sample_prediction(), output='json', **self.kwargs)
+        self.assertListEqual(data['target'], [float(v) for v in range(40, 60)])
+        self.assertEqual(data['dates'][:2], ['1/3', '2/3'])
+        self.assertEqual(data['quantiles']['0.9'][1], 102.0)
+        self.assertDictEqual(data, dq.quantiles_chart_data(sample_prediction(), **dict(self.kwargs,
+                                                                                      start=date(2021, 3, 1))))
+
+    def test_images_are_cached(self):
+        png = dq.display_quantiles_flask(sample_prediction(), **self.kwargs)
+        self.assertTrue(png.startswith("<img src='data:image/png;base64,"))
+        self.assertIs(dq.display_quantiles_flask(sample_prediction(), **self.kwargs), png)
+        svg = dq.display_quantiles_flask(sample_prediction(), output='svg', **self.kwargs)
+        self.assertTrue(svg.startswith('<svg'))
+        self.assertIn('prediction median', svg)
+        dq.display_quantiles_flask(sample_prediction(length=21), **dict(self.kwargs, bench_mark_prediction=None))
+        self.assertEqual((dq._render_cache.hits, dq._render_cache.misses), (1, 3))
+
+    def test_trading_days(self):
+        # 2021-03-05 is a Friday and 2021-04-02 Good Friday
+        data = dq.quantiles_chart_data(sample_prediction(length=21), start='2021-03-05 00:00:00')
+        self.assertListEqual(data['dates'][:3], ['5/3', '8/3', '9/3'])
+        self.assertListEqual(data['dates'][-2:], ['1/4', '5/4'])
+        data = dq.quantiles_chart_data(sample_prediction(), start='2021-03-05 00:00:00', calendar_name=None)
+        self.assertListEqual(data['dates'][:3], ['5/3', '6/3', '7/3'])
+
+    def test_without_start_date(self):
+        data = dq.display_quantiles_flask(sample_prediction(), target_ts=list(range(30)), output='json')
+        self.assertListEqual(data['dates'], [])
+        self.assertTrue(dq.display_quantiles_flask(sample_prediction(), start='').startswith('<img'))
+
+    def test_unknown_format(self):
+        with self.assertRaises(ValueError):
+            dq.display_quantiles_flask(sample_prediction(), output='gif')
+
+
+if __name__ == '__main__':
+    unittest.main()
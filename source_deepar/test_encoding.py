@@ -0,0 +1,65 @@
+import json
+import struct
+import unittest
+from unittest import mock
+
+from source_deepar import encoding
+
+
+def float32(value):
+    return struct.unpack('f', struct.pack('f', value))[0]
+
+
+class FormatNumberTestCase(unittest.TestCase):
+    def test_float32_round_trip(self):
+        values = [54.9793815612793, 0.1, 1e-8, 3, 1234567.891, 118.86000061035156, -0.000123456789]
+        for value in values:
+            text = encoding.format_number(value, float32=True)
+            self.assertEqual(float32(float(text)), float32(value), text)
+            self.assertLessEqual(len(text), 9 + len('-e-05.'))
+        self.assertEqual(encoding.format_number(118.86000061035156, float32=True), '118.86')
+
+    def test_decimals(self):
+        self.assertEqual(encoding.format_number(54.9793815612793, decimals=2), '54.98')
+        self.assertEqual(encoding.format_number(54.9793815612793), repr(54.9793815612793))
+
+    def test_missing_values(self):
+        self.assertEqual(encoding.format_array([1.0, None, float('nan'), 'NaN', float('inf')]),
+                         '[1.0,"NaN","NaN","NaN","NaN"]')
+
+
+class EncodeRequestTestCase(unittest.TestCase):
+    def setUp(self):
+        self.instance = {"start": "2021-01-04 00:00:00", "target": [1.5, 2.25, float('nan')],
+                         "cat": [0], "dynamic_feat": [[0.1, 0.2, 0.3, 0.4]]}
+        self.configuration = {"num_samples": 100, "output_types": ["quantiles"], "quantiles": ["0.5"]}
+
+    def test_equivalent_to_json(self):
+        body = encoding.encode_request([encoding.encode_instance(self.instance)] * 2, self.configuration)
+        request = json.loads(body)
+        self.assertDictEqual(request["configuration"], self.configuration)
+        self.assertEqual(request["instances"][1]["target"][:2], [1.5, 2.25])
+        self.assertEqual(request["instances"][0]["target"][2], "NaN")
+        self.assertEqual(request["instances"][0]["dynamic_feat"], [[0.1, 0.2, 0.3, 0.4]])
+        self.assertEqual(request["instances"][0]["cat"], [0])
+
+    def test_without_orjson(self):
+        body = encoding.encode_request([encoding.encode_instance(self.instance)], self.configuration)
+        with mock.patch.object(encoding, 'orjson', None):
+            self.assertEqual(encoding.encode_request([encoding.encode_instance(self.instance)], self.configuration),
+                             body)
+            self.assertEqual(encoding.loads(body), json.loads(body))
+
+
+class ChunkBoundsTestCase(unittest.TestCase):
+    def test_payload_and_instance_limits(self):
+        # overhead 10, separator 1: chunks of 10 + 20 + 1 + 20 bytes at most fit 52 bytes
+        self.assertListEqual(encoding.chunk_bounds([20] * 5, 10, 1, 52), [(0, 2), (2, 4), (4, 5)])
+        self.assertListEqual(encoding.chunk_bounds([20] * 5, 10, 1, 1000, max_instances=3), [(0, 3), (3, 5)])
+        self.assertListEqual(encoding.chunk_bounds([], 10, 1, 52), [])
+        with self.assertRaises(ValueError):
+            encoding.chunk_bounds([20, 50], 10, 1, 52)
+
+
+if __name__ == '__main__':
+    unittest.main()
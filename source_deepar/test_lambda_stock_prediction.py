@@ -0,0 +1,289 @@
+import base64
+import gzip
+import hashlib
+import io
+import json
+import unittest
+from unittest import mock
+
+from source_deepar import lambda_stock_prediction as lsp
+
+
+class FakeS3Object(object):
+    def __init__(self, store, bucket_name, key):
+        self._store = store
+        self._bucket_name = bucket_name
+        self._key = key
+
+    @property
+    def e_tag(self):
+        self._store.calls.append(('head', self._key))
+        return self._store.etag(self._bucket_name, self._key)
+
+    def get(self):
+        self._store.calls.append(('get', self._key))
+        body = self._store.objects[(self._bucket_name, self._key)]
+        return {'Body': io.BytesIO(body), 'ETag': self._store.etag(self._bucket_name, self._key)}
+
+
+class FakeS3Resource(object):
+    """
+    Local stand-in for a boto3 S3 resource, keeping objects in memory and recording calls
+    """
+
+    def __init__(self):
+        self.objects = {}
+        self.calls = []
+
+    def put(self, bucket_name, key, obj):
+        self.objects[(bucket_name, key)] = json.dumps(obj).encode('utf-8')
+
+    def etag(self, bucket_name, key):
+        return '"%s"' % hashlib.md5(self.objects[(bucket_name, key)]).hexdigest()
+
+    def Object(self, bucket_name, key):
+        return FakeS3Object(self, bucket_name, key)
+
+
+class FakeRuntime(object):
+    """
+    Local stand-in for a SageMaker runtime client, answering with one prediction per instance
+    whose quantiles are made of the instance last target value, and whose i-th sample path
+    is made of the instance last target value plus i
+    """
+
+    def __init__(self, prediction_length=5):
+        self.prediction_length = prediction_length
+        self.bodies = []
+
+    def invoke_endpoint(self, EndpointName, ContentType, Body):
+        self.bodies.append(Body)
+        request = json.loads(Body.decode('utf-8'))
+        configuration = request["configuration"]
+        if configuration["output_types"] == ["samples"]:
+            predictions = [{"samples": [[instance["target"][-1] + i] * self.prediction_length
+                                        for i in range(configuration["num_samples"])]}
+                           for instance in request["instances"]]
+        else:
+            predictions = [{"quantiles": {q: [instance["target"][-1]] * self.prediction_length
+                                          for q in configuration["quantiles"]}}
+                           for instance in request["instances"]]
+        return {'Body': io.BytesIO(json.dumps({"predictions": predictions}).encode('utf-8'))}
+
+
+def stock_json(start="2021-01-04 00:00:00", size=30, first=100.0):
+    return {"start": start, "target": [first + i for i in range(size)]}
+
+
+class StockDataCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        lsp._stock_data_cache.clear()
+        self.s3 = FakeS3Resource()
+        for ticker, file_name in lsp.TICKER_REGISTRY.items():
+            self.s3.put('bucket', 'train/' + file_name, stock_json())
+
+    def test_warm_calls_do_not_touch_s3(self):
+        first = lsp.get_stock_data('ibm', self.s3, 'bucket', prefix='train')
+        second = lsp.get_stock_data('IBM', self.s3, 'bucket', prefix='train')
+        self.assertIs(first, second)
+        self.assertListEqual(self.s3.calls, [('get', 'train/IBM.json')])
+
+    def test_revalidation_after_ttl(self):
+        lsp.get_stock_data('AAPL', self.s3, 'bucket', prefix='train')
+        with mock.patch.object(lsp, 'DATA_CACHE_TTL', 0):
+            lsp.get_stock_data('AAPL', self.s3, 'bucket', prefix='train')
+            self.assertListEqual(self.s3.calls, [('get', 'train/AAPL.json'), ('head', 'train/AAPL.json')])
+            self.s3.put('bucket', 'train/AAPL.json', stock_json(first=200.0))
+            data = lsp.get_stock_data('AAPL', self.s3, 'bucket', prefix='train')
+        self.assertEqual(data['target'][0], 200.0)
+        self.assertEqual(self.s3.calls[-1], ('get', 'train/AAPL.json'))
+
+    def test_unknown_ticker(self):
+        self.assertIsNone(lsp.get_stock_data('MSFT', self.s3, 'bucket', prefix='train'))
+        self.assertListEqual(self.s3.calls, [])
+
+
+class TruncateContextTestCase(unittest.TestCase):
+    def test_truncation_moves_start(self):
+        instance = {"start": "2021-01-04 00:00:00", "target": list(range(10)), "dynamic_feat": [list(range(12))]}
+        truncated = lsp.truncate_context(instance, context_points=4)
+        self.assertDictEqual(truncated, {"start": "2021-01-10 00:00:00", "target": [6, 7, 8, 9],
+                                         "dynamic_feat": [[6, 7, 8, 9, 10, 11]]})
+        self.assertEqual(len(instance["target"]), 10)
+
+    def test_no_truncation(self):
+        instance = {"start": "2021-01-04", "target": list(range(10))}
+        self.assertIs(lsp.truncate_context(instance, context_points=0), instance)
+        self.assertIs(lsp.truncate_context(instance, context_points=20), instance)
+        self.assertEqual(lsp.truncate_context(instance, context_points=5)["start"], "2021-01-09")
+
+
+class BatchPredictionTestCase(unittest.TestCase):
+    def setUp(self):
+        lsp._stock_data_cache.clear()
+        lsp._prediction_cache.clear()
+        self.s3 = FakeS3Resource()
+        for i, file_name in enumerate(sorted(lsp.TICKER_REGISTRY.values())):
+            self.s3.put(lsp.DATA_BUCKET_NAME, 'train/' + file_name, stock_json(first=100.0 * (i + 1)))
+            self.s3.put(lsp.DATA_BUCKET_NAME, 'valid/' + file_name, stock_json(first=1000.0 * (i + 1)))
+        self.runtime = FakeRuntime()
+        patcher = mock.patch.dict(lsp._clients, {'s3': self.s3, 'sagemaker-runtime': self.runtime})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def invoke(self, body):
+        return lsp.lambda_handler({'body': json.dumps(body)}, None)
+
+    def test_metrics(self):
+        lsp.metrics.registry.reset()
+        lines = []
+        with mock.patch.object(lsp.metrics.registry, 'enabled', True), \
+                mock.patch.object(lsp.metrics.registry, '_log', lines.append):
+            self.invoke({'tickers': ['IBM', 'AAPL']})
+            self.invoke({'tickers': ['IBM']})
+        snapshot = lsp.metrics.registry.snapshot()
+        histograms = snapshot["histograms"]
+        self.assertEqual(histograms["lambda.handler"]["count"], 2)
+        self.assertEqual(histograms["s3.download"]["count"], 2)
+        self.assertEqual(histograms["endpoint.invoke"]["count"], 1)
+        self.assertEqual(histograms["lambda.decode"]["count"], 1)
+        self.assertLessEqual(histograms["lambda.encode"]["p50"], histograms["lambda.encode"]["p99"])
+        self.assertEqual(snapshot["counters"]["prediction_cache.hits"], 1)
+        self.assertEqual(snapshot["counters"]["prediction_cache.misses"], 2)
+        self.assertEqual(snapshot["counters"]["s3.cache_hits"], 1)
+        self.assertEqual({k: snapshot["stats"]["prediction_cache"][k] for k in ('hits', 'misses')},
+                         {'hits': 1, 'misses': 2})
+        self.assertEqual(snapshot["stats"]["prediction_flights"], lsp._prediction_flights.stats())
+        # every invocation ends with a structured log line of the registry snapshot
+        self.assertIn("lambda.handler", json.loads(lines[-1])["metrics"]["histograms"])
+
+    def test_single_invocation(self):
+        response = self.invoke({'tickers': ['ibm', 'AAPL', 'GOOGL'], 'start_dates': ['', '2021-03-22', '']})
+        self.assertEqual(response['statusCode'], 200)
+        predictions = json.loads(response['body'])['predictions']
+        self.assertListEqual([p['ticker_name'] for p in predictions], ['IBM', 'AAPL', 'GOOGL'])
+        self.assertListEqual([p['quantiles']['0.5'][0] for p in predictions], [429.0, 1029.0, 329.0])
+        self.assertEqual(len(self.runtime.bodies), 1)
+
+    def test_payload_limit_splits_invocations(self):
+        single = len(lsp.encode_request('IBM', self.s3, lsp.DATA_BUCKET_NAME, 'train'))
+        with mock.patch.object(lsp, 'MAX_PAYLOAD_BYTES', single + 100):
+            response = self.invoke({'tickers': ['IBM', 'AAPL', 'AMZN', 'GOOGL'], 'start_date': ''})
+        predictions = json.loads(response['body'])['predictions']
+        self.assertEqual(len(self.runtime.bodies), 4)
+        self.assertListEqual([p['ticker_name'] for p in predictions], ['IBM', 'AAPL', 'AMZN', 'GOOGL'])
+        self.assertTrue(all(len(body) <= single + 100 for body in self.runtime.bodies))
+
+    def test_default_context_points(self):
+        self.s3.put(lsp.DATA_BUCKET_NAME, 'train/IBM.json', stock_json(size=lsp.CONTEXT_POINTS + 50))
+        self.invoke({'tickers': ['IBM']})
+        instance = json.loads(self.runtime.bodies[0].decode('utf-8'))['instances'][0]
+        self.assertEqual(len(instance['target']), lsp.CONTEXT_POINTS)
+        self.assertEqual(instance['target'][0], 150.0)
+
+    def test_unknown_ticker(self):
+        response = self.invoke({'tickers': ['IBM', 'MSFT']})
+        self.assertEqual(response['statusCode'], 400)
+        self.assertIn('MSFT', json.loads(response['body'])['error'])
+
+    def test_legacy_request(self):
+        response = self.invoke({'ticker_name': 'AMZN', 'start_date': ''})
+        self.assertEqual(json.loads(response['body'])['predictions'][0]['quantiles']['0.1'][0], 229.0)
+
+    def test_compressed_response(self):
+        body = {'tickers': ['IBM', 'AAPL', 'AMZN', 'GOOGL'] * 5}
+        plain = self.invoke(body)
+        response = lsp.lambda_handler({'body': json.dumps(body), 'headers': {'accept-encoding': 'gzip, br'}}, None)
+        self.assertTrue(response['isBase64Encoded'])
+        self.assertEqual(response['headers']['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(base64.b64decode(response['body'])).decode('utf-8'), plain['body'])
+        self.assertNotIn('isBase64Encoded', plain)
+        # small bodies are not worth compressing
+        response = lsp.lambda_handler({'body': json.dumps({'tickers': ['MSFT']}),
+                                       'headers': {'Accept-Encoding': 'gzip'}}, None)
+        self.assertNotIn('Content-Encoding', response['headers'])
+
+    def test_float32_request_values(self):
+        self.s3.put(lsp.DATA_BUCKET_NAME, 'train/IBM.json', {"start": "2021-01-04 00:00:00",
+                                                             "target": [54.9793815612793, 118.86000061035156]})
+        self.invoke({'tickers': ['IBM']})
+        self.assertIn(b'"target":[54.97938,118.86]', self.runtime.bodies[0])
+
+    def test_repeated_tickers_are_sent_once(self):
+        response = self.invoke({'tickers': ['IBM', 'AAPL', 'IBM'], 'start_dates': ['', '', '']})
+        predictions = json.loads(response['body'])['predictions']
+        self.assertListEqual([p['quantiles']['0.5'][0] for p in predictions], [429.0, 129.0, 429.0])
+        self.assertEqual(len(json.loads(self.runtime.bodies[0].decode('utf-8'))['instances']), 2)
+
+    def test_repeated_predictions_are_cached(self):
+        self.invoke({'ticker_name': 'IBM', 'start_date': ''})
+        response = self.invoke({'tickers': ['AAPL', 'IBM'], 'start_date': ''})
+        predictions = json.loads(response['body'])['predictions']
+        self.assertListEqual([p['ticker_name'] for p in predictions], ['AAPL', 'IBM'])
+        self.assertListEqual([p['quantiles']['0.5'][0] for p in predictions], [129.0, 429.0])
+        # the second invocation only carries AAPL instance
+        self.assertEqual(len(self.runtime.bodies), 2)
+        self.assertEqual(len(json.loads(self.runtime.bodies[1].decode('utf-8'))['instances']), 1)
+        self.assertDictEqual({k: lsp._prediction_cache.stats()[k] for k in ('hits', 'misses')},
+                             {'hits': 1, 'misses': 2})
+        # cached predictions are not tagged in place
+        instance = lsp.encode_instance(lsp.get_stock_data('IBM', self.s3, lsp.DATA_BUCKET_NAME, 'train'))
+        key = lsp.request_fingerprint(lsp.ENDPOINT_NAME, lsp.CONFIGURATION, instance)
+        self.assertNotIn('ticker_name', lsp._prediction_cache.get(key))
+
+    def test_new_data_is_not_served_from_cache(self):
+        self.invoke({'tickers': ['IBM']})
+        self.s3.put(lsp.DATA_BUCKET_NAME, 'train/IBM.json', stock_json(size=31, first=400.0))
+        with mock.patch.object(lsp, 'DATA_CACHE_TTL', 0):
+            response = self.invoke({'tickers': ['IBM']})
+        self.assertEqual(json.loads(response['body'])['predictions'][0]['quantiles']['0.5'][0], 430.0)
+        self.assertEqual(len(self.runtime.bodies), 2)
+
+
+class SampleStatisticsTestCase(unittest.TestCase):
+    def test_matches_numpy(self):
+        import numpy as np
+        rng = np.random.default_rng(0)
+        samples = rng.normal(size=(50, 7))
+        statistics = lsp.sample_statistics(samples.tolist(), ["0", "0.05", "0.5", "0.95", "1"], thresholds=[0.5])
+        for q, values in statistics["quantiles"].items():
+            np.testing.assert_allclose(values, np.quantile(samples, float(q), axis=0))
+        np.testing.assert_allclose(statistics["mean"], samples.mean(axis=0))
+        np.testing.assert_allclose(statistics["exceedance"]["0.5"], (samples > 0.5).mean(axis=0))
+
+    def test_batch_request(self):
+        s3 = FakeS3Resource()
+        s3.put(lsp.DATA_BUCKET_NAME, 'train/IBM.json', stock_json(first=100.0))
+        runtime = FakeRuntime()
+        lsp._stock_data_cache.clear()
+        lsp._prediction_cache.clear()
+        with mock.patch.dict(lsp._clients, {'s3': s3, 'sagemaker-runtime': runtime}):
+            body = {'tickers': ['IBM'], 'quantiles': ['0.05', '0.5', '0.95'], 'exceedance': [150], 'num_samples': 21}
+            prediction = json.loads(lsp.lambda_handler({'body': json.dumps(body)}, None)['body'])['predictions'][0]
+            # sample paths are 129, 130, ..., 149
+            self.assertDictEqual({q: v[0] for q, v in prediction['quantiles'].items()},
+                                 {'0.05': 130.0, '0.5': 139.0, '0.95': 148.0})
+            self.assertEqual(prediction['mean'][0], 139.0)
+            self.assertEqual(prediction['exceedance']['150'][0], 0.0)
+            # another band is computed from the cached samples
+            body['quantiles'] = ['0.1', '0.9']
+            lsp.lambda_handler({'body': json.dumps(body)}, None)
+            body['quantiles'] = ['1.5']
+            self.assertEqual(lsp.lambda_handler({'body': json.dumps(body)}, None)['statusCode'], 400)
+            for invalid in ({'exceedance': 100}, {'exceedance': ['high']}, {'exceedance': [True]},
+                            {'quantiles': 0.5}, {'quantiles': ['median']}):
+                request = dict(body, quantiles=['0.5'])
+                request.update(invalid)
+                self.assertEqual(lsp.lambda_handler({'body': json.dumps(request)}, None)['statusCode'], 400)
+        self.assertEqual(len(runtime.bodies), 1)
+        # cached sample paths are float32 arrays
+        instance = lsp.encode_instance(lsp.truncate_context(lsp.get_stock_data('IBM', s3, lsp.DATA_BUCKET_NAME,
+                                                                               'train')))
+        key = lsp.request_fingerprint(lsp.ENDPOINT_NAME, dict(lsp.SAMPLES_CONFIGURATION, num_samples=21), instance)
+        self.assertEqual(lsp._prediction_cache.get(key)['samples'][0].typecode, 'f')
+        self.assertDictEqual(json.loads(runtime.bodies[0].decode('utf-8'))['configuration'],
+                             {"num_samples": 21, "output_types": ["samples"]})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+import json
+import time
+import unittest
+
+from source_deepar.metrics import Histogram, MetricsRegistry
+
+
+class HistogramTestCase(unittest.TestCase):
+    def test_percentiles(self):
+        histogram = Histogram()
+        for value in range(100, 0, -1):
+            histogram.observe(value)
+        summary = histogram.summary()
+        self.assertEqual((summary["p50"], summary["p95"], summary["p99"]), (50, 95, 99))
+        self.assertEqual((summary["count"], summary["mean"], summary["max"]), (100, 50.5, 100))
+        self.assertEqual(histogram.percentile(100), 100)
+        self.assertIsNone(Histogram().percentile(50))
+
+    def test_recent_values(self):
+        histogram = Histogram(size=10)
+        for value in range(100):
+            histogram.observe(value)
+        self.assertEqual(histogram.count, 100)
+        self.assertEqual(histogram.percentile(0), 90)
+
+
+class MetricsRegistryTestCase(unittest.TestCase):
+    def setUp(self):
+        self.lines = []
+        self.registry = MetricsRegistry(log=self.lines.append)
+
+    def test_spans_counters_and_histograms(self):
+        with self.registry.span('stage'):
+            time.sleep(0.01)
+        with self.assertRaises(KeyError):
+            with self.registry.span('stage'):
+                raise KeyError('failed')
+        self.registry.increment('requests')
+        self.registry.increment('requests', 2)
+        self.registry.observe('bytes', 512)
+        snapshot = self.registry.snapshot()
+        self.assertEqual(snapshot["counters"], {"requests": 3, "stage.errors": 1})
+        self.assertEqual(snapshot["histograms"]["stage"]["count"], 2)
+        self.assertGreaterEqual(snapshot["histograms"]["stage"]["max"], 10)
+        self.assertEqual(snapshot["histograms"]["bytes"]["p99"], 512)
+        json.dumps(snapshot)
+
+    def test_timed(self):
+        @self.registry.timed('call')
+        def add(a, b=0):
+            """adds"""
+            return a + b
+
+        self.assertEqual(add(1, b=2), 3)
+        self.assertEqual(add.__doc__, "adds")
+        self.assertEqual(self.registry.snapshot()["histograms"]["call"]["count"], 1)
+
+    def test_registered_stats(self):
+        calls = {"hits": 0}
+        self.registry.register_stats('cache', lambda: dict(calls))
+        calls["hits"] += 1
+        self.assertEqual(self.registry.snapshot()["stats"], {"cache": {"hits": 1}})
+        self.registry.reset()
+        self.registry.emit()
+        self.assertEqual(json.loads(self.lines[-1])["metrics"]["stats"], {"cache": {"hits": 1}})
+
+    def test_disabled(self):
+        self.registry.enabled = False
+        with self.registry.span('stage'):
+            pass
+        self.assertIs(self.registry.span('stage'), self.registry.span('other'))
+        self.registry.increment('requests')
+        self.registry.emit()
+        self.assertEqual(self.registry.snapshot(), {"counters": {}, "histograms": {}, "stats": {}})
+        self.assertListEqual(self.lines, [])
+
+    def test_log_lines(self):
+        self.registry.log_spans = True
+        with self.registry.span('stage'):
+            pass
+        self.registry.emit()
+        self.assertEqual(json.loads(self.lines[0])["span"], "stage")
+        self.assertEqual(json.loads(self.lines[1])["metrics"]["histograms"]["stage"]["count"], 1)
+        self.registry.reset()
+        self.assertEqual(self.registry.snapshot(), {"counters": {}, "histograms": {}, "stats": {}})
+
+
+if __name__ == '__main__':
+    unittest.main()
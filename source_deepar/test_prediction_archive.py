@@ -0,0 +1,133 @@
+import json
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from source_deepar.deepar_utils import ForecastBatch
+from source_deepar.prediction_archive import PredictionArchive, import_prediction_files, parse_prediction_file_name, \
+    read_prediction_file
+from utils.trading_calendar import get_trading_calendar
+
+QUANTILES = ["0.1", "0.5", "0.9"]
+
+
+def sample_batch(origins, horizon=5, seed=0):
+    rng = np.random.default_rng(seed)
+    values = np.sort(100 + rng.normal(0, 1, (len(origins), len(QUANTILES), horizon)), axis=1).astype(np.float32)
+    return ForecastBatch(values, QUANTILES, origins, calendar=get_trading_calendar('NYSE'))
+
+
+class PredictionArchiveTestCase(unittest.TestCase):
+    def setUp(self):
+        self.archive = PredictionArchive(':memory:')
+
+    def tearDown(self):
+        self.archive.close()
+
+    def test_append_batch_and_query(self):
+        batch = sample_batch(['2021-01-04', '2021-01-11', '2021-01-19'])
+        self.assertEqual(self.archive.append(['ibm', 'AAPL', 'IBM'], batch), 3)
+        self.assertEqual(len(self.archive), 3)
+
+        forecasts = self.archive.query('IBM')
+        self.assertListEqual(list(forecasts.tickers), ['IBM', 'IBM'])
+        np.testing.assert_array_equal(forecasts.origins, np.array(['2021-01-04', '2021-01-19'], dtype='datetime64[D]'))
+        np.testing.assert_array_equal(forecasts.values, batch.values[[0, 2]])
+        np.testing.assert_array_equal(forecasts.dates, batch.dates()[[0, 2]].astype('datetime64[D]'))
+        self.assertEqual(forecasts.values.dtype, np.float32)
+
+        forecasts = self.archive.query(start='2021-01-05', end=pd.Timestamp('2021-01-19'), quantiles=["0.9", "0.1"])
+        self.assertListEqual(list(forecasts.tickers), ['AAPL', 'IBM'])
+        np.testing.assert_array_equal(forecasts.values, batch.values[1:, [2, 0]])
+        self.assertEqual(len(self.archive.query(['MSFT']).values), 0)
+        with self.assertRaises(ValueError):
+            self.archive.query(quantiles=["0.99"])
+
+    def test_append_frames(self):
+        batch = sample_batch(['2021-01-04', '2021-01-11'])
+        self.archive.append(['IBM', 'AAPL'], batch.frames, dataset='valid', model='test')
+        self.archive.append('IBM', batch.frame(1) * 2, dataset='valid', model='test')
+        # forecasts with the same key are replaced
+        self.archive.append('IBM', batch.frame(1), dataset='valid', model='test')
+        self.archive.append('IBM', batch.frame(0).iloc[:3], dataset='valid', model='test')
+        self.assertEqual(len(self.archive), 4)
+
+        pd.testing.assert_frame_equal(self.archive.frame('IBM', '2021-01-11', dataset='valid'), batch.frame(1),
+                                      check_freq=False, check_names=False)
+        with self.assertRaises(ValueError):
+            self.archive.query('IBM', dataset='valid')
+        self.assertEqual(self.archive.query('IBM', horizon=3).values.shape, (1, 3, 3))
+        with self.assertRaises(KeyError):
+            self.archive.frame('MSFT', '2021-01-04')
+        with self.assertRaises(ValueError):
+            self.archive.append('IBM', batch, dataset='train')
+        with self.assertRaises(ValueError):
+            self.archive.append('IBM', batch)
+
+    def test_same_origin_and_horizon(self):
+        batch = sample_batch(['2021-01-14'])
+        # calendar days rather than market days: same origin and horizon, different last predicted date
+        calendar_days = batch.frame(0).set_axis(pd.date_range('2021-01-14', periods=5, freq='D'))
+        self.assertEqual(self.archive.append(['IBM', 'IBM'], [batch.frame(0), calendar_days]), 2)
+        self.assertEqual(len(self.archive), 2)
+        np.testing.assert_array_equal(self.archive.query('IBM').dates[:, -1],
+                                      np.array(['2021-01-18', '2021-01-21'], dtype='datetime64[D]'))
+        # forecasts sharing a key within a call are ambiguous, none of them is stored
+        with self.assertRaises(ValueError):
+            self.archive.append(['AAPL', 'AAPL'], [batch.frame(0), batch.frame(0) * 2])
+        self.assertEqual(len(self.archive.query('AAPL').values), 0)
+        with self.assertRaises(ValueError):
+            self.archive.append(['IBM', 'AAPL', 'AMZN'], [batch.frame(0)] * 2)
+
+    def test_persistence(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'predictions.sqlite')
+            batch = sample_batch(['2021-01-04'])
+            with PredictionArchive(path) as archive:
+                archive.append('IBM', batch)
+            with PredictionArchive(path) as archive:
+                np.testing.assert_array_equal(archive.query('IBM').values, batch.values)
+
+
+class PredictionFilesTestCase(unittest.TestCase):
+    def test_parse_file_name(self):
+        self.assertEqual(parse_prediction_file_name('IBM_2021-01-14 - 2021-02-11.json'), ('IBM', 'test'))
+        self.assertEqual(parse_prediction_file_name('a/IBM_valid2021-02-22 - 2021-03-19.json'), ('IBM', 'valid'))
+        self.assertEqual(parse_prediction_file_name('AAPL_2021-02-22 - 2021-03-19_valid.json'), ('AAPL', 'valid'))
+        self.assertEqual(parse_prediction_file_name('ibm_2021-03-20 00:00:00-2021-04-09 00:00:00_fromValid.json'),
+                         ('IBM', 'future'))
+        with self.assertRaises(ValueError):
+            parse_prediction_file_name('IBM_2021-01-14_unknown.json')
+
+    def test_import(self):
+        frame = sample_batch(['2021-01-04']).frame(0).astype(np.float64)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            frame.to_json(os.path.join(tmp_dir, 'IBM_2021-01-04 - 2021-01-08.json'), orient='columns',
+                          date_format='iso')
+            frame.to_json(os.path.join(tmp_dir, 'AAPL_valid2021-01-04 - 2021-01-08.json'), orient='index')
+            with open(os.path.join(tmp_dir, 'notes.txt'), 'w') as fp:
+                json.dump({}, fp)
+            pd.testing.assert_frame_equal(read_prediction_file(os.path.join(tmp_dir, 'AAPL_valid2021-01-04 - '
+                                                                                     '2021-01-08.json')),
+                                          frame, check_freq=False, check_names=False)
+            with PredictionArchive(':memory:') as archive:
+                self.assertEqual(import_prediction_files(archive, tmp_dir), 2)
+                forecasts = archive.query()
+                self.assertListEqual(list(forecasts.datasets), ['valid', 'test'])
+                np.testing.assert_allclose(forecasts.values, np.stack([frame.to_numpy().T] * 2), rtol=1e-6)
+
+            # same ticker, dataset and predicted dates of another file: the last file name is stored
+            (frame * 2).to_json(os.path.join(tmp_dir, 'IBM_2021-01-04 - 2021-01-08_fromTrain.json'),
+                                orient='columns', date_format='iso')
+            with PredictionArchive(':memory:') as archive:
+                with self.assertWarns(UserWarning):
+                    self.assertEqual(import_prediction_files(archive, tmp_dir), 2)
+                np.testing.assert_allclose(archive.query(dataset='test').values[0], 2 * frame.to_numpy().T,
+                                           rtol=1e-6)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+r"""
+Sliding-window dataset feeding LSTM_Predictor.
+Windows are strided views on the ticker arrays, e.g. the memory-mapped ones of a utils.data_cache.ColumnarCache:
+nothing is copied but the batches being built, each one in a single gather per ticker.
+"""
+import numpy as np
+import torch
+from numpy.lib.stride_tricks import sliding_window_view
+from torch.utils.data import BatchSampler, DataLoader, Dataset, RandomSampler, SequentialSampler
+
+SPLITS = ('train', 'test', 'valid')
+
+
+class SlidingWindowDataset(Dataset):
+    """
+    Input windows of window_size time steps, each one followed by prediction_length target values,
+    taken from the arrays of one or more tickers.
+    Items are (window, target) pairs of float32 tensors shaped (window_size, features) and (prediction_length,).
+    An item may also be requested with a list of positions, which returns a whole batch at once.
+    """
+
+    def __init__(self, arrays, window_size, prediction_length, target_index=0, feature_index=None, stride=1,
+                 normalize=True):
+        """
+        :param arrays: an array shaped (rows, time), or a list of them, one per ticker
+        :param window_size: number of input time steps
+        :param prediction_length: number of predicted time steps
+        :param target_index: row of the predicted values
+        :param feature_index: list of the rows used as input features, all the rows if None
+        :param stride: number of time steps between two consecutive windows
+        :param normalize: if True, every window feature is divided by its last input value,
+        and targets by the last input value of their row, so that windows of different price levels look alike
+        """
+        if isinstance(arrays, np.ndarray):
+            arrays = [arrays]
+        arrays = [np.atleast_2d(a) for a in arrays if np.shape(a)[-1] >= window_size + prediction_length]
+        self.window_size = window_size
+        self.prediction_length = prediction_length
+        self.target_index = target_index
+        self.feature_index = np.arange(arrays[0].shape[0] if arrays else 0) if feature_index is None \
+            else np.asarray(feature_index)
+        self.normalize = normalize
+        # views shaped (rows, windows, window_size + prediction_length): no window is copied
+        self._windows = [sliding_window_view(a, window_size + prediction_length, axis=-1)[:, ::stride] for a in arrays]
+        self._offsets = np.cumsum([0] + [w.shape[1] for w in self._windows])
+
+    @classmethod
+    def from_columnar_cache(cls, cache, window_size, prediction_length, tickers=None, columns=None,
+                            target_column='Adj Close', split='train', **kwargs):
+        """
+        Builds a dataset on the views of a ColumnarCache
+        :param cache: a utils.data_cache.ColumnarCache
+        :param window_size: number of input time steps
+        :param prediction_length: number of predicted time steps, also used to split time series
+        :param tickers: list of tickers, all the cached ones if None
+        :param columns: list of input columns, all the cached ones if None
+        :param target_column: predicted column, one among columns
+        :param split: one among SPLITS, as sliced by ColumnarCache.split; test and validation windows are
+        the ones whose targets all lie beyond the previous split, so that they are never trained on
+        :return: a SlidingWindowDataset
+        """
+        columns = list(cache.columns if columns is None else columns)
+        position = SPLITS.index(split)
+        arrays = []
+        for ticker in (cache.tickers if tickers is None else tickers):
+            # whole ticker blocks are used, as selecting some of their columns would copy them
+            values = cache.values(ticker)
+            # split ends, as in ColumnarCache.split
+            ends = [values.shape[-1] - prediction_length * k for k in (2, 1, 0)]
+            start = 0 if position == 0 else max(0, ends[position - 1] - window_size)
+            arrays.append(values[..., start:ends[position]])
+        return cls(arrays, window_size, prediction_length, target_index=cache.columns.index(target_column),
+                   feature_index=[cache.columns.index(c) for c in columns], **kwargs)
+
+    @property
+    def features(self):
+        return len(self.feature_index)
+
+    def __len__(self):
+        return int(self._offsets[-1])
+
+    def __getitem__(self, k):
+        if np.isscalar(k):
+            if not -len(self) <= k < len(self):
+                raise IndexError("window index out of range")
+            x, y = self.batch([k % len(self)])
+            return x[0], y[0]
+        return self.batch(k)
+
+    def batch(self, positions):
+        """
+        Gathers a batch of windows
+        :param positions: list of window positions
+        :return: float32 tensors of input windows shaped (batch, window_size, features)
+        and of targets shaped (batch, prediction_length)
+        """
+        positions = np.asarray(positions, dtype=np.int64)
+        x = np.empty((len(positions), self.window_size, self.features), dtype=np.float32)
+        y = np.empty((len(positions), self.prediction_length + 1), dtype=np.float32)
+        series = np.searchsorted(self._offsets, positions, side='right') - 1
+        for s in np.unique(series):
+            selected = series == s
+            windows = positions[selected] - self._offsets[s]
+            # features and windows are gathered together, so that only the batch is copied
+            block = self._windows[s][np.ix_(self.feature_index, windows)]
+            x[selected] = block[:, :, :self.window_size].transpose(1, 2, 0)
+            # targets, preceded by the last input value of their row
+            y[selected] = self._windows[s][self.target_index][windows, self.window_size - 1:]
+        if self.normalize:
+            scale = x[:, -1, :].copy()
+            scale[scale == 0] = 1
+            x /= scale[:, None, :]
+            y /= np.where(y[:, :1] == 0, 1, y[:, :1])
+        return torch.from_numpy(x), torch.from_numpy(y[:, 1:])
+
+
+def batch_loader(dataset, batch_size=256, shuffle=True, num_workers=0, drop_last=False):
+    """
+    Iterates over a SlidingWindowDataset by batches, each one gathered at once by a worker process
+    :param dataset: a SlidingWindowDataset
+    :param batch_size: number of windows per batch
+    :param shuffle: if True, windows are drawn in random order
+    :param num_workers: number of worker processes, 0 to build batches in the calling process
+    :param drop_last: if True, the last incomplete batch is dropped
+    :return: a torch DataLoader yielding (windows, targets) tensors
+    """
+    sampler = RandomSampler(dataset) if shuffle else SequentialSampler(dataset)
+    # the loader receives lists of positions, so that batches are not collated window by window
+    return DataLoader(dataset, sampler=BatchSampler(sampler, batch_size, drop_last), batch_size=None,
+                      num_workers=num_workers, persistent_workers=num_workers > 0)
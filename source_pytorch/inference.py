@@ -0,0 +1,144 @@
+r"""
+CPU inference of LSTM_Predictor: the trained model is exported to TorchScript, optionally after dynamic int8
+quantization of its LSTM and Linear layers, and many ticker windows are predicted at once.
+Predictions are returned as quantiles, computed from the model point forecasts and the distribution of its
+errors on held-out windows, relative to the last input value of each window, in the format `display_quantiles_flask` consumes.
+The number of torch threads is a process-wide setting, left to the calling script (see `torch.set_num_threads`).
+"""
+import json
+import os
+
+import numpy as np
+import torch
+import torch.nn as nn
+
+from source_pytorch.model import LSTM_Predictor
+from source_pytorch.train import MODEL_FILE, MODEL_INFO_FILE
+
+DEFAULT_QUANTILES = ("0.1", "0.5", "0.9")
+QUANTIZED_MODULES = {nn.LSTM, nn.Linear}
+
+
+def export_model(model, window_size, units, quantize=False, path=None):
+    """
+    Exports a model to TorchScript, for inference only
+    :param model: a LSTM_Predictor
+    :param window_size: number of input time steps of the example window the model is traced with
+    :param units: number of input features
+    :param quantize: if True, LSTM and Linear layers weights are quantized to int8, activations being
+    quantized dynamically
+    :param path: file the exported model is saved to, not saved if None
+    :return: the frozen TorchScript module
+    """
+    model = model.eval()
+    if quantize:
+        model = torch.ao.quantization.quantize_dynamic(model, QUANTIZED_MODULES, dtype=torch.qint8)
+    with torch.no_grad():
+        module = torch.jit.freeze(torch.jit.trace(model, torch.ones(1, window_size, units)))
+    if path is not None:
+        torch.jit.save(module, path)
+    return module
+
+
+class BatchPredictor(object):
+    """
+    Predicts the quantiles of many ticker windows at once with an exported LSTM_Predictor
+    """
+
+    def __init__(self, module, window_size, prediction_length, target_index=0, quantiles=DEFAULT_QUANTILES,
+                 error_quantiles=None, batch_size=256):
+        """
+        :param module: a model exported by `export_model`, or any LSTM_Predictor
+        :param window_size: number of input time steps
+        :param prediction_length: number of predicted time steps
+        :param target_index: position of the predicted feature among input features
+        :param quantiles: quantiles names, as strings
+        :param error_quantiles: array shaped (quantiles, prediction_length) of the quantiles of the normalized
+        prediction errors, as computed by `calibrate`; all quantiles are the point forecast if None
+        :param batch_size: maximum number of windows per forward pass
+        """
+        self.module = module
+        self.window_size = window_size
+        self.prediction_length = prediction_length
+        self.target_index = target_index
+        self.quantiles = [str(q) for q in quantiles]
+        self.error_quantiles = np.zeros((len(self.quantiles), prediction_length), dtype=np.float32) \
+            if error_quantiles is None else np.asarray(error_quantiles, dtype=np.float32)
+        self.batch_size = batch_size
+
+    def point_forecast(self, windows, normalized=False):
+        """
+        :param windows: array of input windows shaped (windows, window_size, features)
+        :param normalized: if True, windows are already normalized as SlidingWindowDataset does,
+        and so are returned predictions
+        :return: an array of predictions shaped (windows, prediction_length)
+        """
+        out, scale = self._forecast(windows, normalized)
+        return out if normalized else out * scale
+
+    def predict_array(self, windows):
+        """
+        :param windows: array of input windows shaped (windows, window_size, features)
+        :return: an array of predicted quantiles shaped (windows, quantiles, prediction_length),
+        as utils.evaluation.evaluate expects
+        """
+        out, scale = self._forecast(windows)
+        return (out[:, None, :] + self.error_quantiles) * scale[:, None]
+
+    def predict(self, windows):
+        """
+        :param windows: array of input windows shaped (windows, window_size, features)
+        :return: a list of dictionaries, one per window, of predicted values lists keyed by quantile,
+        as `display_quantiles_flask` consumes
+        """
+        return [{q: values[k].tolist() for k, q in enumerate(self.quantiles)} for values in self.predict_array(windows)]
+
+    def calibrate(self, dataset):
+        """
+        Computes the error quantiles of the model from held-out windows
+        :param dataset: a normalized SlidingWindowDataset of windows the model has not been trained on
+        :return: the error quantiles array, also stored by the predictor
+        """
+        x, y = dataset[np.arange(len(dataset))]
+        errors = y.numpy() - self.point_forecast(x.numpy(), normalized=True)
+        self.error_quantiles = np.nanquantile(errors, [float(q) for q in self.quantiles], axis=0).astype(np.float32)
+        return self.error_quantiles
+
+    def _forecast(self, windows, normalized=False):
+        """
+        Predicts normalized values in batches of at most batch_size windows
+        :return: normalized predictions shaped (windows, prediction_length)
+        and the scale of each window, shaped (windows, 1)
+        """
+        x = np.array(windows, dtype=np.float32)[:, -self.window_size:]
+        scale = np.ones((len(x), 1), dtype=np.float32)
+        if not normalized:
+            last = x[:, -1, :].copy()
+            last[last == 0] = 1
+            x /= last[:, None, :]
+            scale = last[:, self.target_index, None]
+        out = np.empty((len(x), self.prediction_length), dtype=np.float32)
+        with torch.inference_mode():
+            for start in range(0, len(x), self.batch_size):
+                out[start:start + self.batch_size] = self.module(torch.from_numpy(x[start:start + self.batch_size]))
+        return out, scale
+
+
+def load_predictor(model_dir, quantize=False, **kwargs):
+    """
+    Loads a model saved by `source_pytorch.train` and exports it
+    :param model_dir: directory containing the model parameters and model_info.json
+    :param quantize: if True, the model is quantized to int8
+    :param kwargs: BatchPredictor arguments
+    :return: a BatchPredictor
+    """
+    with open(os.path.join(model_dir, MODEL_INFO_FILE)) as fp:
+        model_info = json.load(fp)
+    model = LSTM_Predictor(model_info["units"], model_info["hidden_dim"], model_info["layers"], model_info["dropout"],
+                           model_info["prediction_length"])
+    model.load_state_dict(torch.load(os.path.join(model_dir, MODEL_FILE)))
+    module = export_model(model, model_info["window_size"], model_info["units"], quantize=quantize)
+    columns = model_info.get("columns")
+    target_index = columns.index(model_info["target_column"]) if columns else 0
+    return BatchPredictor(module, model_info["window_size"], model_info["prediction_length"],
+                          target_index=target_index, **kwargs)
@@ -8,21 +8,26 @@ class LSTM_Predictor(nn.Module):
     def __init__(self, units, hidden_dim, layers, dropout, prediction_length):
         """
         Initialize the model by setting up layers.
+        :param units: number of input features
+        :param hidden_dim: number of LSTM hidden units
+        :param layers: number of LSTM layers
+        :param dropout: dropout probability between LSTM layers
+        :param prediction_length: number of predicted time steps
         """
-        self.prediciton_length = prediction_length
         super(LSTM_Predictor, self).__init__()
-        self.lstm = nn.LSTM(input_size=units, hidden_size=hidden_dim, num_layers=layers, dropout=dropout)
-        self.dense = nn.Linear(in_features=hidden_dim, out_features=1)
+        self.prediction_length = prediction_length
+        self.lstm = nn.LSTM(input_size=units, hidden_size=hidden_dim, num_layers=layers,
+                            dropout=dropout if layers > 1 else 0., batch_first=True)
+        # all the horizon is predicted at once from the last hidden state
+        self.dense = nn.Linear(in_features=hidden_dim, out_features=prediction_length)
         self.relu = nn.ReLU()
 
-        
-
     def forward(self, x):
         """
         Perform a forward pass of our model on some input.
+        :param x: a batch of input windows shaped (batch, window, units)
+        :return: predictions shaped (batch, prediction_length)
         """
         lstm_out, _ = self.lstm(x)
-        out = self.dense(lstm_out)
-        out = out[self.prediction_length - 1, range(self.prediction_length)]
-        return self.relu(out.squeeze())
-    
\ No newline at end of file
+        out = self.dense(lstm_out[:, -1, :])
+        return self.relu(out)
@@ -0,0 +1,95 @@
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from source_pytorch.data import SlidingWindowDataset, batch_loader
+from utils.data_cache import ColumnarCache, write_columnar_cache
+
+
+def sample_arrays(lengths=(50, 30), features=3):
+    # feature f of ticker t at time i is 1000 * t + 100 * f + i + 1, so that windows can be recognized
+    return [np.array([1000. * t + 100. * f + np.arange(length) + 1 for f in range(features)])
+            for t, length in enumerate(lengths)]
+
+
+class SlidingWindowDatasetTestCase(unittest.TestCase):
+    def test_windows(self):
+        arrays = sample_arrays()
+        dataset = SlidingWindowDataset(arrays, window_size=10, prediction_length=5, target_index=1, normalize=False)
+        self.assertEqual(len(dataset), (50 - 14) + (30 - 14))
+        self.assertEqual(dataset.features, 3)
+        x, y = dataset[37]
+        self.assertEqual(tuple(x.shape), (10, 3))
+        # the 38th window is the second of the second ticker
+        np.testing.assert_array_equal(x.numpy(), arrays[1][:, 1:11].T)
+        np.testing.assert_array_equal(y.numpy(), arrays[1][1, 11:16])
+        with self.assertRaises(IndexError):
+            dataset[len(dataset)]
+
+    def test_windows_are_views(self):
+        arrays = sample_arrays()
+        dataset = SlidingWindowDataset(arrays, window_size=10, prediction_length=5)
+        self.assertTrue(all(np.shares_memory(w, a) for w, a in zip(dataset._windows, arrays)))
+
+    def test_batch_matches_items(self):
+        dataset = SlidingWindowDataset(sample_arrays(), window_size=10, prediction_length=5, stride=3)
+        positions = [17, 0, 4, 12]
+        x, y = dataset[positions]
+        self.assertEqual(tuple(x.shape), (4, 10, 3))
+        self.assertEqual(tuple(y.shape), (4, 5))
+        for k, position in enumerate(positions):
+            item_x, item_y = dataset[position]
+            np.testing.assert_array_equal(x[k].numpy(), item_x.numpy())
+            np.testing.assert_array_equal(y[k].numpy(), item_y.numpy())
+
+    def test_feature_index(self):
+        arrays = sample_arrays()
+        dataset = SlidingWindowDataset(arrays, window_size=10, prediction_length=5, target_index=0,
+                                       feature_index=[2, 1], normalize=False)
+        x, y = dataset[0]
+        np.testing.assert_array_equal(x.numpy(), arrays[0][[2, 1], :10].T)
+        np.testing.assert_array_equal(y.numpy(), arrays[0][0, 10:15])
+        x, y = SlidingWindowDataset(arrays, window_size=10, prediction_length=5, feature_index=[2])[0]
+        np.testing.assert_allclose(x[-1].numpy(), [1.])
+        np.testing.assert_allclose(y.numpy(), np.arange(11, 16) / 10., rtol=1e-6)
+
+    def test_normalize(self):
+        dataset = SlidingWindowDataset(sample_arrays(), window_size=10, prediction_length=5)
+        x, y = dataset[3]
+        np.testing.assert_allclose(x[-1].numpy(), [1., 1., 1.])
+        np.testing.assert_allclose(y.numpy(), np.arange(14, 19) / 13., rtol=1e-6)
+
+    def test_batch_loader(self):
+        dataset = SlidingWindowDataset(sample_arrays(), window_size=10, prediction_length=5)
+        for num_workers in (0, 2):
+            batches = list(batch_loader(dataset, batch_size=16, shuffle=True, num_workers=num_workers))
+            self.assertEqual(sum(len(x) for x, _ in batches), len(dataset))
+            self.assertEqual(tuple(batches[0][0].shape), (16, 10, 3))
+
+    def test_from_columnar_cache(self):
+        frame = pd.DataFrame({'Adj Close': np.arange(100.), 'Volume': np.arange(100.) * 10},
+                             index=pd.date_range('2021-01-04', periods=100, freq='B', name='Date'))
+        with tempfile.TemporaryDirectory() as cache_dir:
+            write_columnar_cache({'IBM': frame}, cache_dir)
+            cache = ColumnarCache(cache_dir)
+            kwargs = dict(window_size=20, prediction_length=10, normalize=False)
+            train = SlidingWindowDataset.from_columnar_cache(cache, split='train', **kwargs)
+            test = SlidingWindowDataset.from_columnar_cache(cache, split='test', **kwargs)
+            valid = SlidingWindowDataset.from_columnar_cache(cache, split='valid', **kwargs)
+            self.assertEqual(len(train), 80 - 29)
+            self.assertEqual(float(train[len(train) - 1][1][-1]), 79.)
+            self.assertEqual((len(test), len(valid)), (1, 1))
+            np.testing.assert_array_equal(test[0][1].numpy(), np.arange(80., 90.))
+            np.testing.assert_array_equal(valid[0][1].numpy(), np.arange(90., 100.))
+            np.testing.assert_array_equal(valid[0][0].numpy()[:, 1], np.arange(70., 90.) * 10)
+            volume = SlidingWindowDataset.from_columnar_cache(cache, columns=['Volume'], **kwargs)
+            self.assertEqual(volume.features, 1)
+            self.assertTrue(np.shares_memory(volume._windows[0], cache.values('IBM')))
+            np.testing.assert_array_equal(volume[0][0].numpy()[:, 0], np.arange(20.) * 10)
+            np.testing.assert_array_equal(volume[0][1].numpy(), np.arange(20., 30.))
+
+
+if __name__ == '__main__':
+    unittest.main()
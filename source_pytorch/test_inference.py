@@ -0,0 +1,67 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import torch
+
+from source_pytorch.data import SlidingWindowDataset
+from source_pytorch.inference import BatchPredictor, export_model, load_predictor
+from source_pytorch.model import LSTM_Predictor
+from source_pytorch.train import save_model
+from source_deepar.display_quantiles import quantiles_chart_data
+
+
+def sample_windows(n_windows=10, window_size=20, features=2, seed=0):
+    rng = np.random.default_rng(seed)
+    return 100 + np.cumsum(rng.normal(0, 1, (n_windows, window_size, features)), axis=1)
+
+
+class InferenceTestCase(unittest.TestCase):
+    def setUp(self):
+        torch.manual_seed(0)
+        self.model = LSTM_Predictor(units=2, hidden_dim=8, layers=2, dropout=0.1, prediction_length=5).eval()
+        self.windows = sample_windows()
+
+    def test_export_matches_eager_model(self):
+        module = export_model(self.model, window_size=20, units=2)
+        x = torch.from_numpy(self.windows.astype(np.float32) / 100)
+        torch.testing.assert_close(module(x), self.model(x))
+        quantized = export_model(self.model, window_size=20, units=2, quantize=True)
+        self.assertEqual(tuple(quantized(x).shape), (10, 5))
+
+    def test_predict(self):
+        predictor = BatchPredictor(export_model(self.model, 20, 2), window_size=20, prediction_length=5, batch_size=3)
+        x = self.windows.astype(np.float32)
+        expected = self.model(torch.from_numpy(x / x[:, -1:, :])).detach().numpy() * x[:, -1, :1]
+        np.testing.assert_allclose(predictor.point_forecast(self.windows), expected, rtol=1e-5)
+        self.assertEqual(predictor.predict_array(self.windows).shape, (10, 3, 5))
+        predictions = predictor.predict(self.windows)
+        self.assertEqual(len(predictions), 10)
+        self.assertListEqual(sorted(predictions[0]), ["0.1", "0.5", "0.9"])
+        chart = quantiles_chart_data(predictions[0], target_ts=list(self.windows[0, :, 0]))
+        self.assertEqual(len(chart["quantiles"]["0.5"]), 5)
+
+    def test_calibrate(self):
+        rng = np.random.default_rng(1)
+        dataset = SlidingWindowDataset([100 + np.cumsum(rng.normal(0, 1, (2, 300)), axis=1)], 20, 5)
+        predictor = BatchPredictor(self.model, window_size=20, prediction_length=5)
+        error_quantiles = predictor.calibrate(dataset)
+        self.assertEqual(error_quantiles.shape, (3, 5))
+        self.assertTrue(np.all(error_quantiles[0] <= error_quantiles[2]))
+        values = predictor.predict_array(self.windows)
+        self.assertTrue(np.all(values[:, 0] <= values[:, 2]))
+
+    def test_load_predictor(self):
+        with tempfile.TemporaryDirectory() as model_dir:
+            save_model(self.model, model_dir, {"units": 2, "hidden_dim": 8, "layers": 2, "dropout": 0.1,
+                                               "prediction_length": 5, "window_size": 20,
+                                               "columns": ["Volume", "Adj Close"], "target_column": "Adj Close"})
+            predictor = load_predictor(model_dir, quantize=True)
+            self.assertTrue(os.path.exists(os.path.join(model_dir, 'model.pth')))
+        self.assertEqual(predictor.target_index, 1)
+        self.assertEqual(predictor.predict_array(self.windows).shape, (10, 3, 5))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+import json
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import torch
+import torch.nn as nn
+
+from source_pytorch.data import SlidingWindowDataset, batch_loader
+from source_pytorch.model import LSTM_Predictor
+from source_pytorch.train import MODEL_FILE, MODEL_INFO_FILE, save_model, train
+
+
+class LSTMPredictorTestCase(unittest.TestCase):
+    def test_multi_horizon_output(self):
+        model = LSTM_Predictor(units=3, hidden_dim=8, layers=2, dropout=0.1, prediction_length=5)
+        self.assertEqual(model.prediction_length, 5)
+        self.assertEqual(tuple(model(torch.ones(4, 12, 3)).shape), (4, 5))
+
+
+class TrainTestCase(unittest.TestCase):
+    def test_train(self):
+        torch.manual_seed(0)
+        rng = np.random.default_rng(0)
+        arrays = [100 + np.cumsum(rng.normal(0, 1, (2, 200)), axis=1) for _ in range(3)]
+        dataset = SlidingWindowDataset(arrays, window_size=20, prediction_length=5)
+        model = LSTM_Predictor(units=2, hidden_dim=16, layers=1, dropout=0., prediction_length=5)
+        logs = []
+        history = train(model, batch_loader(dataset, batch_size=64), 3, torch.optim.Adam(model.parameters(), lr=1e-2),
+                        nn.MSELoss(), valid_loader=batch_loader(dataset, batch_size=64, shuffle=False),
+                        log=logs.append)
+        self.assertEqual([stats["epoch"] for stats in history], [1, 2, 3])
+        self.assertLess(history[-1]["loss"], history[0]["loss"])
+        self.assertGreater(history[-1]["samples_per_second"], 0)
+        self.assertIsNotNone(history[-1]["valid_loss"])
+        self.assertIn("samples/s", logs[0])
+
+        with tempfile.TemporaryDirectory() as model_dir:
+            model_info = {"units": 2, "hidden_dim": 16, "layers": 1, "dropout": 0., "prediction_length": 5}
+            save_model(model, model_dir, model_info)
+            with open(os.path.join(model_dir, MODEL_INFO_FILE)) as fp:
+                self.assertDictEqual(json.load(fp), model_info)
+            loaded = LSTM_Predictor(**model_info)
+            loaded.load_state_dict(torch.load(os.path.join(model_dir, MODEL_FILE)))
+            x, _ = dataset[[0, 1]]
+            model.eval(), loaded.eval()
+            torch.testing.assert_close(loaded(x), model(x))
+
+
+if __name__ == '__main__':
+    unittest.main()
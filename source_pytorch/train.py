@@ -0,0 +1,129 @@
+r"""
+Batched CPU training of LSTM_Predictor on the windows of a columnar cache, e.g.
+`python -m source_pytorch.train --cache-dir stock_deepar/cache --model-dir model`.
+Training throughput is reported in samples (windows) per second, to be compared with the DeepAR baseline.
+"""
+import argparse
+import json
+import os
+import time
+
+import torch
+import torch.nn as nn
+
+from source_pytorch.data import SlidingWindowDataset, batch_loader
+from source_pytorch.model import LSTM_Predictor
+from utils.data_cache import ColumnarCache
+
+MODEL_INFO_FILE = 'model_info.json'
+MODEL_FILE = 'model.pth'
+# price and technical indicator columns of stock_deepar datasets, without the sparse dividends and splits ones
+DEFAULT_COLUMNS = ['Adj Close', 'Volume', '10_ac_ma', '20_ac_ma', '50_ac_ma', '10_ac_bb_u', '10_ac_bb_l',
+                   '20_ac_bb_u', '20_ac_bb_l', '50_ac_bb_u', '50_ac_bb_l']
+
+
+def train(model, train_loader, epochs, optimizer, loss_fn, valid_loader=None, log=print):
+    """
+    Trains a model, reporting loss and throughput after every epoch
+    :param model: a LSTM_Predictor
+    :param train_loader: iterable of (windows, targets) batches, e.g. returned by `batch_loader`
+    :param epochs: number of epochs
+    :param optimizer: torch optimizer of the model parameters
+    :param loss_fn: loss function of predictions and targets
+    :param valid_loader: iterable of validation batches, None to skip validation
+    :param log: function called with the report of every epoch
+    :return: list of per epoch dictionaries with "epoch", "loss", "valid_loss" and "samples_per_second" keys
+    """
+    history = []
+    for epoch in range(1, epochs + 1):
+        model.train()
+        total_loss, samples = 0., 0
+        start = time.perf_counter()
+        for x, y in train_loader:
+            optimizer.zero_grad()
+            loss = loss_fn(model(x), y)
+            loss.backward()
+            optimizer.step()
+            total_loss += loss.item() * len(x)
+            samples += len(x)
+        elapsed = time.perf_counter() - start
+        stats = {"epoch": epoch, "loss": total_loss / max(samples, 1),
+                 "valid_loss": None if valid_loader is None else evaluate(model, valid_loader, loss_fn),
+                 "samples_per_second": samples / elapsed if elapsed > 0 else float('inf')}
+        history.append(stats)
+        log("epoch %(epoch)d: loss %(loss).6f, valid loss %(valid_loss)s, %(samples_per_second).0f samples/s" % stats)
+    return history
+
+
+def evaluate(model, loader, loss_fn):
+    """
+    :return: the average loss of a model over the batches of a loader
+    """
+    model.eval()
+    total_loss, samples = 0., 0
+    with torch.no_grad():
+        for x, y in loader:
+            total_loss += loss_fn(model(x), y).item() * len(x)
+            samples += len(x)
+    return total_loss / max(samples, 1)
+
+
+def save_model(model, model_dir, model_info):
+    """
+    Saves model parameters and the arguments it has been built with
+    :param model: a LSTM_Predictor
+    :param model_dir: output directory
+    :param model_info: dictionary of LSTM_Predictor arguments, plus data parameters
+    """
+    os.makedirs(model_dir, exist_ok=True)
+    with open(os.path.join(model_dir, MODEL_INFO_FILE), 'w') as fp:
+        json.dump(model_info, fp)
+    torch.save(model.state_dict(), os.path.join(model_dir, MODEL_FILE))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Trains LSTM_Predictor on a columnar cache')
+    parser.add_argument('--cache-dir', default=os.path.join('stock_deepar', 'cache'))
+    parser.add_argument('--model-dir', default=os.environ.get('SM_MODEL_DIR', 'model'))
+    parser.add_argument('--tickers', nargs='+', default=None)
+    parser.add_argument('--columns', nargs='+', default=DEFAULT_COLUMNS)
+    parser.add_argument('--target-column', default='Adj Close')
+    parser.add_argument('--window-size', type=int, default=60)
+    parser.add_argument('--prediction-length', type=int, default=20)
+    parser.add_argument('--stride', type=int, default=1)
+    parser.add_argument('--hidden-dim', type=int, default=64)
+    parser.add_argument('--layers', type=int, default=2)
+    parser.add_argument('--dropout', type=float, default=0.2)
+    parser.add_argument('--epochs', type=int, default=10)
+    parser.add_argument('--batch-size', type=int, default=256)
+    parser.add_argument('--lr', type=float, default=1e-3)
+    parser.add_argument('--workers', type=int, default=2, help='data loading worker processes')
+    parser.add_argument('--threads', type=int, default=None, help='torch intra-op threads')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    torch.manual_seed(args.seed)
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    cache = ColumnarCache(args.cache_dir)
+    columns = args.columns
+    datasets = {split: SlidingWindowDataset.from_columnar_cache(cache, args.window_size, args.prediction_length,
+                                                                tickers=args.tickers, columns=columns,
+                                                                target_column=args.target_column, split=split,
+                                                                stride=args.stride)
+                for split in ('train', 'test')}
+    print("%d training windows, %d test windows, %d features" % (len(datasets['train']), len(datasets['test']),
+                                                                  len(columns)))
+
+    model_info = {"units": len(columns), "hidden_dim": args.hidden_dim, "layers": args.layers,
+                  "dropout": args.dropout, "prediction_length": args.prediction_length,
+                  "window_size": args.window_size, "columns": columns, "target_column": args.target_column}
+    model = LSTM_Predictor(len(columns), args.hidden_dim, args.layers, args.dropout, args.prediction_length)
+    train(model, batch_loader(datasets['train'], args.batch_size, shuffle=True, num_workers=args.workers),
+          args.epochs, torch.optim.Adam(model.parameters(), lr=args.lr), nn.MSELoss(),
+          valid_loader=batch_loader(datasets['test'], args.batch_size, shuffle=False))
+    save_model(model, args.model_dir, model_info)
+
+
+if __name__ == '__main__':
+    main()
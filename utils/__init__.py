@@ -1,3 +1,5 @@
 # this package implements functions that returns
 # technical analysis indicators
 from .technical_indicators import bollinger_bands, std_dev, volatility, moving_average
+from .technical_indicators import rolling_indicators, rolling_indicators_frame, RollingIndicators
+from .technical_indicators import panel_rolling_indicators, panel_moving_average, panel_std_dev, panel_bollinger_bands
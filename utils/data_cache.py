@@ -0,0 +1,164 @@
+# This file contains a columnar cache for stock_deepar datasets.
+# Each ticker full time series (test set plus validation set, since training and test sets
+# are included in it) is stored once as a float array block, with one contiguous row per column,
+# and is memory-mapped on load, so opening the cache costs next to nothing and every
+# train/test/validation slice is a zero-copy view.
+# Each ticker block spans a contiguous slice of the shared date index, from its first to its last date:
+# dates of the slice the ticker has no row for (e.g. a missing session) hold NaN values.
+# Cache layout:
+#   meta.json   - columns names and, for each ticker, its offset and length in the shared date index
+#   dates.npy   - shared date index (datetime64[D])
+#   <TICKER>.npy - float64 block shaped (columns, dates)
+
+import argparse
+import glob
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+META_FILE = 'meta.json'
+DATES_FILE = 'dates.npy'
+
+
+def write_columnar_cache(frames, cache_dir):
+    """
+    Writes time series dataframes into a columnar cache
+    :param frames: a dictionary of dataframes indexed by date, keyed by ticker name; all of them must have the same
+    columns, that are stored as float64; dates missing between the first and the last one of a ticker
+    are stored as NaN rows
+    :param cache_dir: cache directory, created if it does not exist
+    :return: the cache directory
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    frames = {ticker.upper(): df for ticker, df in frames.items()}
+    columns = list(next(iter(frames.values())).columns)
+    dates = pd.DatetimeIndex(sorted(set().union(*(df.index for df in frames.values()))))
+
+    tickers = {}
+    for ticker, df in frames.items():
+        if list(df.columns) != columns:
+            raise ValueError("%s columns differ from the ones of other tickers" % ticker)
+        offset = dates.get_loc(df.index.min())
+        span = dates[offset:dates.get_loc(df.index.max()) + 1]
+        if not span.equals(pd.DatetimeIndex(df.index)):
+            # gaps in the shared date index are filled with NaN
+            df = df.reindex(span)
+        np.save(os.path.join(cache_dir, ticker + '.npy'),
+                np.ascontiguousarray(df.to_numpy(dtype=np.float64).T))
+        tickers[ticker] = {"offset": int(offset), "length": len(df)}
+
+    np.save(os.path.join(cache_dir, DATES_FILE), dates.values.astype('datetime64[D]'))
+    # metadata are written last, a cache without them is not a valid one
+    with open(os.path.join(cache_dir, META_FILE), 'w') as fp:
+        json.dump({"columns": columns, "tickers": tickers}, fp)
+    return cache_dir
+
+
+def build_columnar_cache(csv_dir, cache_dir, tickers=None):
+    """
+    Builds a columnar cache from stock_deepar csv files, joining each ticker test and validation sets
+    :param csv_dir: directory containing {ticker}_test.csv and {ticker}_valid.csv files
+    :param cache_dir: cache directory, created if it does not exist
+    :param tickers: tickers to be cached, all the ones found in csv_dir if None
+    :return: a ColumnarCache instance opened on the cache directory
+    """
+    if tickers is None:
+        tickers = sorted(os.path.basename(f)[:-len('_test.csv')] for f in glob.glob(os.path.join(csv_dir, '*_test.csv')))
+    frames = {}
+    for ticker in tickers:
+        parts = [pd.read_csv(os.path.join(csv_dir, "%s_%s.csv" % (ticker.lower(), ds)), index_col=0, parse_dates=True)
+                 for ds in ('test', 'valid')]
+        frames[ticker] = pd.concat(parts)
+    write_columnar_cache(frames, cache_dir)
+    return ColumnarCache(cache_dir)
+
+
+class ColumnarCache(object):
+    """
+    Read access to a columnar cache written by `write_columnar_cache`.
+    Ticker blocks are memory-mapped the first time they are accessed, and every value returned
+    by this class is a view on them: nothing is parsed or copied.
+    """
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        with open(os.path.join(cache_dir, META_FILE)) as fp:
+            meta = json.load(fp)
+        self.columns = meta["columns"]
+        self._tickers = meta["tickers"]
+        self._column_index = {c: i for i, c in enumerate(self.columns)}
+        self._dates = np.load(os.path.join(cache_dir, DATES_FILE), mmap_mode='r')
+        self._blocks = {}
+
+    @property
+    def tickers(self):
+        return list(self._tickers)
+
+    def values(self, ticker, columns=None):
+        """
+        Ticker values block
+        :param ticker: ticker name
+        :param columns: a column name or a list of column names, all the columns if None
+        :return: a read-only array view shaped (columns, dates), or (dates,) for a single column name
+        """
+        ticker = ticker.upper()
+        if ticker not in self._blocks:
+            if ticker not in self._tickers:
+                raise KeyError("ticker %s not in cache %s" % (ticker, self.cache_dir))
+            self._blocks[ticker] = np.load(os.path.join(self.cache_dir, ticker + '.npy'), mmap_mode='r')
+        block = self._blocks[ticker]
+        if columns is None:
+            return block
+        if isinstance(columns, str):
+            return block[self._column_index[columns]]
+        idx = [self._column_index[c] for c in columns]
+        # contiguous column ranges are returned as views, as any other selection would be a copy
+        if idx == list(range(idx[0], idx[0] + len(idx))):
+            return block[idx[0]:idx[0] + len(idx)]
+        return block[idx]
+
+    def dates(self, ticker):
+        """
+        Ticker date index
+        :param ticker: ticker name
+        :return: a datetime64[D] array view
+        """
+        info = self._tickers[ticker.upper()]
+        return self._dates[info["offset"]:info["offset"] + info["length"]]
+
+    def split(self, ticker, prediction_length, columns=None):
+        """
+        Slices a ticker time series into train, test and validation set, as `train_test_valid_split` does
+        :param ticker: ticker name
+        :param prediction_length: prediction length to be used for data splitting
+        :param columns: a column name or a list of column names, all the columns if None
+        :return: train set, test set and validation set views, time being the last axis
+        """
+        values = self.values(ticker, columns)
+        length = values.shape[-1]
+        train_size = length - prediction_length * 2
+        test_size = length - prediction_length
+        return values[..., :train_size], values[..., :test_size], values[..., test_size:]
+
+    def frame(self, ticker, start=0, stop=None):
+        """
+        Ticker time series as a dataframe, whose values are not copied from the cache
+        :param ticker: ticker name
+        :param start: first position to be included
+        :param stop: position the dataframe stops at (excluded), the end of the time series if None
+        :return: a dataframe indexed by date, with the cached columns
+        """
+        values = self.values(ticker)[:, start:stop]
+        index = pd.DatetimeIndex(self.dates(ticker)[start:stop], name='Date')
+        return pd.DataFrame(values.T, index=index, columns=self.columns, copy=False)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Builds a columnar cache from stock_deepar csv files')
+    parser.add_argument('csv_dir', nargs='?', default=os.path.join('stock_deepar', 'csv'))
+    parser.add_argument('cache_dir', nargs='?', default=os.path.join('stock_deepar', 'cache'))
+    args = parser.parse_args()
+    cache = build_columnar_cache(args.csv_dir, args.cache_dir)
+    print("cached %s into %s" % (', '.join(cache.tickers), args.cache_dir))
@@ -1,10 +1,18 @@
 # This file contains data utility to prepare data.
 # Data slicing has been optimized to comply to DeepAR algorithm best practices
 # as in https://docs.aws.amazon.com/sagemaker/latest/dg/deepar.html
-# A couple of fuctions to remove weekdays is also planned to be implemented
+# Market days are handled by the cached trading calendars of utils/trading_calendar.py
 
-import datetime
-import pandas_market_calendars as mcal
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from utils.trading_calendar import DEFAULT_CALENDAR, get_trading_calendar
+
+# A backtest split: position of the first predicted element, number of predicted elements,
+# training data (or slice) and test data (or slice)
+BacktestSplit = namedtuple('BacktestSplit', ['origin', 'horizon', 'train', 'test'])
 
 
 def train_test_valid_split(ts, prediction_length):
@@ -28,40 +36,66 @@ def train_test_valid_split(ts, prediction_length):
     return ts_train, ts_test, ts_valid
 
 
-# TODO check function implementation to remove weekend days and holidays from stock prices time series
-def non_market_days_removal(ts, calendar_name='NYSE'):
-    """
-    This function removes week end and holidays from time series index
-    :param ts: input time series with daily frequency
-    :param calendar_name: a calendar name from the list at
-    https://pandas-market-calendars.readthedocs.io/en/latest/calendars.html
-    :return: a time series where all the days are all market days according to selected calendar
+def rolling_origin_splits(ts, prediction_length, n_origins=None, stride=None, gap=0, min_train_size=None,
+                          window_size=None, cutoffs=None, as_index=False):
     """
+    This function lazily generates rolling-origin backtest splits of input Time Series ts, oldest origin first.
+    For every origin, i.e. the position of the first predicted element:
+    * Training set ends gap elements before the origin; it starts at the beginning of the time series
+        (expanding window) or, if window_size is given, window_size elements before its end (sliding window).
+    * Test set holds the prediction_length elements starting at the origin.
+    Splits are views on ts (or slices, if as_index is True), so that any number of backtest windows
+    costs no copy of the time series.
 
-    # retrieving calendar
-    calendar = mcal.get_calendar(calendar_name)
-    # retrieving calendar schedule
-    schedule = calendar.schedule(start_date=ts.index[0], end_date=ts.index[-1])
-    # fixing index within the the date range
-    ts.index = calendar.date_range(schedule, frequency='1D')
-    return ts
-
-    for i, d in enumerate(ts):
-        week_day_num = d.index.day().weekday()
+    :param ts: Time series to be backtested: a dataframe or a pandas series, sliced by row,
+        or a numpy array, sliced along its last axis, as ColumnarCache values are
+    :param prediction_length: prediction length, or a list of prediction lengths each one generating its own splits
+    :param n_origins: number of origins, the most recent ones; all the available ones if None
+    :param stride: number of elements between two consecutive origins, prediction_length if None
+    :param gap: number of elements left out between training set end and origin
+    :param min_train_size: minimum number of training elements, prediction_length if None
+    :param window_size: number of training elements of a sliding window, expanding window if None
+    :param cutoffs: last training dates, or a single one (ts must have a DatetimeIndex), used instead of
+        n_origins and stride
+    :param as_index: if True, train and test are slices instead of data
+    :return: a generator of BacktestSplit(origin, horizon, train, test) tuples
+    """
+    is_pandas = isinstance(ts, (pd.DataFrame, pd.Series))
+    length = len(ts) if is_pandas else np.shape(ts)[-1]
+    horizons = [prediction_length] if np.isscalar(prediction_length) else list(prediction_length)
+    if cutoffs is not None:
+        if not is_pandas:
+            raise ValueError("cutoffs require a time series with a DatetimeIndex")
+        train_ends = ts.index.searchsorted(pd.to_datetime(np.atleast_1d(cutoffs)), side='right')
 
-        if week_day_num > 5:
-            delta = datetime.timedelta((8 - week_day_num))
-            ts.index[i] = d.index + delta
-            already_used_days.append(d.index[i])
+    for horizon in horizons:
+        horizon = int(horizon)
+        if cutoffs is not None:
+            origins = [int(end) + gap for end in train_ends]
         else:
-            ts.index[i], already_used_days = adjust_week_day(ts.index[i], already_used_days)
+            first_origin = (min_train_size or horizon) + gap
+            origins = list(range(length - horizon, first_origin - 1, -(stride or horizon)))[::-1]
+            if n_origins is not None:
+                origins = origins[max(0, len(origins) - n_origins):] if n_origins else []
 
-    return ts
+        for origin in origins:
+            train_end = origin - gap
+            if train_end <= 0 or origin + horizon > length:
+                continue
+            train_start = 0 if window_size is None else max(0, train_end - window_size)
+            train, test = slice(train_start, train_end), slice(origin, origin + horizon)
+            if not as_index:
+                train, test = (ts.iloc[train], ts.iloc[test]) if is_pandas else (ts[..., train], ts[..., test])
+            yield BacktestSplit(origin, horizon, train, test)
 
 
-# TODO implement a function to adjust weekdays according to weekdays sequence
-def adjust_week_day(current_day, already_used_days):
-    week_day_num = current_day.index.day().weekday()
-    if current_day in already_used_days:
-        adjust_week_day(current_day.day + datetime.timedelta((8 - week_day_num)))
-    return None, None
+def non_market_days_removal(ts, calendar_name=DEFAULT_CALENDAR):
+    """
+    This function removes week end and holidays from time series index
+    :param ts: input time series with daily frequency
+    :param calendar_name: a calendar name from the list at
+    https://pandas-market-calendars.readthedocs.io/en/latest/calendars.html
+    :return: a time series where all the days are all market days according to selected calendar
+    """
+    # the calendar schedule is computed once per exchange
+    return ts[get_trading_calendar(calendar_name).is_session(ts.index)]
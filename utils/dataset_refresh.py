@@ -0,0 +1,226 @@
+# This file contains the incremental refresh of stock_deepar datasets.
+# When new bars are available, only them are processed: technical indicators are computed on the new bars
+# plus the lookback tail of the stored time series they need, and every stored file is extended rather
+# than regenerated. Stored values are copied as they are, csv rows and json arrays are never parsed back,
+# so the refresh cost follows the number of new bars, not the length of the history.
+# Training, test and validation sets keep the layout of `train_test_valid_split`; every refreshed file
+# is staged in a temporary file and moved in place with `os.replace` once all of them are written,
+# so that a failed refresh leaves the datasets untouched and readers never see a partially written file.
+# Refreshed datasets:
+#   <csv_dir>/<ticker>_{train,test,valid}.csv
+#   <json_dir>/{train,test,validation}/<TICKER>.json, "Adj Close" target only
+#   <json_dir>/w_dyn_feat/{train,test,validation}/<TICKER>.json, with dynamic features (optional)
+
+import io
+import json
+import os
+import re
+import shutil
+import tempfile
+
+import pandas as pd
+
+from utils.technical_indicators import rolling_indicators_frame
+
+DATASETS = ('train', 'test', 'valid')
+# json folder of each dataset
+JSON_DATASETS = {'train': 'train', 'test': 'test', 'valid': 'validation'}
+DYN_FEAT_DIR = 'w_dyn_feat'
+TARGET_COLUMN = 'Adj Close'
+# bytes read at once when looking for the last lines of a file
+_TAIL_BLOCK_SIZE = 64 * 1024
+
+
+def csv_path(csv_dir, ticker, dataset):
+    return os.path.join(csv_dir, "%s_%s.csv" % (ticker.lower(), dataset))
+
+
+def json_path(json_dir, ticker, dataset, dyn_feat=False):
+    folder = os.path.join(json_dir, DYN_FEAT_DIR) if dyn_feat else json_dir
+    return os.path.join(folder, JSON_DATASETS[dataset], ticker.upper() + '.json')
+
+
+def read_csv_tail(path, rows):
+    """
+    Reads the last rows of a csv file without reading the whole file
+    :param path: csv file, with a header line and dates in the first column
+    :param rows: number of rows to be read
+    :return: a dataframe indexed by date, with at most `rows` rows
+    """
+    with open(path, 'rb') as fp:
+        header = fp.readline()
+        start = fp.tell()
+        end = fp.seek(0, os.SEEK_END)
+        position, tail = end, b''
+        # one more line is read, since the first one may be truncated
+        while position > start and tail.count(b'\n') <= rows:
+            position = max(start, position - _TAIL_BLOCK_SIZE)
+            fp.seek(position)
+            tail = fp.read(end - position)
+    lines = tail.splitlines(keepends=True)
+    lines = lines[-rows:] if rows > 0 else []
+    return pd.read_csv(io.BytesIO(header + b''.join(lines)), index_col=0, parse_dates=True)
+
+
+def last_stored_date(csv_dir, ticker):
+    """
+    :return: the date of the last stored bar of a ticker, i.e. the last date of its validation set
+    """
+    return read_csv_tail(csv_path(csv_dir, ticker, 'valid'), 1).index[-1]
+
+
+def refresh_ticker(csv_dir, ticker, bars, prediction_length, json_dir=None, dyn_feat=None,
+                   windows=(10, 20, 50), num_of_std=2):
+    """
+    Appends new bars to the stored datasets of a ticker, as if they were regenerated from scratch
+    by `train_test_valid_split` and `ts2dar_json` on the whole extended time series
+    :param csv_dir: directory of the stored {ticker}_train.csv, {ticker}_test.csv and {ticker}_valid.csv files
+    :param ticker: ticker name
+    :param bars: dataframe of daily bars indexed by date, with (at least) the stored columns that are not
+    technical indicators (e.g. yfinance history); only the bars following the last stored date are used
+    :param prediction_length: prediction length the datasets have been split with
+    :param json_dir: directory of the stored json datasets, json files are not refreshed if None;
+    json files that do not exist are not created
+    :param dyn_feat: list of the dynamic feature columns of the json datasets in the w_dyn_feat folder,
+    these datasets are not refreshed if None
+    :param windows: window sizes of the stored moving averages and Bollinger bands
+    :param num_of_std: number of standard deviations of the stored Bollinger bands
+    :return: number of appended bars
+    """
+    valid = pd.read_csv(csv_path(csv_dir, ticker, 'valid'), index_col=0, parse_dates=True)
+    if len(valid) != prediction_length:
+        raise ValueError("%s validation set has %d rows, %d expected" % (ticker, len(valid), prediction_length))
+    bars = bars.loc[bars.index > valid.index[-1]]
+    if bars.empty:
+        return 0
+
+    # stored tail: enough rows to fill indicators windows and to move prediction_length rows between datasets
+    lookback = max(max(windows) - 1, prediction_length)
+    stored = pd.concat([read_csv_tail(csv_path(csv_dir, ticker, 'test'), lookback), valid])
+    if len(stored) < 2 * prediction_length:
+        raise ValueError("%s stored time series is shorter than %d rows" % (ticker, 2 * prediction_length))
+    columns = list(stored.columns)
+    prices = pd.concat([stored[TARGET_COLUMN], bars[TARGET_COLUMN]])
+    indicators = rolling_indicators_frame(prices.iloc[-(len(bars) + max(windows) - 1):], windows=windows,
+                                          num_of_std=num_of_std).iloc[-len(bars):]
+    missing = [c for c in columns if c not in indicators.columns and c not in bars.columns]
+    if missing:
+        raise ValueError("%s new bars lack %s columns" % (ticker, ', '.join(missing)))
+    new = bars.drop(columns=[c for c in indicators.columns if c in bars.columns]).join(indicators)[columns]
+    new.index.name = stored.index.name
+    ts = pd.concat([stored, new])
+
+    # rows appended to each dataset, as sliced by train_test_valid_split before and after the update
+    end = len(stored)
+    appended = {'train': ts.iloc[end - 2 * prediction_length:len(ts) - 2 * prediction_length],
+                'test': ts.iloc[end - prediction_length:len(ts) - prediction_length]}
+    ts_valid = ts.iloc[-prediction_length:]
+
+    staged = []
+    try:
+        for dataset, rows in appended.items():
+            staged.append(_stage_append(csv_path(csv_dir, ticker, dataset), rows.to_csv(header=False)))
+        staged.append(_stage_write(csv_path(csv_dir, ticker, 'valid'), ts_valid.to_csv()))
+        if json_dir is not None:
+            json_sets = [(False, [TARGET_COLUMN])]
+            if dyn_feat is not None:
+                json_sets.append((True, [TARGET_COLUMN] + list(dyn_feat)))
+            for is_dyn_feat, json_columns in json_sets:
+                for dataset in DATASETS:
+                    path = json_path(json_dir, ticker, dataset, dyn_feat=is_dyn_feat)
+                    if not os.path.exists(path):
+                        continue
+                    if dataset == 'valid':
+                        staged.append(_stage_write(path, json.dumps(_json_obj(ts_valid, json_columns))))
+                    else:
+                        staged.append(_stage_json_append(path, [appended[dataset][c].tolist() for c in json_columns]))
+    except BaseException:
+        for tmp, _ in staged:
+            os.remove(tmp)
+        raise
+    # all the files are in place before any of them is replaced
+    for tmp, path in staged:
+        os.replace(tmp, path)
+    return len(new)
+
+
+def refresh_datasets(csv_dir, bars, prediction_length, json_dir=None, dyn_feat=None, windows=(10, 20, 50),
+                     num_of_std=2):
+    """
+    Appends new bars to the stored datasets of several tickers by means of `refresh_ticker`
+    :param csv_dir: directory of the stored csv datasets
+    :param bars: a dictionary of new bars dataframes keyed by ticker
+    :param prediction_length: prediction length the datasets have been split with
+    :param json_dir: directory of the stored json datasets, json files are not refreshed if None
+    :param dyn_feat: list of the dynamic feature columns of the json datasets in the w_dyn_feat folder
+    :param windows: window sizes of the stored moving averages and Bollinger bands
+    :param num_of_std: number of standard deviations of the stored Bollinger bands
+    :return: a dictionary of the number of appended bars keyed by ticker
+    """
+    return {ticker: refresh_ticker(csv_dir, ticker, df, prediction_length, json_dir=json_dir, dyn_feat=dyn_feat,
+                                   windows=windows, num_of_std=num_of_std)
+            for ticker, df in bars.items()}
+
+
+def _json_obj(ts, columns):
+    """
+    DeepAR json object of a dataframe, as `source_deepar.deepar_utils.series_to_json_obj` builds it
+    """
+    json_obj = {"start": str(ts.index[0]), "target": ts[columns[0]].tolist()}
+    if len(columns) > 1:
+        json_obj["dynamic_feat"] = [ts[c].tolist() for c in columns[1:]]
+    return json_obj
+
+
+def _temp_file(path):
+    """
+    Creates a temporary file next to path, so that it can replace it atomically
+    :return: file descriptor and name of the temporary file
+    """
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or '.', prefix='.' + os.path.basename(path), suffix='.tmp')
+    if os.path.exists(path):
+        shutil.copymode(path, tmp)
+    return fd, tmp
+
+
+def _stage_write(path, text):
+    fd, tmp = _temp_file(path)
+    with os.fdopen(fd, 'w') as fp:
+        fp.write(text)
+    return tmp, path
+
+
+def _stage_append(path, text):
+    """
+    Stages a copy of a file with some text appended to it
+    """
+    fd, tmp = _temp_file(path)
+    with os.fdopen(fd, 'wb') as fp:
+        with open(path, 'rb') as src:
+            shutil.copyfileobj(src, fp)
+            if fp.tell() and src.seek(-1, os.SEEK_END) >= 0 and src.read(1) != b'\n':
+                fp.write(b'\n')
+        fp.write(text.encode())
+    return tmp, path
+
+
+def _stage_json_append(path, values):
+    """
+    Stages a copy of a DeepAR json file whose number arrays (target first, then dynamic features)
+    are extended with new values, stored values being copied as text
+    :param values: list of the value lists appended to each array, in the order arrays appear in the file
+    """
+    with open(path) as fp:
+        text = fp.read()
+    # number arrays end with the closing brackets that do not follow another closing bracket
+    ends = list(re.finditer(r'[^\]\s]\s*\]', text))
+    if len(ends) != len(values):
+        raise ValueError("%s holds %d arrays, %d expected" % (path, len(ends), len(values)))
+    parts, position = [], 0
+    for match, new in zip(ends, values):
+        k = match.end() - 1
+        separator = '' if match.group(0)[0] == '[' else ', '
+        parts.extend([text[position:k], separator, json.dumps(new)[1:-1]])
+        position = k
+    parts.append(text[position:])
+    return _stage_write(path, ''.join(parts))
@@ -0,0 +1,182 @@
+# This file contains the scoring step of backtests: DeepAR forecasts and benchmark predictions,
+# e.g. the SMA benchmark, are compared with realized values for many tickers and origins at once.
+# Arrays are aligned on their leading axis (series) and on their last axis (horizon); any axis
+# in between (e.g. backtest origins) is scored together with the horizon.
+# Metrics are computed in batched NumPy form, and large panels are split into blocks of series
+# scored by a process pool.
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_QUANTILES = ("0.1", "0.5", "0.9")
+# panels with fewer values than this are scored in the calling process,
+# as sending arrays to worker processes would cost more than scoring them
+PARALLEL_MIN_VALUES = 10000000
+
+
+def mape(actual, predicted, axis=-1):
+    """
+    Computes the Mean Absolute Percentage Error, as a fraction, ignoring missing values
+    :param actual: array of realized values
+    :param predicted: array of predicted values, shaped as actual
+    :param axis: axis (or axes) the error is averaged over
+    :return: an array of errors, without the averaged axes
+    """
+    actual = np.asarray(actual, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.nanmean(np.abs(actual - predicted) / np.abs(actual), axis=axis)
+
+
+def rmse(actual, predicted, axis=-1):
+    """
+    Computes the Root Mean Squared Error, ignoring missing values
+    :param actual: array of realized values
+    :param predicted: array of predicted values, shaped as actual
+    :param axis: axis (or axes) the error is averaged over
+    :return: an array of errors, without the averaged axes
+    """
+    actual = np.asarray(actual, dtype=np.float64)
+    return np.sqrt(np.nanmean(np.square(actual - predicted), axis=axis))
+
+
+def weighted_quantile_loss(actual, quantile_values, quantiles, axis=-1):
+    """
+    Computes the weighted quantile loss of each quantile, as defined by DeepAR:
+    2 * sum(pinball loss) / sum(|actual|), ignoring missing values
+    :param actual: array of realized values shaped (..., horizon)
+    :param quantile_values: array of predicted quantiles shaped (..., quantiles, horizon)
+    :param quantiles: quantile levels, as strings or numbers
+    :param axis: axis (or axes) of actual the loss is summed over
+    :return: an array of losses, without the summed axes, with a trailing quantiles axis
+    """
+    actual = np.asarray(actual, dtype=np.float64)
+    levels = np.asarray([float(q) for q in quantiles])
+    axes = tuple(np.atleast_1d(axis) % actual.ndim)
+    # the quantiles axis is moved last, so that actual broadcasts against it
+    quantile_values = np.moveaxis(np.asarray(quantile_values, dtype=np.float64), -2, -1)
+    errors = actual[..., None] - quantile_values
+    pinball = np.where(errors >= 0, levels * errors, (levels - 1) * errors)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return 2 * np.nansum(pinball, axis=axes) / np.nansum(np.abs(actual), axis=axes)[..., None]
+
+
+def coverage(actual, lower, upper, axis=-1):
+    """
+    Computes the fraction of realized values falling within a prediction interval, ignoring missing values
+    :param actual: array of realized values
+    :param lower: array of interval lower bounds, shaped as actual
+    :param upper: array of interval upper bounds, shaped as actual
+    :param axis: axis (or axes) the fraction is computed over
+    :return: an array of fractions, without the averaged axes
+    """
+    actual = np.asarray(actual, dtype=np.float64)
+    inside = ((actual >= lower) & (actual <= upper)).astype(np.float64)
+    inside[np.isnan(actual)] = np.nan
+    return np.nanmean(inside, axis=axis)
+
+
+def samples_to_quantiles(samples, quantiles=DEFAULT_QUANTILES):
+    """
+    :param samples: array of sample paths shaped (..., samples, horizon)
+    :param quantiles: quantile levels, as strings or numbers
+    :return: an array of quantiles shaped (..., quantiles, horizon)
+    """
+    return np.moveaxis(np.quantile(samples, [float(q) for q in quantiles], axis=-2), 0, -2)
+
+
+def evaluate(actual, quantile_values=None, quantiles=DEFAULT_QUANTILES, samples=None, benchmark=None, series=None,
+             interval=("0.1", "0.9"), max_workers=None, parallel_min_values=PARALLEL_MIN_VALUES):
+    """
+    Scores the forecasts of many series, each one over all its origins and its whole horizon
+    :param actual: array of realized values shaped (series, ..., horizon)
+    :param quantile_values: array of predicted quantiles shaped (series, ..., quantiles, horizon),
+    or a ForecastBatch
+    :param quantiles: quantile levels of quantile_values, or levels computed from samples
+    :param samples: array of sample paths shaped (series, ..., samples, horizon), or a SampleForecast,
+    used if quantile_values is None
+    :param benchmark: array of benchmark predictions shaped as actual, None if there is no benchmark
+    :param series: series names, series positions if None
+    :param interval: quantiles bounding the prediction interval whose coverage is computed
+    :param max_workers: maximum number of worker processes, the number of CPUs if None,
+    1 to score in the calling process
+    :param parallel_min_values: minimum number of predicted quantile values of a panel scored by a process pool
+    :return: a pandas.DataFrame indexed by series, with "mape" and "rmse" columns of the median
+    (or, without it, of the mean sample path), "wql_<quantile>" columns, "mean_wql" and "coverage" columns
+    and, if there is a benchmark, "benchmark_mape" and "benchmark_rmse" columns
+    """
+    if quantile_values is None:
+        if samples is None:
+            raise ValueError("either quantile_values or samples must be given")
+        samples = getattr(samples, 'samples', samples)
+        quantile_values = samples_to_quantiles(samples, quantiles)
+    elif hasattr(quantile_values, 'values') and hasattr(quantile_values, 'quantiles'):
+        quantiles, quantile_values = quantile_values.quantiles, quantile_values.values
+    quantiles = [str(q) for q in quantiles]
+
+    actual = np.asarray(actual, dtype=np.float64)
+    n_series = actual.shape[0]
+    # origins and horizon are flattened into a single axis: (series, values) and (series, quantiles, values)
+    actual = actual.reshape(n_series, -1)
+    quantile_values = np.moveaxis(np.asarray(quantile_values, dtype=np.float64), -2, 1)
+    quantile_values = quantile_values.reshape(n_series, len(quantiles), -1)
+    if "0.5" in quantiles:
+        point = quantile_values[:, quantiles.index("0.5")]
+    elif samples is not None:
+        point = np.asarray(samples, dtype=np.float64).mean(axis=-2).reshape(n_series, -1)
+    else:
+        raise ValueError("quantile_values must include the \"0.5\" quantile")
+    if benchmark is not None:
+        benchmark = np.asarray(benchmark, dtype=np.float64).reshape(n_series, -1)
+    bounds = [quantiles.index(str(q)) for q in interval]
+
+    blocks = [(actual, quantile_values, point, benchmark)]
+    workers = max_workers or os.cpu_count() or 1
+    if workers > 1 and quantile_values.size >= parallel_min_values:
+        n_blocks = min(n_series, 4 * workers)
+        edges = np.linspace(0, n_series, n_blocks + 1).astype(int)
+        blocks = [(actual[a:b], quantile_values[a:b], point[a:b], None if benchmark is None else benchmark[a:b])
+                  for a, b in zip(edges[:-1], edges[1:]) if b > a]
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            scores = list(executor.map(_score_block, blocks, [quantiles] * len(blocks), [bounds] * len(blocks)))
+    else:
+        scores = [_score_block(blocks[0], quantiles, bounds)]
+
+    columns = {name: np.concatenate([block[name] for block in scores]) for name in scores[0]}
+    return pd.DataFrame(columns, index=pd.Index(np.arange(n_series) if series is None else series, name='series'))
+
+
+def summary_table(scores, benchmark_name='SMA', model_name='DeepAR'):
+    """
+    Summarizes the scores returned by `evaluate`, averaging them over series
+    :param scores: the pandas.DataFrame returned by `evaluate`
+    :param benchmark_name: benchmark row name
+    :param model_name: forecasting model row name
+    :return: a pandas.DataFrame with one row per model and MAPE, RMSE, mean wQL and coverage columns,
+    quantile metrics being missing for the benchmark
+    """
+    rows = {model_name: {'MAPE': scores['mape'].mean(), 'RMSE': scores['rmse'].mean(),
+                         'mean wQL': scores['mean_wql'].mean(), 'coverage': scores['coverage'].mean()}}
+    if 'benchmark_mape' in scores:
+        rows[benchmark_name] = {'MAPE': scores['benchmark_mape'].mean(), 'RMSE': scores['benchmark_rmse'].mean(),
+                                'mean wQL': np.nan, 'coverage': np.nan}
+    return pd.DataFrame.from_dict(rows, orient='index')
+
+
+def _score_block(block, quantiles, bounds):
+    """
+    Scores a block of series, arrays being shaped (series, values) and (series, quantiles, values)
+    """
+    actual, quantile_values, point, benchmark = block
+    wql = weighted_quantile_loss(actual, quantile_values, quantiles)
+    scores = {'mape': mape(actual, point), 'rmse': rmse(actual, point)}
+    for k, q in enumerate(quantiles):
+        scores['wql_' + q] = wql[:, k]
+    scores['mean_wql'] = wql.mean(axis=1)
+    scores['coverage'] = coverage(actual, quantile_values[:, bounds[0]], quantile_values[:, bounds[1]])
+    if benchmark is not None:
+        scores['benchmark_mape'] = mape(actual, benchmark)
+        scores['benchmark_rmse'] = rmse(actual, benchmark)
+    return scores
@@ -0,0 +1,110 @@
+# This file contains the builder of DeepAR dynamic features matrices.
+# Each time series dynamic features are gathered at once into a float32 block shaped (features, time),
+# extended across the prediction horizon, since DeepAR needs dynamic features values for every predicted
+# time step too. Horizon values are either the last observed ones held constant (HOLD_LAST), or, for the
+# technical indicators of the target column, recomputed on projected prices (RECOMPUTE); the indicators
+# of all the time series are then recomputed together, in a single panel computation.
+
+import re
+
+import numpy as np
+
+from utils.technical_indicators import panel_rolling_indicators
+
+HOLD_LAST = 'hold_last'
+RECOMPUTE = 'recompute'
+HORIZON_POLICIES = (HOLD_LAST, RECOMPUTE)
+# technical indicator column names, as written by rolling_indicators_frame, e.g. 10_ac_ma or 20_ac_bb_u
+_INDICATOR_COLUMN = re.compile(r'^(\d+)_([A-Za-z]+)_(ma|std|bb_u|bb_l)$')
+
+
+def parse_indicator_column(column, prefix='ac'):
+    """
+    :param column: a column name
+    :param prefix: column name infix identifying the indicators input time series ('ac' stands for Adjusted Close)
+    :return: window size and indicator key ('ma', 'std', 'bb_u' or 'bb_l') of a technical indicator column
+    computed on the prefix time series, None for any other column
+    """
+    match = _INDICATOR_COLUMN.match(str(column))
+    if match is None or match.group(2) != prefix:
+        return None
+    return int(match.group(1)), match.group(3)
+
+
+def feature_matrix(ts, dyn_feat, prediction_length=0, policy=HOLD_LAST, projected_prices=None, **kwargs):
+    """
+    Builds the dynamic features matrix of a single time series, by means of `feature_matrices`
+    :param ts: a time series dataframe
+    :param dyn_feat: list of dynamic features columns
+    :param prediction_length: number of predicted time steps the matrix is extended with
+    :param policy: horizon extension policy, one among HORIZON_POLICIES
+    :param projected_prices: target column values over the prediction horizon, used by the RECOMPUTE policy
+    :param kwargs: other `feature_matrices` arguments
+    :return: an array shaped (len(dyn_feat), len(ts) + prediction_length)
+    """
+    if projected_prices is not None:
+        projected_prices = np.asarray(projected_prices)[None]
+    return feature_matrices([ts], dyn_feat, prediction_length, policy, projected_prices, **kwargs)[0]
+
+
+def feature_matrices(frames, dyn_feat, prediction_length=0, policy=HOLD_LAST, projected_prices=None,
+                     target_column='Adj Close', num_of_std=2, prefix='ac', dtype=np.float32):
+    """
+    Builds the dynamic features matrices of several time series, extended across the prediction horizon.
+    With the HOLD_LAST policy, every feature keeps its last observed value over the horizon.
+    With the RECOMPUTE policy, moving averages, standard deviations and Bollinger bands of the target column
+    (columns named as by rolling_indicators_frame) are computed on the observed prices followed by the projected
+    ones, as they would be once those prices are observed; other features keep their last observed value.
+    :param frames: a list of time series dataframes
+    :param dyn_feat: list of dynamic features columns
+    :param prediction_length: number of predicted time steps the matrices are extended with
+    :param policy: horizon extension policy, one among HORIZON_POLICIES
+    :param projected_prices: array shaped (len(frames), prediction_length) of the target column values over
+    the prediction horizon (e.g. a previous median forecast), the last observed value of each time series if None
+    :param target_column: the column technical indicators are computed on
+    :param num_of_std: number of standard deviations used for Bollinger bands
+    :param prefix: column name infix of the target column indicators
+    :param dtype: matrices data type
+    :return: a list of arrays shaped (len(dyn_feat), len(ts) + prediction_length)
+    """
+    if policy not in HORIZON_POLICIES:
+        raise ValueError("policy must be one among %s" % ', '.join(HORIZON_POLICIES))
+    matrices = []
+    columns, positions = None, None
+    for ts in frames:
+        if columns is None or not ts.columns.equals(columns):
+            columns, positions = ts.columns, ts.columns.get_indexer(dyn_feat)
+            if (positions < 0).any():
+                raise KeyError("dynamic features %s not found" % [c for c, p in zip(dyn_feat, positions) if p < 0])
+        matrix = np.empty((len(dyn_feat), len(ts) + prediction_length), dtype=dtype)
+        # the values of a single dtype dataframe are a view on its block: features are gathered
+        # and converted by a single copy, features becoming rows
+        matrix[:, :len(ts)] = ts.to_numpy()[:, positions].T
+        matrix[:, len(ts):] = matrix[:, len(ts) - 1:len(ts)]
+        matrices.append(matrix)
+
+    indicators = {k: parse_indicator_column(c, prefix) for k, c in enumerate(dyn_feat)}
+    indicators = {k: parsed for k, parsed in indicators.items() if parsed is not None}
+    if policy == HOLD_LAST or not indicators or not prediction_length or not matrices:
+        return matrices
+
+    windows = sorted(set(window for window, _ in indicators.values()))
+    lookback = max(windows) - 1
+    # target prices of the last lookback observed time steps followed by the horizon, one column per time series;
+    # shorter time series are padded with leading NaN, as a ticker listed after the others in a panel
+    panel = np.full((lookback + prediction_length, len(frames)), np.nan)
+    for j, ts in enumerate(frames):
+        observed = ts[target_column].to_numpy(dtype=np.float64)[-lookback:] if lookback else []
+        panel[lookback - len(observed):lookback, j] = observed
+        if projected_prices is None:
+            panel[lookback:, j] = observed[-1] if len(observed) else ts[target_column].iloc[-1]
+    if projected_prices is not None:
+        panel[lookback:] = np.asarray(projected_prices, dtype=np.float64).reshape(len(frames), prediction_length).T
+    ind = panel_rolling_indicators(panel, windows=windows, num_of_std=num_of_std)
+
+    for k, (window, key) in indicators.items():
+        values = ind[key][windows.index(window), lookback:]
+        for j, matrix in enumerate(matrices):
+            # time series shorter than a window have no recomputed value, their last value is held
+            np.copyto(matrix[k, -prediction_length:], values[:, j], where=~np.isnan(values[:, j]))
+    return matrices
@@ -5,6 +5,9 @@
 import numpy as np
 import pandas as pd
 
+# number of tickers processed together by panel functions
+_PANEL_BLOCK_SIZE = 64
+
 
 # moving average
 def moving_average(time_series, window_size=20, fwd_fill_to_end=0):
@@ -81,3 +84,379 @@ def bollinger_bands(stock_price_time_series, window_size=20, num_of_std=2, fwd_f
     lower_band = rolling_mean - (rolling_std * num_of_std)
 
     return rolling_mean, upper_band, lower_band
+
+
+# fused multi-window indicators
+def rolling_indicators(prices, windows=(10, 20, 50), num_of_std=2, fwd_fill_to_end=0):
+    """
+    Computes Simple Moving Average, Standard Deviation and Bollinger bands for several window sizes
+    in a single vectorized pass over a contiguous float array.
+    Running sums of prices and squared prices are computed once and shared by every window,
+    so adding a window size costs a couple of array subtractions instead of a new rolling pass.
+    Results match `moving_average`, `std_dev` and `bollinger_bands`, backfill and `fwd_fill_to_end` included.
+    :param prices: a 1-D array-like (numpy array, list or pandas Series) containing numerical values
+    :param windows: window sizes used to compute the indicators
+    :param num_of_std: number of standard deviations used for Bollinger bands
+    :param fwd_fill_to_end: index from which computation must stop and propagate last value,
+    either a single value used for every window or a sequence with one value per window
+    :return: a dictionary with 'ma', 'std', 'bb_u' and 'bb_l' keys, each one an array
+    of shape (len(windows), len(prices)) whose rows follow `windows` order
+    """
+    x = np.ascontiguousarray(prices, dtype=np.float64)
+    if x.ndim != 1:
+        raise ValueError("prices must be a 1-D array, use panel_rolling_indicators for 2-D data")
+    return _rolling_indicators(x, windows, num_of_std, fwd_fill_to_end)
+
+
+# fused multi-window indicators, as a dataframe
+def rolling_indicators_frame(time_series, windows=(10, 20, 50), num_of_std=2, fwd_fill_to_end=0, prefix='ac'):
+    """
+    Computes moving averages and Bollinger bands for several window sizes by means of `rolling_indicators`
+    and arranges them with the same column names used in stock_deepar csv files (e.g. 10_ac_ma, 10_ac_bb_u)
+    :param time_series: a pandas time series input containing numerical values
+    :param windows: window sizes used to compute the indicators
+    :param num_of_std: number of standard deviations used for Bollinger bands
+    :param fwd_fill_to_end: index from which computation must stop and propagate last value
+    :param prefix: column name infix identifying the input time series ('ac' stands for Adjusted Close)
+    :return: a dataframe indexed as the input time series, with moving average columns first
+    and Bollinger bands (upper, lower) columns next
+    """
+    ind = rolling_indicators(time_series, windows=windows, num_of_std=num_of_std, fwd_fill_to_end=fwd_fill_to_end)
+    columns = {}
+    for i, w in enumerate(windows):
+        columns["%s_%s_ma" % (w, prefix)] = ind['ma'][i]
+    for i, w in enumerate(windows):
+        columns["%s_%s_bb_u" % (w, prefix)] = ind['bb_u'][i]
+        columns["%s_%s_bb_l" % (w, prefix)] = ind['bb_l'][i]
+    return pd.DataFrame(columns, index=getattr(time_series, 'index', None))
+
+
+# panel (multi-ticker) indicators
+def panel_rolling_indicators(panel, windows=(10, 20, 50), num_of_std=2, fwd_fill_to_end=0):
+    """
+    Computes Simple Moving Average, Standard Deviation and Bollinger bands for several window sizes
+    on every column of a date x ticker panel at once, with the same single pass used by `rolling_indicators`.
+    Each column is processed as its own time series starting at its first valid value: rows before it
+    (e.g. a ticker listed after the others) are left empty, while missing values after it are handled
+    as the single series functions do (windows containing them are backfilled).
+    :param panel: a pandas dataframe indexed by date with a column per ticker, or a 2-D array shaped (dates, tickers)
+    :param windows: window sizes used to compute the indicators
+    :param num_of_std: number of standard deviations used for Bollinger bands
+    :param fwd_fill_to_end: index from which computation must stop and propagate last value,
+    either a single value used for every window or a sequence with one value per window
+    :return: a dictionary with 'ma', 'std', 'bb_u' and 'bb_l' keys; for a dataframe input each value is
+    a dataframe with (window, ticker) columns, otherwise an array of shape (len(windows), dates, tickers)
+    """
+    x = np.ascontiguousarray(panel, dtype=np.float64)
+    if x.ndim != 2:
+        raise ValueError("panel must be 2-D, shaped (dates, tickers)")
+    # tickers are processed in blocks, with each ticker time series laid out contiguously,
+    # so that running sums of a block stay in cache
+    x = x.T
+    out = np.empty((4, len(windows)) + x.shape)
+    for j in range(0, len(x), _PANEL_BLOCK_SIZE):
+        block = np.ascontiguousarray(x[j:j + _PANEL_BLOCK_SIZE])
+        out_block = out[:, :, j:j + _PANEL_BLOCK_SIZE]
+        _rolling_indicators(block, windows, num_of_std, fwd_fill_to_end, out=out_block)
+        not_started = ~np.maximum.accumulate(~np.isnan(block), axis=-1)
+        np.copyto(out_block, np.nan, where=not_started)
+    out = out.transpose(0, 1, 3, 2)
+    ind = {'ma': out[0], 'std': out[1], 'bb_u': out[2], 'bb_l': out[3]}
+
+    if not isinstance(panel, pd.DataFrame):
+        return ind
+    columns = pd.MultiIndex.from_product([list(windows), panel.columns],
+                                         names=['window', panel.columns.name or 'ticker'])
+    return {key: pd.DataFrame(values.transpose(1, 0, 2).reshape(len(panel), -1), index=panel.index, columns=columns)
+            for key, values in ind.items()}
+
+
+# panel moving average
+def panel_moving_average(panel, window_size=20, fwd_fill_to_end=0):
+    """
+    Computes a Simple Moving Average (SMA) function on every column of a date x ticker panel
+    :param panel: a pandas dataframe indexed by date with a column per ticker, or a 2-D array shaped (dates, tickers)
+    :param window_size: a window size used to compute the SMA
+    :param fwd_fill_to_end: index from which computation must stop and propagate last value
+    :return: Simple Moving Average panel, with the same shape and type as the input one
+    """
+    return _panel_indicator(panel, 'ma', window_size, 2, fwd_fill_to_end)
+
+
+# panel standard deviation
+def panel_std_dev(panel, window_size=20, fwd_fill_to_end=0):
+    """
+    Computes Standard Deviation (STD) function on every column of a date x ticker panel
+    :param panel: a pandas dataframe indexed by date with a column per ticker, or a 2-D array shaped (dates, tickers)
+    :param window_size: a window size used to compute the STD
+    :param fwd_fill_to_end: index from which computation must stop and propagate last value
+    :return: Standard Deviation panel, with the same shape and type as the input one
+    """
+    return _panel_indicator(panel, 'std', window_size, 2, fwd_fill_to_end)
+
+
+# panel Bollinger bands
+def panel_bollinger_bands(panel, window_size=20, num_of_std=2, fwd_fill_to_end=0):
+    """
+    Computes Bollinger bands function values on every column of a date x ticker panel
+    :param panel: a pandas dataframe indexed by date with a column per ticker, or a 2-D array shaped (dates, tickers)
+    :param window_size: window size used for moving average and standard deviation computation
+    :param num_of_std: number of standard deviations used for the bands
+    :param fwd_fill_to_end: index from which computation must stop and propagate last value
+    :return: moving average panel, bollinger upper band panel, bollinger lower band panel
+    """
+    ind = panel_rolling_indicators(panel, windows=(window_size,), num_of_std=num_of_std,
+                                   fwd_fill_to_end=fwd_fill_to_end)
+    return tuple(_first_window(ind[key]) for key in ('ma', 'bb_u', 'bb_l'))
+
+
+def _panel_indicator(panel, key, window_size, num_of_std, fwd_fill_to_end):
+    """
+    Single window, single indicator panel computation
+    """
+    ind = panel_rolling_indicators(panel, windows=(window_size,), num_of_std=num_of_std,
+                                   fwd_fill_to_end=fwd_fill_to_end)
+    return _first_window(ind[key])
+
+
+def _first_window(values):
+    """
+    Drops the window dimension from a single window panel indicator
+    """
+    if isinstance(values, pd.DataFrame):
+        return values.droplevel('window', axis=1)
+    return values[0]
+
+
+# incremental rolling indicators
+class RollingIndicators(object):
+    """
+    Keeps the state needed to update moving averages, standard deviations and Bollinger bands
+    of several window sizes in constant time when a new price is available.
+    Only the last max(windows) prices are retained in a ring buffer, together with running sums
+    of prices and squared prices for each window, so the cost of an update does not depend
+    on the length of the history the state has been seeded with.
+    Values match those of `rolling_indicators` (or `moving_average`, `std_dev` and `bollinger_bands`)
+    at the same bar, once the windows are full; no backfill can be applied to live values,
+    so a window that is not full yet or that contains missing values yields NaN.
+    """
+
+    def __init__(self, windows=(10, 20, 50), num_of_std=2):
+        """
+        Initialize an empty state
+        :param windows: window sizes used to compute the indicators
+        :param num_of_std: number of standard deviations used for Bollinger bands
+        """
+        self.windows = tuple(int(w) for w in windows)
+        self.num_of_std = num_of_std
+        self._w = np.array(self.windows)
+        self._buffer = np.full(max(self.windows), np.nan)
+        self._pos = 0
+        self._count = 0
+        self._shift = np.nan
+        self._resync()
+
+    @classmethod
+    def from_history(cls, time_series, windows=(10, 20, 50), num_of_std=2):
+        """
+        Creates a state seeded with an existing time series, only its tail is actually used
+        :param time_series: a pandas time series or array-like containing numerical values
+        :param windows: window sizes used to compute the indicators
+        :param num_of_std: number of standard deviations used for Bollinger bands
+        :return: a RollingIndicators instance, up to date with the last value of the time series
+        """
+        state = cls(windows=windows, num_of_std=num_of_std)
+        x = np.asarray(time_series, dtype=np.float64)
+        tail = x[-len(state._buffer):]
+        state._buffer[:len(tail)] = tail
+        state._pos = len(tail) % len(state._buffer)
+        state._count = len(x)
+        state._resync()
+        return state
+
+    def update(self, price):
+        """
+        Adds a new price to the state
+        :param price: latest price value, NaN (or None) for a missing value
+        :return: indicators values after the update, as returned by `values`
+        """
+        price = np.nan if price is None else float(price)
+        if np.isnan(self._shift) and not np.isnan(price):
+            self._shift = price
+        size = len(self._buffer)
+        # values leaving each window, only meaningful for windows that were already full
+        leaving = self._buffer[(self._pos - self._w) % size]
+        full = self._count >= self._w
+        leaving_nan = full & np.isnan(leaving)
+        leaving = np.where(full & ~leaving_nan, leaving - self._shift, 0.)
+        entering = 0. if np.isnan(price) else price - self._shift
+
+        self._sums += entering - leaving
+        self._sq_sums += entering * entering - leaving * leaving
+        self._nan_counts += int(np.isnan(price)) - leaving_nan
+
+        self._buffer[self._pos] = price
+        self._pos = (self._pos + 1) % size
+        self._count += 1
+        # running sums are recomputed from the buffer once every buffer length updates,
+        # to bound floating point drift at an amortized constant cost
+        self._updates += 1
+        if self._updates >= size:
+            self._resync()
+        return self.values()
+
+    def values(self):
+        """
+        Current indicators values
+        :return: a dictionary with 'ma', 'std', 'bb_u' and 'bb_l' keys, each one an array
+        with a value for each window size
+        """
+        full = (self._count >= self._w) & (self._nan_counts == 0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mean = self._sums / self._w
+            var = np.maximum(self._sq_sums - self._sums * mean, 0.) / (self._w - 1)
+        ma = np.where(full, mean + self._shift, np.nan)
+        std = np.where(full & (self._w > 1), np.sqrt(var), np.nan)
+        return {'ma': ma, 'std': std, 'bb_u': ma + std * self.num_of_std, 'bb_l': ma - std * self.num_of_std}
+
+    def to_dict(self):
+        """
+        Serializes the state into a JSON compatible dictionary
+        :return: a dictionary that can be turned back into a state by `from_dict`
+        """
+        return {"windows": list(self.windows),
+                "num_of_std": self.num_of_std,
+                "buffer": [None if np.isnan(v) else float(v) for v in self._buffer],
+                "pos": self._pos,
+                "count": self._count}
+
+    @classmethod
+    def from_dict(cls, state_dict):
+        """
+        Restores a state serialized by `to_dict`
+        :param state_dict: a dictionary as returned by `to_dict`
+        :return: a RollingIndicators instance
+        """
+        state = cls(windows=state_dict["windows"], num_of_std=state_dict["num_of_std"])
+        state._buffer[:] = [np.nan if v is None else v for v in state_dict["buffer"]]
+        state._pos = int(state_dict["pos"])
+        state._count = int(state_dict["count"])
+        state._resync()
+        return state
+
+    def _resync(self):
+        """
+        Recomputes running sums from the buffered prices
+        """
+        size = len(self._buffer)
+        valid = ~np.isnan(self._buffer)
+        self._shift = self._buffer[valid].mean() if valid.any() else np.nan
+        self._sums = np.zeros(len(self._w))
+        self._sq_sums = np.zeros(len(self._w))
+        self._nan_counts = np.zeros(len(self._w), dtype=int)
+        for i, w in enumerate(self._w):
+            n = min(w, self._count)
+            last = self._buffer[(self._pos - 1 - np.arange(n)) % size]
+            centered = last[~np.isnan(last)] - self._shift
+            self._sums[i] = centered.sum()
+            self._sq_sums[i] = np.dot(centered, centered)
+            self._nan_counts[i] = np.isnan(last).sum()
+        self._updates = 0
+
+
+def _rolling_indicators(x, windows, num_of_std, fwd_fill_to_end, out=None):
+    """
+    Fused indicators computation along the last (time) axis of a 1-D or 2-D float array,
+    results are written in `out`, an array shaped (4, len(windows)) + x.shape, if given
+    """
+    windows = tuple(int(w) for w in windows)
+    fwd_fills = _per_window(fwd_fill_to_end, windows)
+    if out is None:
+        out = np.empty((4, len(windows)) + x.shape)
+
+    sums = _running_sums(x)
+    for i, (window_size, fwd_fill) in enumerate(zip(windows, fwd_fills)):
+        ma, std, bb_u, bb_l = out[:, i]
+        _rolling_mean_std(window_size, *sums, mean=ma, std=std)
+        if fwd_fill > 0:
+            ma[..., -fwd_fill:] = ma[..., [-fwd_fill]]
+            std[..., -fwd_fill:] = std[..., [-fwd_fill]]
+
+        '''
+        Indicators are empty for the first *n* days, where *n* is the window size,
+        so I'll use some backfill to fill NaN values
+        '''
+        missing = np.isnan(ma)
+        if missing.any():
+            src = np.nonzero(missing)[:-1] + (_backfill_index(missing)[missing],)
+            ma[missing] = ma[src]
+            std[missing] = std[src]
+
+        np.multiply(std, num_of_std, out=bb_u)
+        np.subtract(ma, bb_u, out=bb_l)
+        bb_u += ma
+    return {'ma': out[0], 'std': out[1], 'bb_u': out[2], 'bb_l': out[3]}
+
+
+def _per_window(value, windows):
+    """
+    Broadcasts a scalar parameter to one value per window size
+    """
+    if np.ndim(value) == 0:
+        return [int(value)] * len(windows)
+    if len(value) != len(windows):
+        raise ValueError("expected one value per window size, got %d for %d windows" % (len(value), len(windows)))
+    return [int(v) for v in value]
+
+
+def _running_sums(x):
+    """
+    Running sums of values, squared values and valid (non NaN) values count along the last axis.
+    Values are centered on their mean before accumulating, to keep squared sums small
+    and rolling variance computation numerically stable.
+    """
+    valid = ~np.isnan(x)
+    shift = np.nanmean(x, axis=-1, keepdims=True) if valid.any() else np.zeros(x.shape[:-1] + (1,))
+    centered = np.where(valid, x - shift, 0.)
+    pad = np.zeros(x.shape[:-1] + (1,))
+    s1 = np.concatenate((pad, np.cumsum(centered, axis=-1)), axis=-1)
+    s2 = np.concatenate((pad, np.cumsum(np.square(centered, out=centered), axis=-1)), axis=-1)
+    count = np.concatenate((pad.astype(np.int64), np.cumsum(valid, axis=-1)), axis=-1)
+    return s1, s2, count, shift
+
+
+def _rolling_mean_std(window_size, s1, s2, count, shift, mean, std):
+    """
+    Rolling mean and (sample) standard deviation from running sums, written in `mean` and `std` arrays;
+    as pandas rolling functions, a window containing any missing value yields NaN.
+    """
+    mean[..., :window_size - 1] = np.nan
+    std[..., :window_size - 1] = np.nan
+    if window_size > mean.shape[-1]:
+        return
+    w_mean, w_std = mean[..., window_size - 1:], std[..., window_size - 1:]
+    np.subtract(s1[..., window_size:], s1[..., :-window_size], out=w_mean)
+    np.subtract(s2[..., window_size:], s2[..., :-window_size], out=w_std)
+    w_mean /= window_size
+    w_std -= np.square(w_mean) * window_size
+    np.maximum(w_std, 0., out=w_std)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        w_std /= window_size - 1
+    np.sqrt(w_std, out=w_std)
+    w_mean += shift
+
+    not_full = (count[..., window_size:] - count[..., :-window_size]) != window_size
+    np.copyto(w_mean, np.nan, where=not_full)
+    np.copyto(w_std, np.nan, where=not_full)
+    if window_size == 1:
+        w_std[...] = np.nan
+
+
+def _backfill_index(missing):
+    """
+    Positions to be taken along the last axis to fill missing values with the next valid value,
+    as pandas backfill does; positions with no valid value after them point to the last one
+    """
+    n = missing.shape[-1]
+    idx = np.where(missing, n - 1, np.arange(n))
+    return np.minimum.accumulate(idx[..., ::-1], axis=-1)[..., ::-1]
@@ -0,0 +1,68 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from utils.data_cache import ColumnarCache, build_columnar_cache, write_columnar_cache
+from utils.data_prepare import train_test_valid_split
+from utils.testing import random_walk_bars
+
+
+def sample_frame(size=120, seed=0):
+    df = random_walk_bars(size, seed)
+    df['10_ac_ma'] = df['Adj Close'].rolling(10).mean().bfill()
+    return df
+
+
+class ColumnarCacheTestCase(unittest.TestCase):
+    prediction_length = 20
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.csv_dir = os.path.join(self.tmp_dir.name, 'csv')
+        os.makedirs(self.csv_dir)
+        self.frames = {'ibm': sample_frame(seed=0), 'aapl': sample_frame(seed=1)}
+        for ticker, df in self.frames.items():
+            _, test, valid = train_test_valid_split(df, self.prediction_length)
+            test.to_csv(os.path.join(self.csv_dir, ticker + '_test.csv'))
+            valid.to_csv(os.path.join(self.csv_dir, ticker + '_valid.csv'))
+        build_columnar_cache(self.csv_dir, os.path.join(self.tmp_dir.name, 'cache'))
+        self.cache = ColumnarCache(os.path.join(self.tmp_dir.name, 'cache'))
+
+    def tearDown(self):
+        self.cache = None
+        self.tmp_dir.cleanup()
+
+    def test_split_matches_train_test_valid_split(self):
+        self.assertListEqual(sorted(self.cache.tickers), ['AAPL', 'IBM'])
+        views = self.cache.split('IBM', self.prediction_length, 'Adj Close')
+        expected = train_test_valid_split(self.frames['ibm']['Adj Close'], self.prediction_length)
+        for view, ts in zip(views, expected):
+            np.testing.assert_allclose(view, ts.values, rtol=1e-12)
+            self.assertTrue(np.shares_memory(view, self.cache.values('IBM')))
+
+    def test_frame(self):
+        df = self.cache.frame('aapl')
+        pd.testing.assert_frame_equal(df, self.frames['aapl'].astype(float), check_freq=False, rtol=1e-12)
+        np.testing.assert_array_equal(self.cache.dates('AAPL'), self.frames['aapl'].index.values.astype('datetime64[D]'))
+
+
+class WriteColumnarCacheTestCase(unittest.TestCase):
+    def test_missing_dates_are_nan(self):
+        ibm, aapl = sample_frame(size=30, seed=0), sample_frame(size=30, seed=1)
+        # AAPL misses a session and is listed later than IBM
+        aapl = aapl.drop(aapl.index[10]).iloc[5:]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cache = ColumnarCache(write_columnar_cache({'ibm': ibm, 'aapl': aapl}, tmp_dir))
+            np.testing.assert_array_equal(cache.dates('AAPL'), ibm.index[5:].values.astype('datetime64[D]'))
+            df = cache.frame('AAPL')
+            self.assertTrue(df.loc[ibm.index[10]].isna().all())
+            pd.testing.assert_frame_equal(df.drop(ibm.index[10]), aapl.astype(float), check_freq=False)
+            pd.testing.assert_frame_equal(cache.frame('IBM'), ibm.astype(float), check_freq=False)
+            del df, cache
+
+
+if __name__ == '__main__':
+    unittest.main()
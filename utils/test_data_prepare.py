@@ -0,0 +1,72 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from utils.data_prepare import BacktestSplit, rolling_origin_splits
+
+
+def sample_frame(size=100):
+    return pd.DataFrame({'Adj Close': np.arange(size, dtype=float), 'Volume': np.arange(size, dtype=float) * 10},
+                        index=pd.date_range('2021-01-04', periods=size, freq='B', name='Date'))
+
+
+class RollingOriginSplitsTestCase(unittest.TestCase):
+
+    def test_expanding_window(self):
+        df = sample_frame()
+        splits = list(rolling_origin_splits(df, 10, stride=5))
+        self.assertEqual([s.origin for s in splits], list(range(10, 91, 5)))
+        for split in splits:
+            self.assertIsInstance(split, BacktestSplit)
+            self.assertEqual(split.horizon, 10)
+            self.assertEqual(split.train.index[0], df.index[0])
+            self.assertEqual(len(split.train), split.origin)
+            pd.testing.assert_frame_equal(split.test, df.iloc[split.origin:split.origin + 10])
+        self.assertEqual(splits[-1].test.index[-1], df.index[-1])
+
+    def test_splits_are_views(self):
+        df = sample_frame()
+        split = list(rolling_origin_splits(df['Adj Close'], 10, n_origins=1))[0]
+        self.assertTrue(np.shares_memory(split.train.values, df['Adj Close'].values))
+        self.assertTrue(np.shares_memory(split.test.values, df['Adj Close'].values))
+
+    def test_sliding_window_gap_and_n_origins(self):
+        values = np.arange(100.)
+        splits = list(rolling_origin_splits(values, 10, n_origins=3, gap=2, window_size=30))
+        self.assertEqual([s.origin for s in splits], [70, 80, 90])
+        for split in splits:
+            np.testing.assert_array_equal(split.train, np.arange(split.origin - 32, split.origin - 2))
+            np.testing.assert_array_equal(split.test, np.arange(split.origin, split.origin + 10))
+
+    def test_n_origins_beyond_available(self):
+        splits = list(rolling_origin_splits(np.arange(100.), 20, n_origins=6))
+        self.assertEqual([s.origin for s in splits], [20, 40, 60, 80])
+
+    def test_multiple_horizons_as_index(self):
+        panel = np.zeros((3, 50))
+        splits = list(rolling_origin_splits(panel, [5, 10], n_origins=2, as_index=True))
+        self.assertEqual([(s.origin, s.horizon) for s in splits], [(40, 5), (45, 5), (30, 10), (40, 10)])
+        self.assertEqual(splits[0].train, slice(0, 40))
+        self.assertEqual(splits[0].test, slice(40, 45))
+        self.assertEqual(panel[..., splits[-1].test].shape, (3, 10))
+
+    def test_cutoffs(self):
+        df = sample_frame()
+        cutoffs = [df.index[29], df.index[59], df.index[95]]
+        splits = list(rolling_origin_splits(df, 5, cutoffs=cutoffs))
+        # the last cutoff leaves fewer than 5 test elements, so it is skipped
+        self.assertEqual([s.origin for s in splits], [30, 60])
+        self.assertEqual(splits[0].train.index[-1], cutoffs[0])
+        with self.assertRaises(ValueError):
+            next(rolling_origin_splits(np.arange(10.), 5, cutoffs=cutoffs))
+        # a single cutoff date
+        self.assertEqual([s.origin for s in rolling_origin_splits(df, 5, cutoffs=df.index[29])], [30])
+        self.assertEqual([s.origin for s in rolling_origin_splits(df, 5, cutoffs='2021-02-12')], [30])
+
+    def test_too_short(self):
+        self.assertListEqual(list(rolling_origin_splits(np.arange(15.), 10)), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+from utils.data_prepare import train_test_valid_split
+from utils.dataset_refresh import last_stored_date, read_csv_tail, refresh_datasets, refresh_ticker
+from utils.technical_indicators import rolling_indicators_frame
+from utils.testing import random_walk_bars
+
+DYN_FEAT = ['10_ac_ma', '20_ac_bb_u']
+
+
+def sample_bars(size=300, seed=0):
+    bars = random_walk_bars(size, seed, start='2020-01-02')
+    bars.insert(1, 'Close', bars['Adj Close'] + 1)
+    bars['Dividends'] = 0.
+    return bars
+
+
+def sample_frame(bars):
+    return bars.join(rolling_indicators_frame(bars['Adj Close']))
+
+
+def write_datasets(df, csv_dir, json_dir, ticker, prediction_length):
+    """
+    Writes csv and json datasets from scratch, as 3.DeepAR-StockPricesPredictions notebook does
+    """
+    for dataset, ts in zip(('train', 'test', 'valid'), train_test_valid_split(df, prediction_length)):
+        ts.to_csv(os.path.join(csv_dir, "%s_%s.csv" % (ticker.lower(), dataset)), header=True, index=True)
+        json_dataset = 'validation' if dataset == 'valid' else dataset
+        for folder, columns in ((json_dir, []), (os.path.join(json_dir, 'w_dyn_feat'), DYN_FEAT)):
+            os.makedirs(os.path.join(folder, json_dataset), exist_ok=True)
+            json_obj = {"start": str(ts.index[0]), "target": list(ts['Adj Close'])}
+            if columns:
+                json_obj["dynamic_feat"] = [list(ts[c]) for c in columns]
+            with open(os.path.join(folder, json_dataset, ticker + '.json'), 'w') as fp:
+                json.dump(json_obj, fp)
+
+
+class DatasetRefreshTestCase(unittest.TestCase):
+    prediction_length = 20
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.stored_dir = os.path.join(self.tmp_dir.name, 'stored')
+        self.expected_dir = os.path.join(self.tmp_dir.name, 'expected')
+        self.bars = sample_bars()
+        for root in (self.stored_dir, self.expected_dir):
+            os.makedirs(os.path.join(root, 'csv'))
+        write_datasets(sample_frame(self.bars.iloc[:-7]), os.path.join(self.stored_dir, 'csv'),
+                       os.path.join(self.stored_dir, 'json'), 'IBM', self.prediction_length)
+        write_datasets(sample_frame(self.bars), os.path.join(self.expected_dir, 'csv'),
+                       os.path.join(self.expected_dir, 'json'), 'IBM', self.prediction_length)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def refresh(self, bars):
+        return refresh_ticker(os.path.join(self.stored_dir, 'csv'), 'IBM', bars, self.prediction_length,
+                              json_dir=os.path.join(self.stored_dir, 'json'), dyn_feat=DYN_FEAT)
+
+    def stored_files(self, root):
+        files = {}
+        for folder, _, names in os.walk(root):
+            for name in names:
+                files[os.path.relpath(os.path.join(folder, name), root)] = os.path.join(folder, name)
+        return files
+
+    def test_matches_full_regeneration(self):
+        self.assertEqual(last_stored_date(os.path.join(self.stored_dir, 'csv'), 'ibm'), self.bars.index[-8])
+        # already stored bars are skipped
+        self.assertEqual(self.refresh(self.bars), 7)
+        self.assertEqual(last_stored_date(os.path.join(self.stored_dir, 'csv'), 'ibm'), self.bars.index[-1])
+
+        stored, expected = self.stored_files(self.stored_dir), self.stored_files(self.expected_dir)
+        self.assertListEqual(sorted(stored), sorted(expected))
+        for name, path in expected.items():
+            if name.endswith('.csv'):
+                pd.testing.assert_frame_equal(pd.read_csv(stored[name], index_col=0, parse_dates=True),
+                                              pd.read_csv(path, index_col=0, parse_dates=True), rtol=1e-9)
+            else:
+                with open(stored[name]) as fp, open(path) as fp_expected:
+                    actual, desired = json.load(fp), json.load(fp_expected)
+                self.assertEqual(actual["start"], desired["start"])
+                np.testing.assert_allclose(actual["target"], desired["target"])
+                np.testing.assert_allclose(actual.get("dynamic_feat", []), desired.get("dynamic_feat", []))
+
+    def test_no_new_bars(self):
+        before = {name: os.path.getmtime(path) for name, path in self.stored_files(self.stored_dir).items()}
+        self.assertEqual(self.refresh(self.bars.iloc[:-7]), 0)
+        self.assertDictEqual(before, {name: os.path.getmtime(path)
+                                      for name, path in self.stored_files(self.stored_dir).items()})
+
+    def test_failed_refresh_leaves_datasets_untouched(self):
+        before = {name: open(path).read() for name, path in self.stored_files(self.stored_dir).items()}
+        with self.assertRaises(ValueError):
+            self.refresh(self.bars.drop(columns=['Dividends']))
+        # a json file whose arrays do not match is detected after csv files have been staged
+        with self.assertRaises(ValueError):
+            refresh_ticker(os.path.join(self.stored_dir, 'csv'), 'IBM', self.bars, self.prediction_length,
+                           json_dir=os.path.join(self.stored_dir, 'json'), dyn_feat=DYN_FEAT[:1])
+        with self.assertRaises(ValueError):
+            refresh_datasets(os.path.join(self.stored_dir, 'csv'), {'IBM': self.bars}, self.prediction_length + 1)
+        self.assertDictEqual(before, {name: open(path).read() for name, path in self.stored_files(self.stored_dir).items()})
+
+    def test_read_csv_tail(self):
+        path = os.path.join(self.expected_dir, 'csv', 'ibm_test.csv')
+        full = pd.read_csv(path, index_col=0, parse_dates=True)
+        pd.testing.assert_frame_equal(read_csv_tail(path, 5), full.iloc[-5:])
+        pd.testing.assert_frame_equal(read_csv_tail(path, len(full) + 10), full)
+        with mock.patch('utils.dataset_refresh._TAIL_BLOCK_SIZE', 100):
+            pd.testing.assert_frame_equal(read_csv_tail(path, 30), full.iloc[-30:])
+
+
+if __name__ == '__main__':
+    unittest.main()
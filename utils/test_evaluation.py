@@ -0,0 +1,81 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from utils.evaluation import coverage, evaluate, mape, rmse, samples_to_quantiles, summary_table, \
+    weighted_quantile_loss
+
+
+def sample_panel(n_series=6, n_origins=3, horizon=5, n_samples=50, seed=0):
+    rng = np.random.default_rng(seed)
+    actual = 100 + rng.normal(0, 5, (n_series, n_origins, horizon))
+    samples = actual[:, :, None, :] + rng.normal(0, 5, (n_series, n_origins, n_samples, horizon))
+    benchmark = actual + rng.normal(0, 3, actual.shape)
+    return actual, samples, benchmark
+
+
+class MetricsTestCase(unittest.TestCase):
+    def test_point_metrics(self):
+        actual = np.array([[100., 200., np.nan], [50., 50., 50.]])
+        predicted = np.array([[110., 180., 0.], [50., 55., 45.]])
+        np.testing.assert_allclose(mape(actual, predicted), [0.1, 0.2 / 3])
+        np.testing.assert_allclose(rmse(actual, predicted), [np.sqrt(250.), np.sqrt(50 / 3)])
+        np.testing.assert_allclose(coverage(actual, predicted - 5, predicted + 5), [0., 1.])
+
+    def test_weighted_quantile_loss(self):
+        actual, samples, _ = sample_panel()
+        quantile_values = samples_to_quantiles(samples, ["0.1", "0.9"])
+        self.assertEqual(quantile_values.shape, (6, 3, 2, 5))
+        wql = weighted_quantile_loss(actual, quantile_values, ["0.1", "0.9"], axis=(1, 2))
+        self.assertEqual(wql.shape, (6, 2))
+        for k, q in enumerate((0.1, 0.9)):
+            errors = actual[0] - quantile_values[0, :, k]
+            pinball = np.maximum(q * errors, (q - 1) * errors)
+            self.assertAlmostEqual(wql[0, k], 2 * pinball.sum() / np.abs(actual[0]).sum())
+
+
+class EvaluateTestCase(unittest.TestCase):
+    def setUp(self):
+        self.actual, self.samples, self.benchmark = sample_panel()
+        self.series = ['S%d' % k for k in range(6)]
+
+    def test_scores(self):
+        scores = evaluate(self.actual, samples=self.samples, benchmark=self.benchmark, series=self.series)
+        self.assertListEqual(list(scores.index), self.series)
+        self.assertListEqual(list(scores.columns), ['mape', 'rmse', 'wql_0.1', 'wql_0.5', 'wql_0.9', 'mean_wql',
+                                                    'coverage', 'benchmark_mape', 'benchmark_rmse'])
+        median = np.median(self.samples[2], axis=1)
+        self.assertAlmostEqual(scores.loc['S2', 'rmse'], np.sqrt(np.mean((self.actual[2] - median) ** 2)))
+        self.assertAlmostEqual(scores.loc['S2', 'benchmark_mape'],
+                               np.mean(np.abs(self.actual[2] - self.benchmark[2]) / self.actual[2]))
+        quantile_values = samples_to_quantiles(self.samples[2])
+        inside = (self.actual[2] >= quantile_values[:, 0]) & (self.actual[2] <= quantile_values[:, 2])
+        self.assertAlmostEqual(scores.loc['S2', 'coverage'], inside.mean())
+
+    def test_quantiles_match_samples(self):
+        quantile_values = samples_to_quantiles(self.samples)
+        pd.testing.assert_frame_equal(evaluate(self.actual, quantile_values),
+                                      evaluate(self.actual, samples=self.samples))
+
+    def test_process_pool(self):
+        expected = evaluate(self.actual, samples=self.samples, benchmark=self.benchmark)
+        scores = evaluate(self.actual, samples=self.samples, benchmark=self.benchmark, max_workers=2,
+                          parallel_min_values=0)
+        pd.testing.assert_frame_equal(scores, expected)
+
+    def test_summary_table(self):
+        scores = evaluate(self.actual, samples=self.samples, benchmark=self.benchmark)
+        table = summary_table(scores)
+        self.assertListEqual(list(table.index), ['DeepAR', 'SMA'])
+        self.assertListEqual(list(table.columns), ['MAPE', 'RMSE', 'mean wQL', 'coverage'])
+        self.assertAlmostEqual(table.loc['SMA', 'RMSE'], scores['benchmark_rmse'].mean())
+        self.assertTrue(np.isnan(table.loc['SMA', 'coverage']))
+
+    def test_missing_median(self):
+        with self.assertRaises(ValueError):
+            evaluate(self.actual, samples_to_quantiles(self.samples, ["0.1", "0.9"]), quantiles=["0.1", "0.9"])
+
+
+if __name__ == '__main__':
+    unittest.main()
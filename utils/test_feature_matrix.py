@@ -0,0 +1,62 @@
+import unittest
+
+import numpy as np
+
+from utils.feature_matrix import HOLD_LAST, RECOMPUTE, feature_matrices, feature_matrix, parse_indicator_column
+from utils.technical_indicators import rolling_indicators_frame
+from utils.testing import random_walk_bars
+
+DYN_FEAT = ['Volume', '10_ac_ma', '20_ac_bb_u', '20_ac_bb_l']
+
+
+def sample_frame(size=120, seed=0):
+    bars = random_walk_bars(size, seed)
+    return bars.join(rolling_indicators_frame(bars['Adj Close'], windows=(10, 20)))
+
+
+class FeatureMatrixTestCase(unittest.TestCase):
+    def test_parse_indicator_column(self):
+        self.assertEqual(parse_indicator_column('10_ac_ma'), (10, 'ma'))
+        self.assertEqual(parse_indicator_column('50_ac_bb_l'), (50, 'bb_l'))
+        self.assertIsNone(parse_indicator_column('Volume'))
+        self.assertIsNone(parse_indicator_column('10_vol_ma'))
+
+    def test_hold_last(self):
+        df = sample_frame()
+        matrix = feature_matrix(df, DYN_FEAT, prediction_length=5)
+        self.assertEqual(matrix.shape, (4, 125))
+        self.assertEqual(matrix.dtype, np.float32)
+        np.testing.assert_array_equal(matrix[:, :120], df[DYN_FEAT].to_numpy(dtype=np.float32).T)
+        np.testing.assert_array_equal(matrix[:, 120:], np.repeat(matrix[:, 119:120], 5, axis=1))
+        self.assertEqual(feature_matrix(df, DYN_FEAT, dtype=np.float64).shape, (4, 120))
+
+    def test_recompute_matches_observed_prices(self):
+        full = sample_frame(size=130)
+        df = full.iloc[:120]
+        projected = full['Adj Close'].iloc[120:]
+        matrix = feature_matrix(df, DYN_FEAT, prediction_length=10, policy=RECOMPUTE, projected_prices=projected,
+                                dtype=np.float64)
+        # indicators are the ones computed once projected prices are observed, other features are held
+        np.testing.assert_allclose(matrix[1:, 120:], full[DYN_FEAT[1:]].iloc[120:].to_numpy().T, rtol=1e-9)
+        np.testing.assert_array_equal(matrix[0, 120:], df['Volume'].iloc[-1])
+
+    def test_many_series(self):
+        frames = [sample_frame(size=size, seed=size) for size in (120, 60, 15)]
+        matrices = feature_matrices(frames, DYN_FEAT, prediction_length=5, policy=RECOMPUTE)
+        for df, matrix in zip(frames, matrices):
+            self.assertEqual(matrix.shape, (4, len(df) + 5))
+            # 20 days indicators of the 15 days time series are missing, both observed and recomputed
+            self.assertFalse(np.isnan(matrix[:2]).any())
+            # the default projection holds the last price
+            last = df['Adj Close'].iloc[-1]
+            expected = (df['Adj Close'].iloc[-9:].sum() + last) / 10
+            self.assertAlmostEqual(float(matrix[1, len(df)]), expected, places=4)
+        single = feature_matrix(frames[1], DYN_FEAT, prediction_length=5, policy=RECOMPUTE)
+        np.testing.assert_array_equal(single, matrices[1])
+        with self.assertRaises(ValueError):
+            feature_matrices(frames, DYN_FEAT, prediction_length=5, policy='unknown')
+        self.assertListEqual(feature_matrices([], DYN_FEAT, 5, HOLD_LAST), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
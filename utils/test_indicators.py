@@ -1,8 +1,118 @@
+import json
 import unittest
 
+import numpy as np
+import pandas as pd
+
+from utils.technical_indicators import moving_average, std_dev, bollinger_bands
+from utils.technical_indicators import rolling_indicators, rolling_indicators_frame, RollingIndicators
+from utils.technical_indicators import panel_rolling_indicators, panel_bollinger_bands
+from utils.testing import random_walk_bars
+
+
+def sample_prices(size=500, seed=0):
+    return random_walk_bars(size, seed, start='2004-08-19')['Adj Close']
+
+
 class MyTestCase(unittest.TestCase):
     def test_something(self):
         self.assertEqual(True, False)
 
+
+class RollingIndicatorsTestCase(unittest.TestCase):
+    windows = (10, 20, 50)
+
+    def assert_matches_batch(self, prices, fwd_fill_to_end=0):
+        fwd_fills = fwd_fill_to_end if np.ndim(fwd_fill_to_end) else [fwd_fill_to_end] * len(self.windows)
+        ind = rolling_indicators(prices, self.windows, fwd_fill_to_end=fwd_fill_to_end)
+        for i, (w, ff) in enumerate(zip(self.windows, fwd_fills)):
+            ma, bb_u, bb_l = bollinger_bands(prices, window_size=w, fwd_fill_to_end=ff)
+            np.testing.assert_allclose(ind['ma'][i], ma.values, rtol=1e-9)
+            np.testing.assert_allclose(ind['std'][i], std_dev(prices, w, ff).values, rtol=1e-6)
+            np.testing.assert_allclose(ind['bb_u'][i], bb_u.values, rtol=1e-9)
+            np.testing.assert_allclose(ind['bb_l'][i], bb_l.values, rtol=1e-9)
+
+    def test_matches_batch_functions(self):
+        self.assert_matches_batch(sample_prices())
+
+    def test_fwd_fill_to_end(self):
+        self.assert_matches_batch(sample_prices(), fwd_fill_to_end=5)
+        self.assert_matches_batch(sample_prices(), fwd_fill_to_end=self.windows)
+
+    def test_missing_values(self):
+        prices = sample_prices()
+        prices.iloc[[0, 1, 120, 121, 300]] = np.nan
+        self.assert_matches_batch(prices)
+
+    def test_frame_columns(self):
+        prices = sample_prices()
+        df = rolling_indicators_frame(prices, self.windows)
+        self.assertListEqual(list(df.columns[:3]), ['10_ac_ma', '20_ac_ma', '50_ac_ma'])
+        self.assertListEqual(list(df.columns[-2:]), ['50_ac_bb_u', '50_ac_bb_l'])
+        pd.testing.assert_series_equal(df['20_ac_ma'], moving_average(prices, 20), check_names=False)
+
+
+class PanelIndicatorsTestCase(unittest.TestCase):
+    windows = (10, 20, 50)
+
+    def sample_panel(self):
+        panel = pd.concat({t: sample_prices(seed=i) for i, t in enumerate(['IBM', 'AAPL', 'AMZN', 'GOOGL'])}, axis=1)
+        panel.iloc[:80, 1] = np.nan  # ragged start
+        panel.iloc[[200, 201, 350], 2] = np.nan  # gaps
+        panel.iloc[-30:, 3] = np.nan  # ragged end
+        return panel
+
+    def test_matches_single_series(self):
+        panel = self.sample_panel()
+        ind = panel_rolling_indicators(panel, self.windows)
+        for ticker in panel:
+            ts = panel[ticker].loc[panel[ticker].first_valid_index():]
+            expected = rolling_indicators(ts, self.windows)
+            for i, w in enumerate(self.windows):
+                for key in ('ma', 'std', 'bb_u', 'bb_l'):
+                    np.testing.assert_allclose(ind[key][(w, ticker)].loc[ts.index].values, expected[key][i],
+                                               rtol=1e-6)
+        self.assertTrue(ind['ma'][(10, 'AAPL')].iloc[:80].isna().all())
+
+    def test_array_input(self):
+        panel = self.sample_panel()
+        ma, bb_u, bb_l = panel_bollinger_bands(panel.values, window_size=20)
+        self.assertEqual(ma.shape, panel.shape)
+        np.testing.assert_allclose(bb_u, panel_bollinger_bands(panel, window_size=20)[1].values, equal_nan=True)
+
+
+class RollingIndicatorsStateTestCase(unittest.TestCase):
+    windows = (10, 20, 50)
+
+    def test_updates_match_batch(self):
+        prices = sample_prices(size=400).values
+        batch = rolling_indicators(prices, self.windows)
+        state = RollingIndicators.from_history(prices[:100], self.windows)
+        for i in range(100, len(prices)):
+            values = state.update(prices[i])
+            for key in ('ma', 'std', 'bb_u', 'bb_l'):
+                np.testing.assert_allclose(values[key], batch[key][:, i], rtol=1e-6)
+
+    def test_serialization_round_trip(self):
+        prices = sample_prices(size=200).values
+        state = RollingIndicators.from_history(prices[:150], self.windows)
+        restored = RollingIndicators.from_dict(json.loads(json.dumps(state.to_dict())))
+        for price in prices[150:]:
+            expected = state.update(price)
+            np.testing.assert_allclose(restored.update(price)['bb_u'], expected['bb_u'], rtol=1e-9)
+
+    def test_warm_up_and_missing_values(self):
+        state = RollingIndicators(windows=(3,))
+        self.assertTrue(np.isnan(state.update(1.)['ma'][0]))
+        state.update(2.)
+        self.assertAlmostEqual(state.update(3.)['ma'][0], 2.)
+        state.update(None)
+        self.assertTrue(np.isnan(state.update(5.)['ma'][0]))
+        for price in (6., 7.):
+            values = state.update(price)
+        self.assertAlmostEqual(values['ma'][0], 6.)
+        self.assertAlmostEqual(values['std'][0], 1.)
+
+
 if __name__ == '__main__':
     unittest.main()
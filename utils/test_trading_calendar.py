@@ -0,0 +1,65 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from utils.data_prepare import non_market_days_removal
+from utils.trading_calendar import TradingCalendar, get_trading_calendar
+
+
+class TradingCalendarTestCase(unittest.TestCase):
+    def setUp(self):
+        self.calendar = get_trading_calendar('NYSE')
+
+    def test_cached_per_exchange(self):
+        self.assertIs(get_trading_calendar('NYSE'), self.calendar)
+        self.assertIsInstance(self.calendar, TradingCalendar)
+
+    def test_is_session(self):
+        # 2021-01-01 New Year's Day, 2021-01-02 Saturday
+        self.assertFalse(self.calendar.is_session('2021-01-01'))
+        self.assertFalse(self.calendar.is_session(pd.Timestamp('2021-01-02')))
+        self.assertTrue(self.calendar.is_session('2021-01-04'))
+        np.testing.assert_array_equal(self.calendar.is_session(['2021-01-01', '2021-01-04', '2021-01-05 16:00']),
+                                      [False, True, True])
+
+    def test_offset(self):
+        self.assertEqual(self.calendar.offset('2020-12-31', 1), pd.Timestamp('2021-01-04'))
+        self.assertEqual(self.calendar.offset('2021-01-01', 1), pd.Timestamp('2021-01-04'))
+        self.assertEqual(self.calendar.offset('2021-01-01', 0), pd.Timestamp('2021-01-04'))
+        self.assertEqual(self.calendar.offset('2021-01-01', -1), pd.Timestamp('2020-12-31'))
+        self.assertEqual(self.calendar.offset('2021-01-04', -1), pd.Timestamp('2020-12-31'))
+        offsets = self.calendar.offset(pd.to_datetime(['2021-01-15', '2021-01-15']), [1, 2])
+        # 2021-01-18 Martin Luther King Jr. Day
+        self.assertListEqual(list(offsets), [pd.Timestamp('2021-01-19'), pd.Timestamp('2021-01-20')])
+
+    def test_offset_matches_custom_business_day(self):
+        dates = pd.date_range('2020-11-20', '2021-01-10', freq='D')
+        holidays = self.calendar.sessions_between('2020-01-01', '2021-12-31')
+        offset = pd.offsets.CustomBusinessDay(holidays=pd.bdate_range('2020-01-01', '2021-12-31')
+                                              .difference(holidays))
+        for n in (1, 3, -2):
+            self.assertListEqual(list(self.calendar.offset(dates, n)), [d + n * offset for d in dates])
+
+    def test_next_sessions(self):
+        index = self.calendar.next_sessions('2021-11-24', 3)
+        # 2021-11-25 Thanksgiving Day
+        self.assertListEqual(list(index), list(pd.to_datetime(['2021-11-24', '2021-11-26', '2021-11-29'])))
+        following = self.calendar.next_sessions(['2021-11-24', '2021-11-27'], 2, include_start=False)
+        self.assertEqual(following.shape, (2, 2))
+        np.testing.assert_array_equal(following[1], pd.to_datetime(['2021-11-29', '2021-11-30']).values)
+
+    def test_out_of_range(self):
+        calendar = TradingCalendar('NYSE', start='2021-01-01', end='2021-01-31')
+        with self.assertRaises(ValueError):
+            calendar.next_sessions('2021-01-25', 10)
+
+    def test_non_market_days_removal(self):
+        ts = pd.Series(np.arange(10.), index=pd.date_range('2020-12-28', periods=10, freq='D'))
+        result = non_market_days_removal(ts)
+        self.assertListEqual(list(result.index.day), [28, 29, 30, 31, 4, 5, 6])
+        self.assertListEqual(list(result), [0., 1., 2., 3., 7., 8., 9.])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,19 @@
+# This file contains the synthetic data shared by the test modules: daily bars of a random walk,
+# so that tests do not depend on downloaded stock data.
+
+import numpy as np
+import pandas as pd
+
+
+def random_walk_bars(size, seed=0, start='2021-01-04'):
+    """
+    :param size: number of bars
+    :param seed: random generator seed
+    :param start: date of the first bar, bars following each other by business day
+    :return: a dataframe indexed by date, with "Adj Close" (a random walk starting around 50)
+    and "Volume" columns
+    """
+    rng = np.random.default_rng(seed)
+    prices = 50 + np.cumsum(rng.normal(0, 1, size))
+    return pd.DataFrame({'Adj Close': prices, 'Volume': rng.integers(1000, 2000, size)},
+                        index=pd.date_range(start, periods=size, freq='B', name='Date'))
@@ -0,0 +1,127 @@
+r"""
+Trading calendars with market-day date arithmetic.
+The sessions of an exchange are computed once by pandas_market_calendars and kept in a sorted datetime64 array,
+so that "next N trading days" and "trading-day offset" lookups are vectorized binary searches that never
+rebuild the exchange schedule.
+"""
+import datetime
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+import pandas_market_calendars as mcal
+
+DEFAULT_CALENDAR = 'NYSE'
+# Sessions are precomputed from CALENDAR_START to CALENDAR_YEARS_AHEAD years after the current one
+CALENDAR_START = '1980-01-01'
+CALENDAR_YEARS_AHEAD = 10
+
+
+class TradingCalendar(object):
+    """
+    Sessions of an exchange, as timezone naive midnight timestamps, between two dates
+    """
+
+    def __init__(self, name=DEFAULT_CALENDAR, start=CALENDAR_START, end=None):
+        """
+        :param name: a calendar name from the list at
+        https://pandas-market-calendars.readthedocs.io/en/latest/calendars.html
+        :param start: first date of the precomputed sessions
+        :param end: last date of the precomputed sessions, CALENDAR_YEARS_AHEAD years from now if None
+        """
+        if end is None:
+            end = datetime.date(datetime.date.today().year + CALENDAR_YEARS_AHEAD, 12, 31)
+        self.name = name
+        sessions = mcal.get_calendar(name).valid_days(start_date=start, end_date=end)
+        self.sessions = pd.DatetimeIndex(sessions.tz_localize(None).normalize(), name='Date')
+        self._days = self.sessions.values.astype('datetime64[D]')
+
+    def __len__(self):
+        return len(self._days)
+
+    def is_session(self, dates):
+        """
+        :param dates: a date or an array-like of dates
+        :return: whether dates are sessions, as a boolean or a boolean array
+        """
+        days = _to_days(dates)
+        positions = np.searchsorted(self._days, days, side='left')
+        found = self._days[np.minimum(positions, len(self._days) - 1)] == days
+        return found if np.ndim(dates) else bool(found)
+
+    def offset(self, dates, n=1):
+        """
+        Moves dates by a number of sessions, as pandas CustomBusinessDay does: dates which are not sessions
+        are rolled forward for positive offsets and backward for negative ones, the rolled session counting as one.
+        An offset of 0 rolls dates forward to the nearest session.
+        :param dates: a date or an array-like of dates
+        :param n: number of sessions, a single one or one per date
+        :return: a pandas.Timestamp, or a DatetimeIndex if dates is an array-like
+        """
+        days = _to_days(dates)
+        n = np.asarray(n)
+        left = np.searchsorted(self._days, days, side='left')
+        is_session = np.searchsorted(self._days, days, side='right') > left
+        positions = left + n - ((~is_session) & (n > 0))
+        return self._at(positions, np.ndim(dates))
+
+    def next_sessions(self, dates, periods, include_start=True):
+        """
+        Lists the sessions following each date
+        :param dates: a date or an array-like of dates
+        :param periods: number of sessions per date
+        :param include_start: if True, a date which is a session is the first of its own sessions
+        :return: a DatetimeIndex of periods sessions if dates is a single date,
+        otherwise an array of datetime64 shaped (dates, periods)
+        """
+        days = _to_days(dates)
+        first = np.searchsorted(self._days, days, side='left' if include_start else 'right')
+        positions = np.asarray(first)[..., None] + np.arange(periods)
+        if np.ndim(dates):
+            return self._positions(positions)
+        return pd.DatetimeIndex(self._positions(positions), name='Date')
+
+    def sessions_between(self, start, end):
+        """
+        :param start: first date
+        :param end: last date, included
+        :return: a DatetimeIndex of the sessions between start and end
+        """
+        first, last = np.searchsorted(self._days, _to_days([start, end]), side='left')
+        last += self.is_session(end)
+        return self.sessions[first:last]
+
+    def _positions(self, positions):
+        if np.any(positions < 0) or np.any(positions >= len(self._days)):
+            raise ValueError("dates out of %s calendar range %s - %s" % (self.name, self.sessions[0].date(),
+                                                                        self.sessions[-1].date()))
+        return self.sessions.values[positions]
+
+    def _at(self, positions, ndim):
+        values = self._positions(positions)
+        return pd.DatetimeIndex(values, name='Date') if ndim else pd.Timestamp(values)
+
+
+@lru_cache(maxsize=None)
+def get_trading_calendar(name=DEFAULT_CALENDAR):
+    """
+    Returns the TradingCalendar of an exchange, built the first time it is requested
+    :param name: a calendar name, as accepted by pandas_market_calendars
+    :return: a shared TradingCalendar
+    """
+    return TradingCalendar(name)
+
+
+def _to_days(dates):
+    """
+    Converts a date or an array-like of dates, timezone aware or not, to datetime64 days
+    """
+    if np.ndim(dates):
+        index = pd.DatetimeIndex(dates)
+        if index.tz is not None:
+            index = index.tz_localize(None)
+        return index.values.astype('datetime64[D]')
+    timestamp = pd.Timestamp(dates)
+    if timestamp.tz is not None:
+        timestamp = timestamp.tz_localize(None)
+    return np.datetime64(timestamp.to_datetime64(), 'D')
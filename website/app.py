@@ -1,13 +1,25 @@
 from datetime import date
 import datetime
-from flask import Flask, request, render_template
+from flask import Flask, request, render_template, jsonify
 from numpy.lib.function_base import quantile
 from source_deepar.display_quantiles import display_quantiles_flask
+from source_deepar import metrics
+from source_deepar.caching import SingleFlight
+from website.data_store import StockDataStore
 import json
-import boto3
 
 app = Flask(__name__)
 
+# S3 bucket containing stock json data
+DATA_BUCKET_NAME = "stock-prediction-data-4327a669-7f13-48c7-aa4a-49a80b9e1e32"
+# datasets displayed by the web page, loaded as soon as the application starts
+PRELOAD_DATASETS = ('test', 'benchmark_test')
+
+# parsed stock data shared by all the requests
+data_store = StockDataStore(DATA_BUCKET_NAME)
+# coalesces concurrent /predict requests for the same chart
+render_flights = SingleFlight()
+
 
 @app.route("/")
 def home():
@@ -17,35 +29,51 @@ def home():
 
 
 @app.route('/predict', methods=['POST'])
+@metrics.timed('flask.predict')
 def predict():
     # retrieving data to be used as ground truth
     ticker_name = request.form['ticker_name']
     # dataset target of the prediction
-
     tgt_dataset = request.form['dataset']
-    pred_used_dataset = 'train'
-
-    gt_dict = get_stock_data_from_s3_bucket(ticker_name, tgt_dataset)
+    # retrieving predicted data to be plot togheter with above data
+    js_pred_data = request.form['predicted_data']
+    output = request.form.get('format', 'png')
+
+    # concurrent identical requests share a single data retrieval and chart rendering
+    qp = render_flights.do((ticker_name.upper(), tgt_dataset, js_pred_data, output),
+                           render_prediction, ticker_name, tgt_dataset, js_pred_data, output)
+    return jsonify(qp) if isinstance(qp, dict) else qp
+
+
+def render_prediction(ticker_name, tgt_dataset, js_pred_data, output):
+    """
+    Renders the chart of a prediction against ground truth and benchmark data
+    :param ticker_name: ticker name
+    :param tgt_dataset: dataset the ground truth comes from
+    :param js_pred_data: json encoded endpoint response
+    :param output: chart format, one among display_quantiles.CHART_FORMATS
+    :return: the chart, as display_quantiles_flask returns it
+    """
+    # ground truth and benchmark data come from the data store, being fetched together if missing
+    with metrics.span('flask.load_data'):
+        gt_dict, bk_dict = data_store.get_many([(ticker_name, tgt_dataset), (ticker_name, 'benchmark_test')])
     # retrieving target ts data
     target_ts = gt_dict['target']
     # retrieving benchmark data
-    bk_dict = get_stock_data_from_s3_bucket(ticker_name, 'benchmark_test')
     benchmark_ts = bk_dict['target']
     # retrieving ts start date
     start_date = bk_dict['start']
 
-    # retrieving predicted data to be plot togheter with above data
-    js_pred_data = request.form['predicted_data']
     pred_dict = json.loads(js_pred_data)['predictions']
     quantiles_dict = pred_dict[0]['quantiles']
 
-    # displaying quantiles graph
-    qp = display_quantiles_flask(quantiles_dict, target_ts=target_ts, bench_mark_prediction=benchmark_ts,
-                                 bench_mark_prediction_name='SMA', start=start_date)
-    return qp
+    # displaying quantiles graph, as png or svg image, or as json data to be plotted by the browser
+    return display_quantiles_flask(quantiles_dict, target_ts=target_ts, bench_mark_prediction=benchmark_ts,
+                                   bench_mark_prediction_name='SMA', start=start_date, output=output)
 
 
 @app.route('/predict_future', methods=['POST'])
+@metrics.timed('flask.predict_future')
 def predict_future():
     # retrieving start date
     start_date = request.form['start_date']
@@ -55,20 +83,24 @@ def predict_future():
     pred_dict = json.loads(js_pred_data)['predictions']
     quantiles_dict = pred_dict[0]['quantiles']
 
-    # displaying quantiles graph
-    qp = display_quantiles_flask(quantiles_dict, start=start_date + " {}:{}:{}".format("00", "00", "00"))
-    return qp
+    # displaying quantiles graph, as png or svg image, or as json data to be plotted by the browser
+    qp = display_quantiles_flask(quantiles_dict, start=start_date + " {}:{}:{}".format("00", "00", "00"),
+                                 output=request.form.get('format', 'png'))
+    return jsonify(qp) if isinstance(qp, dict) else qp
+
+
+@app.route('/metrics')
+def metrics_snapshot():
+    # counters and latency percentiles of every instrumented stage
+    return jsonify(metrics.registry.snapshot())
 
 
 def get_stock_data_from_s3_bucket(ticker_name, dataset):
-    # S3 resource invocation
-    s3_resource = boto3.resource('s3')
-    # S3 bucket selection
-    data_bucket_name = "stock-prediction-data-4327a669-7f13-48c7-aa4a-49a80b9e1e32"
-    from source_deepar.lambda_stock_prediction import get_stock_data
-    return get_stock_data(ticker_name=ticker_name,
-                          s3_resource=s3_resource, s3_bucket=data_bucket_name, prefix=dataset)
+    return data_store.get(ticker_name, dataset)
 
 
 if __name__ == '__main__':
+    # preloading and periodically refreshing data in background; when the application is served
+    # by other means, data are loaded the first time they are requested
+    data_store.start(PRELOAD_DATASETS)
     app.run(debug=True)
@@ -0,0 +1,153 @@
+r"""
+In-process store of the stock data displayed by the web application.
+Parsed ticker series are kept in memory per dataset, so that rendering a prediction involves no S3 round trip:
+series are preloaded when the application starts or fetched the first time they are needed, missing series
+being fetched concurrently, and a background thread refreshes them from S3.
+Refreshes check the ETag of every stored series S3 object and download only the changed ones; they go to S3
+directly, rather than through the Lambda module data cache, whose entries are not revalidated for DATA_CACHE_TTL.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import os
+import threading
+import traceback
+
+import boto3
+
+from source_deepar import encoding
+from source_deepar.caching import SingleFlight
+from source_deepar.lambda_stock_prediction import TICKER_REGISTRY
+
+
+class StockDataStore(object):
+    """
+    A thread safe store of parsed ticker series, keyed by (ticker, dataset)
+    """
+
+    def __init__(self, s3_bucket, tickers=None, s3_resource_factory=None, refresh_interval=300, max_workers=8):
+        """
+        :param s3_bucket: S3 bucket containing stock json data, one folder per dataset
+        :param tickers: tickers to be preloaded, all the TICKER_REGISTRY ones if None
+        :param s3_resource_factory: callable returning a new S3 resource, boto3.resource('s3') if None
+        :param refresh_interval: seconds between two background refreshes
+        :param max_workers: maximum number of concurrent S3 fetches
+        """
+        self.s3_bucket = s3_bucket
+        self.tickers = list(tickers or TICKER_REGISTRY)
+        self.refresh_interval = refresh_interval
+        self.fetches = 0
+        self.revalidations = 0
+        self._s3_resource_factory = s3_resource_factory or (lambda: boto3.resource('s3'))
+        self._local = threading.local()
+        self._data = {}
+        self._etags = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        # concurrent requests for the same missing series share a single fetch
+        self.flights = SingleFlight()
+        self._stop = threading.Event()
+        self._refresher = None
+
+    def get(self, ticker_name, dataset):
+        """
+        :param ticker_name: ticker name, one among the TICKER_REGISTRY ones
+        :param dataset: dataset name, i.e. the S3 folder the ticker json file is in
+        :return: the ticker series dictionary, with "start" and "target" keys, None if unknown.
+        Returned dictionaries are shared by all the callers and must not be modified.
+        """
+        return self.get_many([(ticker_name, dataset)])[0]
+
+    def get_many(self, keys):
+        """
+        Retrieves several series, fetching the ones not in the store concurrently
+        :param keys: list of (ticker name, dataset) pairs
+        :return: the list of series dictionaries, in keys order
+        """
+        keys = [(ticker_name.upper(), dataset) for ticker_name, dataset in keys]
+        with self._lock:
+            found = {key: self._data.get(key) for key in keys}
+        missing = [key for key, data in found.items() if data is None]
+        if missing:
+            found.update(zip(missing, self.flights.do_many(missing, self._fetch_many)))
+        return [found[key] for key in keys]
+
+    def preload(self, datasets):
+        """
+        Loads the series of all the store tickers for the given datasets, concurrently
+        :param datasets: list of dataset names
+        """
+        self.get_many([(ticker_name, dataset) for dataset in datasets for ticker_name in self.tickers])
+
+    def refresh(self):
+        """
+        Reloads all the series in the store, concurrently.
+        Unchanged S3 objects are not downloaded again, as their ETag is checked first.
+        """
+        with self._lock:
+            keys = list(self._data)
+        list(self._executor.map(self._revalidate, keys))
+
+    def start(self, datasets=()):
+        """
+        Preloads datasets and refreshes the store every refresh_interval seconds, in a background thread
+        :param datasets: list of dataset names to be preloaded
+        """
+        if self._refresher is None:
+            self._refresher = threading.Thread(target=self._run, args=(list(datasets),), daemon=True)
+            self._refresher.start()
+
+    def stop(self):
+        """
+        Stops background refreshes
+        """
+        self._stop.set()
+        if self._refresher is not None:
+            self._refresher.join()
+            self._refresher = None
+
+    def __contains__(self, key):
+        ticker_name, dataset = key
+        with self._lock:
+            return (ticker_name.upper(), dataset) in self._data
+
+    def _run(self, datasets):
+        tasks = [lambda: self.preload(datasets)]
+        while not self._stop.is_set():
+            for task in tasks:
+                try:
+                    task()
+                except Exception:
+                    # a failed refresh keeps serving the series already in the store
+                    traceback.print_exc()
+            tasks = [self.refresh]
+            self._stop.wait(self.refresh_interval)
+
+    def _s3_resource(self):
+        # boto3 resources are not thread safe, so each worker thread gets its own one
+        if not hasattr(self._local, 's3_resource'):
+            self._local.s3_resource = self._s3_resource_factory()
+        return self._local.s3_resource
+
+    def _fetch_many(self, keys):
+        return list(self._executor.map(self._fetch, keys))
+
+    def _fetch(self, key):
+        ticker_name, dataset = key
+        file_name = TICKER_REGISTRY.get(ticker_name)
+        if file_name is None:
+            return None
+        response = self._s3_resource().Object(self.s3_bucket, os.path.join(dataset, file_name)).get()
+        data = encoding.loads(response['Body'].read())
+        with self._lock:
+            self._data[key] = data
+            self._etags[key] = response.get('ETag')
+            self.fetches += 1
+        return data
+
+    def _revalidate(self, key):
+        ticker_name, dataset = key
+        with self._lock:
+            etag = self._etags.get(key)
+            self.revalidations += 1
+        s3_object = self._s3_resource().Object(self.s3_bucket, os.path.join(dataset, TICKER_REGISTRY[ticker_name]))
+        if etag is None or s3_object.e_tag != etag:
+            self._fetch(key)
@@ -0,0 +1,70 @@
+/**
+ * Draws a prediction chart from the json data returned by the Flask App
+ * (quantiles, real values and benchmark), so that no image has to be rendered server side.
+ * @param {HTMLElement} container element the chart is drawn into, replacing its content
+ * @param {Object} data chart data with "dates", "quantiles", "target", "benchmark" and "benchmark_name" keys
+ */
+function drawQuantilesChart(container, data) {
+    var width = 640, height = 480, margin = 50;
+    var canvas = document.createElement('canvas');
+    canvas.width = width;
+    canvas.height = height;
+    container.innerHTML = '';
+    container.appendChild(canvas);
+    var ctx = canvas.getContext('2d');
+
+    var p10 = data.quantiles['0.1'], p50 = data.quantiles['0.5'], p90 = data.quantiles['0.9'];
+    var series = [p10, p50, p90];
+    if (data.target !== null) { series.push(data.target); }
+    if (data.benchmark !== null) { series.push(data.benchmark); }
+    var values = [].concat.apply([], series);
+    var minValue = Math.min.apply(null, values), maxValue = Math.max.apply(null, values);
+    if (minValue === maxValue) { minValue -= 1; maxValue += 1; }
+    var points = Math.max.apply(null, series.map(function (s) { return s.length; }));
+
+    function x(i) { return margin + i * (width - 2 * margin) / Math.max(points - 1, 1); }
+    function y(v) { return height - margin - (v - minValue) * (height - 2 * margin) / (maxValue - minValue); }
+    function line(values, color, label) {
+        ctx.beginPath();
+        values.forEach(function (v, i) { if (i === 0) { ctx.moveTo(x(i), y(v)); } else { ctx.lineTo(x(i), y(v)); } });
+        ctx.strokeStyle = color;
+        ctx.lineWidth = 1.5;
+        ctx.stroke();
+        legend.push([color, label]);
+    }
+    var legend = [];
+
+    // axes, with value labels and day/month labels
+    ctx.font = '11px sans-serif';
+    ctx.fillStyle = '#333';
+    ctx.strokeStyle = '#999';
+    ctx.strokeRect(margin, margin, width - 2 * margin, height - 2 * margin);
+    for (var k = 0; k <= 5; k++) {
+        var v = minValue + k * (maxValue - minValue) / 5;
+        ctx.fillText(v.toFixed(1), 5, y(v) + 4);
+    }
+    var step = Math.max(1, Math.floor(data.dates.length / 10));
+    for (var i = 0; i < data.dates.length; i += step) {
+        ctx.fillText(data.dates[i], x(i) - 10, height - margin + 15);
+    }
+
+    // 80% confidence interval
+    ctx.beginPath();
+    p90.forEach(function (v, i) { if (i === 0) { ctx.moveTo(x(i), y(v)); } else { ctx.lineTo(x(i), y(v)); } });
+    for (var j = p10.length - 1; j >= 0; j--) { ctx.lineTo(x(j), y(p10[j])); }
+    ctx.closePath();
+    ctx.fillStyle = 'rgba(191, 191, 0, 0.5)';
+    ctx.fill();
+    legend.push(['rgba(191, 191, 0, 0.5)', '80% confidence interval']);
+
+    if (data.target !== null) { line(data.target, '#1f77b4', 'real Adjusted Close'); }
+    line(p50, '#ff7f0e', 'prediction median');
+    if (data.benchmark !== null) { line(data.benchmark, 'red', data.benchmark_name); }
+
+    legend.forEach(function (entry, n) {
+        ctx.fillStyle = entry[0];
+        ctx.fillRect(width - margin - 160, margin + 10 + n * 16, 12, 10);
+        ctx.fillStyle = '#333';
+        ctx.fillText(entry[1], width - margin - 142, margin + 19 + n * 16);
+    });
+}
@@ -1,3 +1,7 @@
+// format of the charts returned by the Flask App: 'json' data are plotted by the browser (see quantilesChart.js),
+// 'png' and 'svg' images are rendered server side
+var chartFormat = 'json';
+
 function submitForm(oFormElement) {
     var xhr = new XMLHttpRequest();
     var start_date = document.getElementById('start_date_picker');
@@ -21,17 +25,26 @@ function submitForm(oFormElement) {
         if (start_date.value !== "")
         {
             // ask Flask to show complete comparison Prediction quantiles (from endpoint) 
-            flaskPostRequest = $.post("/predict_future", { start_date: start_date_picker.value, predicted_data: result });
+            flaskPostRequest = $.post("/predict_future", { start_date: start_date_picker.value, predicted_data: result,
+                                                           format: chartFormat });
         }
         else
         {
             // ask Flask to show complete comparison Ground Truth (test data) + Prediction quantiles (from endpoint) + benchmark (SMA constant value) 
-            flaskPostRequest = $.post("/predict", { ticker_name: stock.value, predicted_data: result, dataset: 'test' });
+            flaskPostRequest = $.post("/predict", { ticker_name: stock.value, predicted_data: result, dataset: 'test',
+                                                    format: chartFormat });
         }
         // var flaskPostRequest = $.post("/predict", { ticker_name: stock.value, predicted_data: result, dataset: 'valid' });
         
-        // writing response data into HTML 
-        resultElement.innerHTML = flaskPostRequest.responseText;
+        // writing response data into HTML, plotting it first if the Flask App returned chart data
+        if (chartFormat === 'json')
+        {
+            drawQuantilesChart(resultElement, flaskPostRequest.responseJSON);
+        }
+        else
+        {
+            resultElement.innerHTML = flaskPostRequest.responseText;
+        }
     };
 
     xhr.open(oFormElement.method, oFormElement.action, true);
@@ -0,0 +1,97 @@
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from source_deepar import lambda_stock_prediction as lsp
+from source_deepar.test_lambda_stock_prediction import FakeS3Resource, stock_json
+from website.data_store import StockDataStore
+
+
+class SlowS3Resource(FakeS3Resource):
+    """
+    Fake S3 resource whose downloads take some time, tracking how many of them overlap
+    """
+
+    def __init__(self, delay=0.05):
+        super().__init__()
+        self.delay = delay
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+    def Object(self, bucket_name, key):
+        obj = super().Object(bucket_name, key)
+        get = obj.get
+
+        def slow_get():
+            with self.lock:
+                self.in_flight += 1
+                self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            time.sleep(self.delay)
+            with self.lock:
+                self.in_flight -= 1
+            return get()
+        obj.get = slow_get
+        return obj
+
+
+class StockDataStoreTestCase(unittest.TestCase):
+    def setUp(self):
+        lsp._stock_data_cache.clear()
+        self.s3 = SlowS3Resource()
+        for i, file_name in enumerate(sorted(lsp.TICKER_REGISTRY.values())):
+            for dataset in ('test', 'benchmark_test'):
+                self.s3.put('bucket', dataset + '/' + file_name, stock_json(first=100.0 * (i + 1)))
+        self.store = StockDataStore('bucket', s3_resource_factory=lambda: self.s3, refresh_interval=0.01)
+        self.addCleanup(self.store.stop)
+
+    def test_preload_is_concurrent(self):
+        self.store.preload(['test', 'benchmark_test'])
+        self.assertEqual(self.store.fetches, 8)
+        self.assertGreater(self.s3.max_in_flight, 1)
+        calls = len(self.s3.calls)
+        data = self.store.get_many([('ibm', 'test'), ('IBM', 'benchmark_test')])
+        self.assertListEqual([d['target'][0] for d in data], [400.0, 400.0])
+        self.assertEqual(len(self.s3.calls), calls)
+
+    def test_lazy_loading(self):
+        self.assertNotIn(('AAPL', 'test'), self.store)
+        self.assertEqual(self.store.get('aapl', 'test')['target'][0], 100.0)
+        self.assertIn(('AAPL', 'test'), self.store)
+        self.assertIsNone(self.store.get('MSFT', 'test'))
+        self.assertNotIn(('MSFT', 'test'), self.store)
+
+    def test_concurrent_requests_share_fetches(self):
+        with ThreadPoolExecutor(max_workers=6) as executor:
+            results = list(executor.map(lambda _: self.store.get_many([('IBM', 'test'), ('AAPL', 'test')]),
+                                        range(6)))
+        self.assertTrue(all(result == results[0] for result in results))
+        self.assertEqual(self.s3.calls.count(('get', 'test/IBM.json')), 1)
+        self.assertEqual(self.store.fetches, 2)
+
+    def test_refresh_downloads_changed_series_only(self):
+        self.store.preload(['test'])
+        self.s3.put('bucket', 'test/AAPL.json', stock_json(first=700.0))
+        calls = len(self.s3.calls)
+        self.store.refresh()
+        self.assertEqual(self.store.revalidations, 4)
+        self.assertListEqual([call for call in self.s3.calls[calls:] if call[0] == 'get'], [('get', 'test/AAPL.json')])
+        self.assertEqual(self.store.get('AAPL', 'test')['target'][0], 700.0)
+        self.assertEqual(self.store.fetches, 5)
+
+    def test_background_refresh(self):
+        self.store.start(['test'])
+        deadline = time.monotonic() + 5
+        while self.store.fetches < 4 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        # the Lambda module data cache is still fresh, refreshes go to S3 anyway
+        lsp.get_stock_data('IBM', s3_resource=self.s3, s3_bucket='bucket', prefix='test')
+        self.s3.put('bucket', 'test/IBM.json', stock_json(first=500.0))
+        while self.store.get('IBM', 'test')['target'][0] != 500.0 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(self.store.get('IBM', 'test')['target'][0], 500.0)
+
+
+if __name__ == '__main__':
+    unittest.main()